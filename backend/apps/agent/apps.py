@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AgentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.agent'
+
+    def ready(self):
+        import apps.agent.signals
@@ -7,15 +7,15 @@ Handle Agent-related WebSocket connections and real-time communication
 
 import json
 import logging
-import asyncio
-from typing import Optional, Dict, Any
+from typing import Dict, Any
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from django.utils import timezone
 
-from .core.executor import ScholarAgent
-from .models import Conversation, Message, AgentTask
+from .core.runs import AgentRunManager, RunEventLog, conversation_group
+from .models import Conversation
 
 logger = logging.getLogger(__name__)
 
@@ -33,13 +33,17 @@ class AgentConsumer(AsyncWebsocketConsumer):
         self.user = None
         self.conversation_id = None
         self.document_id = None
-        self.agent = None
-        self.current_task = None
-        self.is_processing = False
+        self.group_name = None
+        # 每个运行已发送的最大序号，用于重放与广播去重 / Highest seq sent per run, dedupes replay and broadcast
+        self.sent_seqs: Dict[str, int] = {}
 
     async def connect(self):
         """
         处理WebSocket连接 / Handle WebSocket connection
+
+        加入对话分组后重放活动运行的事件；URL参数run_id与last_seq用于断线续传。
+        Joins the conversation group, then replays the active run; the run_id and last_seq
+        query parameters resume after a reconnect.
         """
         try:
             # 获取认证用户 / Get authenticated user
@@ -65,15 +69,30 @@ class AgentConsumer(AsyncWebsocketConsumer):
                 await self.close(code=4003)  # 禁止访问 / Forbidden
                 return
 
+            # 先加入分组再重放，避免漏掉中间的事件 / Join the group before replaying so no event is missed
+            self.group_name = conversation_group(self.conversation_id)
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+
             # 接受连接 / Accept connection
             await self.accept()
+            active_run = await AgentRunManager.get_active_run(self.conversation_id)
             await self.send_json({
                 "type": "connected",
                 "message": "WebSocket连接已建立",
                 "conversation_id": self.conversation_id,
-                "user_id": str(self.user.id)
+                "user_id": str(self.user.id),
+                "active_run": active_run
             })
 
+            # 断线续传 / Resume after reconnect
+            params = parse_qs(self.scope.get('query_string', b'').decode())
+            run_id = params.get('run_id', [None])[0]
+            last_seq = params.get('last_seq', ['0'])[0]
+            if run_id:
+                await self.replay_run(run_id, last_seq)
+            elif active_run:
+                await self.replay_run(active_run['run_id'], 0)
+
             logger.info(f"WebSocket connected: user={self.user.username}, conversation={self.conversation_id}")
 
         except Exception as e:
@@ -84,14 +103,15 @@ class AgentConsumer(AsyncWebsocketConsumer):
         """
         处理WebSocket断开连接 / Handle WebSocket disconnection
 
+        只退订分组，运行继续在服务端执行，客户端重连后可续传。
+        Only leaves the group; the run keeps executing server-side and can be resumed.
+
         Args:
             close_code: 关闭代码 / Close code
         """
         try:
-            # 取消当前正在执行的任务 / Cancel currently executing task
-            if self.current_task and not self.current_task.done():
-                self.current_task.cancel()
-                logger.info(f"Cancelled task for user {self.user.username}")
+            if self.group_name:
+                await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
             logger.info(f"WebSocket disconnected: user={self.user.username if self.user else 'unknown'}, code={close_code}")
 
@@ -117,6 +137,8 @@ class AgentConsumer(AsyncWebsocketConsumer):
                 await self.handle_query(data)
             elif message_type == "cancel":
                 await self.handle_cancel()
+            elif message_type == "resume":
+                await self.handle_resume(data)
             elif message_type == "set_document":
                 await self.handle_set_document(data)
             elif message_type == "ping":
@@ -146,19 +168,13 @@ class AgentConsumer(AsyncWebsocketConsumer):
         """
         处理查询请求 / Handle query request
 
+        在服务端启动运行后立即返回，事件通过对话分组推送。
+        Starts a server-side run and returns; events arrive through the conversation group.
+
         Args:
             data: 查询数据 / Query data
         """
         try:
-            # 检查是否正在处理其他查询 / Check if processing other queries
-            if self.is_processing:
-                await self.send_json({
-                    "type": "error",
-                    "message": "正在处理其他查询，请稍后再试",
-                    "code": "already_processing"
-                })
-                return
-
             content = data.get('content', '').strip()
             if not content:
                 await self.send_json({
@@ -170,52 +186,29 @@ class AgentConsumer(AsyncWebsocketConsumer):
 
             context = data.get('context', {})
 
-            # 设置处理标志 / Set processing flag
-            self.is_processing = True
-
-            # 创建Agent实例 / Create Agent instance
-            self.agent = ScholarAgent(
+            run = await AgentRunManager.start(
                 user_id=str(self.user.id),
                 conversation_id=self.conversation_id,
+                content=content,
+                context=context,
                 document_id=self.document_id
             )
 
-            # 保存用户消息到数据库 / Save user message to database
-            message = await self.save_message(content, context, "user")
-
-            # 创建任务记录 / Create task record
-            task = await self.create_task(message)
-
-            # 执行Agent查询 / Execute Agent query
-            try:
-                # 创建异步任务 / Create async task
-                self.current_task = asyncio.create_task(
-                    self.execute_agent_query(content, context, task)
-                )
-
-                # 等待任务完成 / Wait for task completion
-                await self.current_task
-
-            except asyncio.CancelledError:
-                logger.info(f"Query cancelled for user {self.user.username}")
-                await self.send_json({
-                    "type": "cancelled",
-                    "message": "查询已取消"
-                })
-                # 更新任务状态 / Update task status
-                if task:
-                    await self.update_task_status(task, 'cancelled')
-
-            except Exception as e:
-                logger.error(f"Agent query execution error: {e}")
+            # 检查是否正在处理其他查询 / Check if processing other queries
+            if run is None:
+                active_run = await AgentRunManager.get_active_run(self.conversation_id)
                 await self.send_json({
                     "type": "error",
-                    "message": "Agent执行出错",
-                    "code": "execution_error"
+                    "message": "正在处理其他查询，请稍后再试",
+                    "code": "already_processing",
+                    "active_run": active_run
                 })
-                # 更新任务状态 / Update task status
-                if task:
-                    await self.update_task_status(task, 'failed', str(e))
+                return
+
+            await self.send_json({
+                "type": "run_started",
+                "run_id": run.run_id
+            })
 
         except Exception as e:
             logger.error(f"Query handling error: {e}")
@@ -224,46 +217,16 @@ class AgentConsumer(AsyncWebsocketConsumer):
                 "message": "查询处理出错",
                 "code": "query_error"
             })
-        finally:
-            self.is_processing = False
-            self.current_task = None
-
-    async def execute_agent_query(self, content: str, context: Dict[str, Any], task):
-        """
-        执行Agent查询 / Execute Agent query
-
-        Args:
-            content: 查询内容 / Query content
-            context: 查询上下文 / Query context
-            task: 任务对象 / Task object
-        """
-        try:
-            # 执行Agent / Execute Agent
-            async for event in self.agent.run(content, context):
-                # 发送事件到客户端 / Send event to client
-                await self.send_json(event)
-
-                # 如果是最终答案，保存到数据库 / If final answer, save to database
-                if event.get('type') == 'answer':
-                    await self.save_message(event['data']['content'], {}, "assistant")
-                    break
-
-        except Exception as e:
-            logger.error(f"Agent execution error: {e}")
-            raise
 
     async def handle_cancel(self):
         """
         处理取消请求 / Handle cancel request
         """
         try:
-            if self.current_task and not self.current_task.done():
-                self.current_task.cancel()
-                await self.send_json({
-                    "type": "cancelled",
-                    "message": "查询已取消"
-                })
-                logger.info(f"Query cancelled by user {self.user.username}")
+            run_id = await AgentRunManager.cancel(self.conversation_id)
+            if run_id:
+                # 取消事件由运行本身广播 / The run itself broadcasts the cancelled event
+                logger.info(f"Run {run_id} cancelled by user {self.user.username}")
             else:
                 await self.send_json({
                     "type": "info",
@@ -272,6 +235,70 @@ class AgentConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Cancel handling error: {e}")
 
+    async def handle_resume(self, data: Dict[str, Any]):
+        """
+        处理续传请求 / Handle resume request
+
+        Args:
+            data: 包含run_id和last_seq / Contains run_id and last_seq
+        """
+        run_id = data.get('run_id')
+        if not run_id:
+            active_run = await AgentRunManager.get_active_run(self.conversation_id)
+            if not active_run:
+                await self.send_json({
+                    "type": "info",
+                    "message": "没有正在执行的查询"
+                })
+                return
+            run_id = active_run['run_id']
+
+        await self.replay_run(run_id, data.get('last_seq', 0))
+
+    async def replay_run(self, run_id: str, last_seq):
+        """
+        重放运行中序号大于last_seq的事件 / Replay a run's events after last_seq
+
+        Args:
+            run_id: 运行ID / Run ID
+            last_seq: 客户端最后收到的序号 / Last sequence seen by the client
+        """
+        try:
+            last_seq = max(0, int(last_seq))
+        except (TypeError, ValueError):
+            last_seq = 0
+
+        # 只重放本对话、本用户的运行 / Only replay runs of this conversation and user
+        meta = await RunEventLog.aget_meta(run_id)
+        if meta and not RunEventLog.owned_by(meta, self.conversation_id, self.user.id):
+            logger.warning(f"User {self.user.id} denied replay of run {run_id}")
+            await self.send_json({
+                "type": "error",
+                "message": "无权访问该运行",
+                "code": "run_forbidden"
+            })
+            return
+
+        self.sent_seqs[run_id] = max(self.sent_seqs.get(run_id, 0), last_seq)
+        for event in await RunEventLog.replay(run_id, last_seq, self.conversation_id, self.user.id):
+            await self.send_event(event)
+
+    async def agent_event(self, message: Dict[str, Any]):
+        """
+        接收对话分组广播的运行事件 / Receive a run event broadcast to the conversation group
+        """
+        await self.send_event(message['event'])
+
+    async def send_event(self, event: Dict[str, Any]):
+        """
+        按序号去重后发送事件 / Send an event unless its sequence was already sent
+        """
+        run_id, seq = event.get('run_id'), event.get('seq', 0)
+        if seq <= self.sent_seqs.get(run_id, 0):
+            return
+        self.sent_seqs[run_id] = seq
+        await self.send_json(event)
+
     async def handle_set_document(self, data: Dict[str, Any]):
         """
         处理设置文档请求 / Handle set document request
@@ -371,77 +398,3 @@ class AgentConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Document access check error: {e}")
             return False
-
-    @database_sync_to_async
-    def save_message(self, content: str, context: Dict[str, Any], role: str) -> Message:
-        """
-        保存消息到数据库 / Save message to database
-
-        Args:
-            content: 消息内容 / Message content
-            context: 消息上下文 / Message context
-            role: 消息角色 / Message role
-
-        Returns:
-            Message: 保存的消息对象 / Saved message object
-        """
-        try:
-            message = Message.objects.create(
-                conversation_id=self.conversation_id,
-                role=role,
-                content=content,
-                context_data=context,
-                context_type=context.get('type', 'none') if context else 'none'
-            )
-
-            # 更新对话的消息计数 / Update conversation message count
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            conversation.message_count += 1
-            conversation.updated_at = timezone.now()
-            conversation.save()
-
-            return message
-
-        except Exception as e:
-            logger.error(f"Save message error: {e}")
-            raise
-
-    @database_sync_to_async
-    def create_task(self, message: Message) -> AgentTask:
-        """
-        创建任务记录 / Create task record
-
-        Args:
-            message: 关联的消息 / Associated message
-
-        Returns:
-            AgentTask: 创建的任务对象 / Created task object
-        """
-        try:
-            return AgentTask.objects.create(
-                conversation_id=self.conversation_id,
-                message=message,
-                status='executing'
-            )
-        except Exception as e:
-            logger.error(f"Create task error: {e}")
-            raise
-
-    @database_sync_to_async
-    def update_task_status(self, task: AgentTask, status: str, error_message: str = ""):
-        """
-        更新任务状态 / Update task status
-
-        Args:
-            task: 任务对象 / Task object
-            status: 新状态 / New status
-            error_message: 错误消息 / Error message
-        """
-        try:
-            task.status = status
-            if error_message:
-                task.error_message = error_message
-            task.completed_at = timezone.now()
-            task.save()
-        except Exception as e:
-            logger.error(f"Update task status error: {e}")
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+Agent批量运行 / Agent Batch Runs
+
+对一组（文档，问题/模板）作业执行ScholarAgent：每个作业一个AgentTask，通过Celery执行，
+全局并发由跨worker的缓存计数槽限制，LLM与工具缓存在作业间共享。
+Runs ScholarAgent over a list of (document, question/template) jobs: one AgentTask per job,
+executed through Celery, with global concurrency bounded by a cache-backed slot counter shared
+across workers, and LLM and tool caches shared between jobs.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.agent.models import AgentBatch, AgentTask, Conversation, Message
+from apps.documents.models import Document
+
+from .executor import ScholarAgent
+
+logger = logging.getLogger(__name__)
+
+
+class BatchSlots:
+    """
+    全局批量并发槽 / Global batch concurrency slots
+
+    用缓存计数器在所有worker间限制同时执行的批量作业数；计数带过期时间，避免进程崩溃后永久占用，
+    每次尝试占用时刷新过期时间，因此只有在TIMEOUT内没有任何作业尝试开始时才会过期。
+    A cache counter bounds concurrently executing batch jobs across all workers; it expires so a
+    crashed worker cannot hold slots forever. Every acquire attempt refreshes the expiry, so the
+    counter only lapses after TIMEOUT without any job trying to start.
+    """
+
+    KEY = 'agent_batch:slots'
+    TIMEOUT = 3600
+
+    @classmethod
+    def acquire(cls, limit: int) -> bool:
+        """尝试占用一个槽 / Try to take a slot"""
+        cache.add(cls.KEY, 0, cls.TIMEOUT)
+        try:
+            count = cache.incr(cls.KEY)
+        except ValueError:
+            # 计数在add与incr之间过期 / Counter expired between add and incr
+            cache.set(cls.KEY, 1, cls.TIMEOUT)
+            count = 1
+        # incr不会延长过期时间，每次占用（包括槽满时的重试）都刷新，占用期间计数不会过期
+        # incr keeps the old expiry; refresh it on every attempt so the counter outlives held slots
+        cache.touch(cls.KEY, cls.TIMEOUT)
+        if count > limit:
+            cls.release()
+            return False
+        return True
+
+    @classmethod
+    def release(cls):
+        """释放一个槽 / Release a slot"""
+        try:
+            if cache.decr(cls.KEY) < 0:
+                # 计数曾过期重建，不能低于0 / The counter was recreated after expiring; keep it non-negative
+                cache.incr(cls.KEY)
+        except ValueError:
+            pass
+
+
+class AgentBatchService:
+    """Agent批量运行服务 / Agent batch run service"""
+
+    DOCUMENT_PLACEHOLDER = '{title}'  # 模板中的文档标题占位符 / Document title placeholder in templates
+
+    @staticmethod
+    def max_jobs() -> int:
+        return getattr(settings, 'AGENT_BATCH_MAX_JOBS', 500)
+
+    @classmethod
+    def expand_jobs(cls, user, jobs: Optional[List[Dict[str, Any]]] = None,
+                    document_ids: Optional[List[str]] = None,
+                    template: str = '') -> List[Dict[str, Any]]:
+        """
+        规范化作业列表 / Normalize the job list
+
+        支持显式作业列表 [{document_id, question}]，或文档列表加问题模板（模板中的{title}替换为文档标题）。
+        Accepts explicit jobs [{document_id, question}], or documents plus a question template
+        ({title} is replaced with the document title).
+
+        Returns:
+            List[Dict]: [{'document_id', 'document_title', 'question'}]
+
+        Raises:
+            ValueError: 作业为空、超出上限、问题为空或文档不存在 / Empty, too many, blank question or unknown document
+        """
+        jobs = [dict(job) for job in (jobs or [])]
+        if document_ids:
+            if not template:
+                raise ValueError('使用document_ids时必须提供template')
+            jobs.extend({'document_id': str(doc_id), 'question': template} for doc_id in document_ids)
+
+        if not jobs:
+            raise ValueError('作业列表不能为空')
+        if len(jobs) > cls.max_jobs():
+            raise ValueError(f'作业数量不能超过{cls.max_jobs()}')
+
+        ids = {str(job['document_id']) for job in jobs if job.get('document_id')}
+        documents = {
+            str(doc.id): doc
+            for doc in Document.objects.filter(user=user, id__in=ids).only('id', 'title')
+        }
+        missing = ids - set(documents)
+        if missing:
+            raise ValueError(f'文档不存在或无权访问: {", ".join(sorted(missing))}')
+
+        expanded = []
+        for job in jobs:
+            document = documents.get(str(job.get('document_id') or ''))
+            question = (job.get('question') or '').strip()
+            if document:
+                question = question.replace(cls.DOCUMENT_PLACEHOLDER, document.title)
+            if not question:
+                raise ValueError('作业问题不能为空')
+            expanded.append({
+                'document_id': str(document.id) if document else None,
+                'document_title': document.title if document else '',
+                'question': question,
+            })
+        return expanded
+
+    @classmethod
+    def create_batch(cls, user, name: str, jobs: List[Dict[str, Any]]) -> AgentBatch:
+        """
+        创建批量运行并在提交后投递作业 / Create a batch run and enqueue its jobs on commit
+
+        Args:
+            user: 用户 / User
+            name: 批量任务名称 / Batch name
+            jobs: expand_jobs的结果 / Output of expand_jobs
+
+        Returns:
+            AgentBatch: 批量运行 / Batch run
+        """
+        with transaction.atomic():
+            conversation = Conversation.objects.create(user=user, title=name[:200], message_count=len(jobs))
+            batch = AgentBatch.objects.create(
+                user=user,
+                conversation=conversation,
+                name=name[:200],
+                status='running',
+                total_jobs=len(jobs)
+            )
+            messages = Message.objects.bulk_create([
+                Message(
+                    conversation=conversation,
+                    role='user',
+                    content=job['question'],
+                    context_type='document' if job['document_id'] else 'none',
+                    context_data={
+                        'batch_id': str(batch.id),
+                        'document_id': job['document_id'],
+                        'document_title': job['document_title'],
+                    }
+                )
+                for job in jobs
+            ])
+            tasks = AgentTask.objects.bulk_create([
+                AgentTask(conversation=conversation, message=message, batch=batch, status='pending')
+                for message in messages
+            ])
+            task_ids = [str(task.id) for task in tasks]
+            transaction.on_commit(lambda: cls.enqueue(task_ids))
+
+        return batch
+
+    @staticmethod
+    def enqueue(task_ids: List[str]):
+        """投递作业到Celery / Send jobs to Celery"""
+        from apps.agent.tasks import run_agent_batch_job
+
+        for task_id in task_ids:
+            run_agent_batch_job.delay(task_id)
+
+    @staticmethod
+    async def run_job(task: AgentTask) -> bool:
+        """
+        执行单个作业，结果由执行器写入AgentTask / Run a single job; the executor writes results to the AgentTask
+
+        Returns:
+            bool: 是否得到了答案 / Whether an answer was produced
+        """
+        context_data = task.message.context_data or {}
+        document_id = context_data.get('document_id')
+        agent = ScholarAgent(
+            user_id=str(task.conversation.user_id),
+            conversation_id=str(task.conversation_id),
+            document_id=document_id,
+            batch=True
+        )
+        context = {
+            'task_id': str(task.id),
+            'message_id': str(task.message_id),
+            'document_info': {'id': document_id, 'title': context_data.get('document_title', '')} if document_id else {},
+        }
+
+        async for event in agent.run(task.message.content, context):
+            if event.get('type') == 'answer':
+                return True
+        return False
+
+    @staticmethod
+    def record_result(batch_id, succeeded: bool):
+        """
+        累加作业结果，全部结束时完成批量运行 / Count a job result and complete the batch once all jobs finish
+        """
+        field = 'completed_jobs' if succeeded else 'failed_jobs'
+        AgentBatch.objects.filter(pk=batch_id).update(**{field: F(field) + 1})
+        AgentBatch.objects.filter(
+            pk=batch_id,
+            status='running',
+            total_jobs__lte=F('completed_jobs') + F('failed_jobs')
+        ).update(status='completed', completed_at=timezone.now())
+
+    @staticmethod
+    def cancel(batch: AgentBatch) -> int:
+        """
+        取消批量运行，尚未开始的作业标记为已取消 / Cancel a batch; jobs not yet started are marked cancelled
+
+        Returns:
+            int: 取消的作业数 / Number of jobs cancelled
+        """
+        with transaction.atomic():
+            AgentBatch.objects.filter(pk=batch.pk, status__in=['pending', 'running']).update(
+                status='cancelled', completed_at=timezone.now()
+            )
+            return batch.tasks.filter(status='pending').update(status='cancelled', completed_at=timezone.now())
@@ -0,0 +1,241 @@
+"""
+上下文窗口管理 / Context Window Management
+
+按token预算为ReAct提示词组装计划、执行历史和工具观察：最近的观察按与查询的相关性截断，
+较早的观察压缩为结构化摘要，超出预算时从最早的步骤开始省略。
+Assembles plan, execution history and tool observations for the ReAct prompt within a token
+budget: recent observations are truncated by relevance to the query, older ones are compressed
+into structured summaries, and the oldest steps are elided when over budget.
+"""
+
+import json
+import math
+import re
+from typing import Any, Dict, List, Tuple
+
+from .memory_index import tokenize
+
+# 预分词：中日韩字符、单词、数字、空白、其他符号 / Pre-tokenization: CJK chars, words, numbers, whitespace, symbols
+_PIECE_RE = re.compile(
+    r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]'
+    r'|[A-Za-z]+|\d+|\s+|[^\sA-Za-z\d]'
+)
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]')
+
+# 段落和句子边界 / Paragraph and sentence boundaries
+_SEGMENT_RE = re.compile(r'\n\s*\n|(?<=[。！？；.!?;])\s*')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数 / Estimate the token count of text
+
+    按预分词片段计费，比例参照DeepSeek分词器（约1个汉字0.6 token，约4个英文字母1 token）。
+    Charges per pre-tokenized piece using DeepSeek tokenizer ratios (~0.6 token per CJK
+    character, ~1 token per 4 Latin letters).
+    """
+    if not text:
+        return 0
+    tokens = 0.0
+    for piece in _PIECE_RE.findall(text):
+        if _CJK_RE.match(piece):
+            tokens += 0.6
+        elif piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece.isspace():
+            tokens += 0 if piece == ' ' else 1
+        else:
+            tokens += 1
+    return int(math.ceil(tokens))
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """按token预算截断文本开头部分 / Keep the head of text within a token budget"""
+    if estimate_tokens(text) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget - 1:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + '…'
+
+
+class ContextBuilder:
+    """
+    ReAct上下文构建器 / ReAct context builder
+
+    预算按比例分配给计划、较早步骤的摘要和最近步骤的观察，未用完的份额顺延给后者。
+    The budget is split across the plan, summaries of older steps and recent observations;
+    unused share rolls over to the latter.
+    """
+
+    DEFAULT_BUDGET = 6000  # 计划+历史的总token预算 / Total token budget for plan + history
+    PLAN_SHARE = 0.15
+    SUMMARY_SHARE = 0.25
+    RECENT_STEPS = 2  # 保留完整（按相关性截断）观察的最近步骤数 / Recent steps keeping full (relevance-truncated) observations
+    SUMMARY_TOKENS = 80  # 每条较早观察的摘要预算 / Summary budget per older observation
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        self.budget = budget
+
+    # ---- 观察切分与相关性 / Observation segmentation and relevance ----
+
+    @classmethod
+    def _segments(cls, value: Any, label: str = '') -> List[str]:
+        """把工具输出展开为文本片段（保持原顺序） / Flatten a tool output into text segments (original order)"""
+        if isinstance(value, dict):
+            segments = []
+            for key, item in value.items():
+                if key in ('success', 'execution_time'):
+                    continue
+                segments.extend(cls._segments(item, key))
+            return segments
+        if isinstance(value, (list, tuple)):
+            segments = []
+            for item in value:
+                segments.extend(cls._segments(item, label))
+            return segments
+        if value is None or value == '':
+            return []
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        prefix = f'{label}: ' if label else ''
+        return [prefix + part.strip() for part in _SEGMENT_RE.split(text) if part and part.strip()]
+
+    @staticmethod
+    def _relevance(segment: str, query_terms: set) -> float:
+        """片段与查询的词项重合度 / Term overlap between a segment and the query"""
+        if not query_terms:
+            return 0.0
+        terms = set(tokenize(segment))
+        return len(terms & query_terms) / (1 + math.log(1 + len(terms)))
+
+    @classmethod
+    def truncate_by_relevance(cls, observation: Any, query: str, budget: int) -> Tuple[str, bool]:
+        """
+        按与查询的相关性截断工具输出 / Truncate a tool output by relevance to the query
+
+        选出最相关的片段直到用完预算，再按原顺序拼接。
+        Picks the most relevant segments until the budget is used, then joins them in original order.
+
+        Returns:
+            Tuple[str, bool]: (文本, 是否被截断) / (text, whether it was truncated)
+        """
+        full = observation if isinstance(observation, str) else json.dumps(observation, ensure_ascii=False, default=str)
+        if estimate_tokens(full) <= budget:
+            return full, False
+
+        segments = list(dict.fromkeys(cls._segments(observation)))
+        query_terms = set(tokenize(query))
+        scores = [cls._relevance(segment, query_terms) for segment in segments]
+
+        # 有相关片段时只保留相关片段，否则按原顺序 / Keep only relevant segments if any, else original order
+        ranked = sorted(
+            (i for i in range(len(segments)) if scores[i] > 0),
+            key=lambda i: (scores[i], -i),
+            reverse=True
+        ) or list(range(len(segments)))
+
+        chosen, used = [], 0
+        for index in ranked:
+            cost = estimate_tokens(segments[index]) + 1
+            if used + cost > budget:
+                if not chosen and budget > 0:
+                    chosen.append((index, truncate_to_tokens(segments[index], budget)))
+                continue
+            chosen.append((index, segments[index]))
+            used += cost
+
+        chosen.sort()
+        return ' … '.join(text for _, text in chosen), True
+
+    # ---- 构建 / Building ----
+
+    def _plan_text(self, plan: Dict[str, Any], budget: int) -> str:
+        """计划文本，超预算时只保留意图和截断的步骤 / Plan text; over budget keeps intent and truncated steps"""
+        text = json.dumps(plan, ensure_ascii=False, default=str)
+        if estimate_tokens(text) <= budget:
+            return text
+        compact = {'intent': plan.get('intent', ''), 'plan': plan.get('plan', [])}
+        return truncate_to_tokens(json.dumps(compact, ensure_ascii=False, default=str), budget)
+
+    @classmethod
+    def _summarize_step(cls, step: Dict[str, Any], query: str) -> str:
+        """较早步骤的结构化摘要 / Structured summary of an older step"""
+        observation = step.get('observation')
+        success = observation.get('success') if isinstance(observation, dict) else None
+        excerpt, _ = cls.truncate_by_relevance(
+            observation.get('error') or observation.get('data') if isinstance(observation, dict) else observation,
+            query, cls.SUMMARY_TOKENS
+        )
+        summary = {
+            'action': step.get('action'),
+            'success': success,
+            'size_tokens': estimate_tokens(json.dumps(observation, ensure_ascii=False, default=str)),
+            'excerpt': excerpt,
+        }
+        return (
+            f"Thought: {truncate_to_tokens(step.get('thought', ''), cls.SUMMARY_TOKENS // 2)}\n"
+            f"Action: {step.get('action')}\n"
+            f"Observation (摘要/summary): {json.dumps(summary, ensure_ascii=False)}"
+        )
+
+    def build(self, user_input: str, plan: Dict[str, Any],
+              execution_history: List[Dict[str, Any]]) -> Tuple[str, str, Dict[str, int]]:
+        """
+        组装ReAct提示词的计划和执行历史 / Build the plan and history parts of the ReAct prompt
+
+        Args:
+            user_input: 用户输入 / User input
+            plan: 执行计划 / Execution plan
+            execution_history: 执行历史 / Execution history
+
+        Returns:
+            Tuple[str, str, Dict]: (计划文本, 历史文本, 统计) / (plan text, history text, stats)
+        """
+        plan_text = self._plan_text(plan, int(self.budget * self.PLAN_SHARE))
+        remaining = self.budget - estimate_tokens(plan_text)
+
+        recent = execution_history[-self.RECENT_STEPS:] if self.RECENT_STEPS else []
+        older = execution_history[:len(execution_history) - len(recent)]
+
+        # 较早步骤：从新到旧放入摘要，超预算时省略更早的 / Older steps: newest first, elide the rest when over budget
+        summary_budget = int(self.budget * self.SUMMARY_SHARE)
+        summaries, elided = [], 0
+        for step in reversed(older):
+            summary = self._summarize_step(step, user_input)
+            cost = estimate_tokens(summary)
+            if cost > summary_budget:
+                elided = len(older) - len(summaries)
+                break
+            summaries.insert(0, summary)
+            summary_budget -= cost
+        remaining -= sum(estimate_tokens(summary) for summary in summaries)
+
+        # 最近步骤：平分剩余预算，观察按相关性截断 / Recent steps: split the rest, truncate observations by relevance
+        parts, truncated = [], 0
+        per_step = max(0, remaining // max(1, len(recent)))
+        for step in recent:
+            header = f"Thought: {step.get('thought', '')}\nAction: {step.get('action')}\nObservation: "
+            query = f"{user_input} {step.get('thought', '')}"
+            observation, was_truncated = self.truncate_by_relevance(
+                step.get('observation'), query, max(0, per_step - estimate_tokens(header))
+            )
+            truncated += was_truncated
+            parts.append(header + observation)
+
+        if elided:
+            summaries.insert(0, f"（省略了较早的{elided}个步骤 / {elided} earlier steps omitted）")
+
+        history_text = "\n".join(summaries + parts)
+        stats = {
+            'context_tokens': estimate_tokens(plan_text) + estimate_tokens(history_text),
+            'observations_truncated': truncated,
+            'steps_summarized': len(older) - elided,
+            'steps_elided': elided,
+        }
+        return plan_text, history_text, stats
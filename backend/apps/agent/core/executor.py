@@ -10,14 +10,23 @@ import time
 from typing import Dict, Any, AsyncGenerator, Optional
 from datetime import datetime
 
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
 from apps.agent.models import AgentTask, ToolCall, Conversation, Message
 from apps.agent.tools.registry import ToolRegistry
-from core.llm import get_llm_client
+
+from core.cache import CacheService
+from core.llm import get_llm_client, LaneScheduler
 from core.logging import LoggerMixin, log_context
 from apps.billing.services import TokenUsageService
 
+from .context import ContextBuilder
 from .memory import MemoryManager
+from .plan_cache import PlanCache
 from .prompts import SYSTEM_PROMPT, PLANNER_PROMPT, REACT_PROMPT
+from .router import ModelRouter, get_model_router
+from .tracing import RunTrace
 
 logger = logging.getLogger('agent')
 
@@ -26,8 +35,16 @@ class ScholarAgent(LoggerMixin):
     """ScholarMind Agent执行器 / ScholarMind Agent Executor"""
 
     MAX_ITERATIONS = 8  # 最大迭代次数 / Maximum iterations
-
-    def __init__(self, user_id: str, conversation_id: str, document_id: Optional[str] = None):
+    LLM_LANE = LaneScheduler.INTERACTIVE  # 交互式优先级通道 / Interactive priority lane
+    SESSION_COMPRESSION_DELAY = 5  # 会话压缩延迟（秒） / Session compression delay (seconds)
+    SESSION_COMPRESSION_MIN_MESSAGES = 4  # 触发压缩的最少新消息数 / Min new messages to compress
+    TOOL_TOP_N = 4  # 提示词中最多描述的工具数 / Max tools described in a prompt
+    CONTEXT_TOKEN_BUDGET = 6000  # ReAct计划与历史的token预算 / Token budget for ReAct plan and history
+    TOOL_CACHE_TIMEOUT = 3600  # 批量运行工具结果缓存时间（秒） / Batch tool result cache timeout (seconds)
+    PLAN_CACHE_ENABLED = True  # 相似意图复用计划 / Reuse plans for similar intents
+
+    def __init__(self, user_id: str, conversation_id: str, document_id: Optional[str] = None,
+                 batch: bool = False):
         """
         初始化Agent执行器 / Initialize Agent executor
 
@@ -35,14 +52,22 @@ class ScholarAgent(LoggerMixin):
             user_id: 用户ID / User ID
             conversation_id: 对话ID / Conversation ID
             document_id: 文档ID（可选） / Document ID (optional)
+            batch: 批量运行：走批量通道、共享LLM与工具缓存、不压缩会话
+                   Batch run: batch lane, shared LLM and tool caches, no session compression
         """
         self.user_id = user_id
         self.conversation_id = conversation_id
         self.document_id = document_id
+        self.batch = batch
+        self.lane = LaneScheduler.BATCH if batch else self.LLM_LANE
 
         self.memory = MemoryManager(user_id, conversation_id)
         self.execution_history = []
         self.llm_client = get_llm_client()
+        self.router = get_model_router()
+        self.complexity = ModelRouter.COMPLEX
+        self.trace = RunTrace()
+        self.context_builder = ContextBuilder(self.CONTEXT_TOKEN_BUDGET)
 
     async def run(self, user_input: str, context: dict) -> AsyncGenerator[Dict[str, Any], None]:
         """
@@ -62,41 +87,61 @@ class ScholarAgent(LoggerMixin):
             task = None
 
             try:
-                # 1. 创建任务记录 / Create task record
-                task = await AgentTask.objects.acreate(
-                    conversation_id=self.conversation_id,
-                    message_id=context.get('message_id'),
-                    status='planning'
-                )
+                # 1. 创建任务记录（批量运行复用预先创建的任务） / Create task record (batch runs reuse the pre-created one)
+                with self.trace.span('db', op='create_task'):
+                    if context.get('task_id'):
+                        task = await AgentTask.objects.aget(id=context['task_id'])
+                        task.status = 'planning'
+                        task.started_at = timezone.now()
+                        await task.asave(update_fields=['status', 'started_at'])
+                    else:
+                        task = await AgentTask.objects.acreate(
+                            conversation_id=self.conversation_id,
+                            message_id=context.get('message_id'),
+                            status='planning'
+                        )
 
                 # 2. 获取记忆上下文 / Get memory context
                 yield {"type": "state", "data": {"state": "loading_memory"}}
-                memory_context = await self.memory.get_context(user_input)
+                with self.trace.span('memory'):
+                    memory_context = await self.memory.get_context(user_input)
 
                 # 3. 规划阶段 / Planning phase
                 yield {"type": "state", "data": {"state": "planning"}}
                 logger.info(f'Planning for query: {user_input[:100]}...')
-                plan = await self._create_plan(user_input, memory_context, context)
+                self.complexity = ModelRouter.classify(user_input, context)
+                with self.trace.span('plan'):
+                    plan = await self._create_plan(user_input, memory_context, context)
                 logger.info(f'Plan created with {len(plan.get("plan", []))} steps')
 
+                # 按计划重新判断复杂度，决定思考步骤的模型档位 / Reclassify with the plan to route think steps
+                self.complexity = ModelRouter.classify(user_input, context, plan)
+
                 # 更新任务状态 / Update task status
                 task.plan = plan
                 task.status = 'executing'
-                await task.asave()
+                with self.trace.span('db', op='save_plan'):
+                    await task.asave()
 
                 yield {"type": "plan", "data": plan}
 
                 # 4. 如果不需要工具，直接回答 / Direct answer if no tools needed
                 if not plan.get("needs_tools", False):
-                    answer = await self._direct_answer(user_input, memory_context)
-                    yield {"type": "answer", "data": {"content": answer}}
+                    with self.trace.span('answer'):
+                        answer = await self._direct_answer(user_input, memory_context)
+
+                    # 会话压缩交给后台任务 / Hand session compression to a background job
+                    with self.trace.span('enqueue', op='session_compression'):
+                        await self._schedule_session_compression()
 
                     # 更新任务完成状态 / Update task completion status
                     task.status = 'completed'
                     task.result = answer
                     task.execution_time = time.time() - start_time
+                    task.trace = self.trace.to_dict()
                     await task.asave()
 
+                    yield {"type": "answer", "data": {"content": answer}}
                     return
 
                 # 5. ReAct循环 / ReAct loop
@@ -105,7 +150,8 @@ class ScholarAgent(LoggerMixin):
                     yield {"type": "iteration", "data": {"current": iteration + 1, "max": self.MAX_ITERATIONS}}
 
                     # 思考阶段 / Thinking phase
-                    thought = await self._think(user_input, memory_context, context, plan)
+                    with self.trace.span('think', iteration=iteration + 1):
+                        thought = await self._think(user_input, memory_context, context, plan)
                     yield {"type": "thought", "data": {"content": thought.get("thought", "")}}
 
                     # 检查是否需要工具 / Check if tool is needed
@@ -114,11 +160,12 @@ class ScholarAgent(LoggerMixin):
                         logger.info(f'Executing tool: {thought["action"]}')
                         yield {"type": "action", "data": {"tool": thought["action"]}}
 
-                        tool_result = await self._execute_tool(
-                            thought["action"],
-                            thought.get("action_input", {}),
-                            task
-                        )
+                        with self.trace.span(f'tool:{thought["action"]}', iteration=iteration + 1):
+                            tool_result = await self._execute_tool(
+                                thought["action"],
+                                thought.get("action_input", {}),
+                                task
+                            )
 
                         yield {"type": "observation", "data": {
                             "content": str(tool_result)[:500],  # 限制长度 / Limit length
@@ -135,7 +182,10 @@ class ScholarAgent(LoggerMixin):
                     elif "final_answer" in thought:
                         # 给出最终答案 / Give final answer
                         logger.info(f'Answer generated after {iteration+1} iterations')
-                        yield {"type": "answer", "data": {"content": thought["final_answer"]}}
+
+                        # 会话压缩交给后台任务，不阻塞回答 / Hand session compression to a background job
+                        with self.trace.span('enqueue', op='session_compression'):
+                            await self._schedule_session_compression()
 
                         # 更新任务完成状态 / Update task completion status
                         task.status = 'completed'
@@ -143,10 +193,10 @@ class ScholarAgent(LoggerMixin):
                         task.iterations = iteration + 1
                         task.execution_time = time.time() - start_time
                         task.execution_history = self.execution_history
+                        task.trace = self.trace.to_dict()
                         await task.asave()
 
-                        # 压缩并保存会话 / Compress and save session
-                        await self.memory.compress_and_save_session(self.execution_history)
+                        yield {"type": "answer", "data": {"content": thought["final_answer"]}}
 
                         logger.info(f'Agent execution completed')
                         return
@@ -158,6 +208,7 @@ class ScholarAgent(LoggerMixin):
                 task.error_message = "达到最大迭代次数"
                 task.iterations = self.MAX_ITERATIONS
                 task.execution_time = time.time() - start_time
+                task.trace = self.trace.to_dict()
                 await task.asave()
 
             except Exception as e:
@@ -168,6 +219,7 @@ class ScholarAgent(LoggerMixin):
                     task.status = 'failed'
                     task.error_message = str(e)
                     task.execution_time = time.time() - start_time
+                    task.trace = self.trace.to_dict()
                     await task.asave()
 
                 yield {"type": "error", "data": {"message": f"执行失败: {str(e)}"}}
@@ -185,12 +237,23 @@ class ScholarAgent(LoggerMixin):
             Dict: 执行计划 / Execution plan
         """
         try:
-            # 准备规划提示词 / Prepare planning prompt
-            tools_description = ToolRegistry.get_tool_descriptions()
-
             document_info = context.get('document_info', {})
             selection = context.get('selection', '')
 
+            # 相似意图命中计划缓存时跳过规划调用；选中内容影响计划，不走缓存
+            # A cached plan for the same intent skips the planner call; selections change the plan, so they bypass the cache
+            document_id = self.document_id or document_info.get('id')
+            use_cache = self.PLAN_CACHE_ENABLED and not selection
+            if use_cache:
+                cached = await PlanCache.aget(user_input, document_id)
+                if cached:
+                    plan, saved_ms = cached
+                    self.trace.annotate(plan_cache_hits=1, plan_ms_saved=saved_ms)
+                    return plan
+
+            # 准备规划提示词，只描述相关工具 / Prepare planning prompt with only the relevant tools
+            tools_description = self._tool_descriptions(f"{user_input} {selection}")
+
             prompt = PLANNER_PROMPT.format(
                 user_input=user_input,
                 document_info=json.dumps(document_info, ensure_ascii=False),
@@ -199,31 +262,14 @@ class ScholarAgent(LoggerMixin):
             )
 
             # 调用LLM生成计划 / Call LLM to generate plan
-            response = await self.llm_client.generate_json(prompt=prompt)
+            started = time.perf_counter()
+            response = await self._routed_json('plan', prompt=prompt, lane=self.lane)
 
             # 记录token使用 / Record token usage
-            if 'usage' in response:
-                usage = response['usage']
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                if input_tokens > 0 or output_tokens > 0:
-                    from django.contrib.auth import get_user_model
-                    User = get_user_model()
-                    try:
-                        user = await User.objects.aget(id=self.user_id)
-                        await TokenUsageService.record_token_usage(
-                            user=user,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            api_type='agent_execution',
-                            metadata={
-                                'operation': 'create_plan',
-                                'conversation_id': self.conversation_id,
-                                'document_id': self.document_id
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to record token usage for plan creation: {e}")
+            self._record_usage(response, 'create_plan')
+
+            if use_cache:
+                await PlanCache.aset(user_input, response, (time.perf_counter() - started) * 1000, document_id)
 
             return response
 
@@ -257,32 +303,13 @@ class ScholarAgent(LoggerMixin):
             response = await self.llm_client.generate(
                 prompt=user_input,
                 system_prompt=system_prompt,
-                max_tokens=1000
+                max_tokens=1000,
+                cacheable=True if self.batch else None,
+                lane=self.lane
             )
 
             # 记录token使用 / Record token usage
-            if 'usage' in response:
-                usage = response['usage']
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                if input_tokens > 0 or output_tokens > 0:
-                    from django.contrib.auth import get_user_model
-                    User = get_user_model()
-                    try:
-                        user = await User.objects.aget(id=self.user_id)
-                        await TokenUsageService.record_token_usage(
-                            user=user,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            api_type='agent_execution',
-                            metadata={
-                                'operation': 'direct_answer',
-                                'conversation_id': self.conversation_id,
-                                'document_id': self.document_id
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to record token usage for direct answer: {e}")
+            self._record_usage(response, 'direct_answer')
 
             return response["content"]
 
@@ -305,48 +332,31 @@ class ScholarAgent(LoggerMixin):
             Dict: 思考结果 / Thinking result
         """
         try:
-            # 准备ReAct提示词 / Prepare ReAct prompt
-            tools_description = ToolRegistry.get_tool_descriptions()
+            # 准备ReAct提示词，只描述与计划相关的工具 / Prepare ReAct prompt with the tools relevant to the plan
+            steps = plan.get("plan", [])
+            tools_description = self._tool_descriptions(
+                " ".join([user_input, plan.get("intent", ""), *[str(step) for step in steps]]),
+                required=[*(plan.get("estimated_tools") or []), *[step["action"] for step in self.execution_history]]
+            )
 
-            execution_history_text = "\n".join([
-                f"Thought: {step['thought']}\nAction: {step['action']}\nObservation: {step['observation']}"
-                for step in self.execution_history[-3:]  # 最近3步 / Last 3 steps
-            ])
+            # 按token预算组装计划和执行历史 / Assemble plan and history within the token budget
+            plan_text, execution_history_text, context_stats = self.context_builder.build(
+                user_input, plan, self.execution_history
+            )
+            self.trace.annotate(**context_stats)
 
             prompt = REACT_PROMPT.format(
                 user_input=user_input,
-                plan=json.dumps(plan, ensure_ascii=False),
+                plan=plan_text,
                 execution_history=execution_history_text,
                 tools_description=tools_description
             )
 
             # 调用LLM生成思考 / Call LLM to generate thought
-            response = await self.llm_client.generate_json(prompt=prompt)
+            response = await self._routed_json('think', prompt=prompt, lane=self.lane)
 
             # 记录token使用 / Record token usage
-            if 'usage' in response:
-                usage = response['usage']
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                if input_tokens > 0 or output_tokens > 0:
-                    from django.contrib.auth import get_user_model
-                    User = get_user_model()
-                    try:
-                        user = await User.objects.aget(id=self.user_id)
-                        await TokenUsageService.record_token_usage(
-                            user=user,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            api_type='agent_execution',
-                            metadata={
-                                'operation': 'think',
-                                'conversation_id': self.conversation_id,
-                                'document_id': self.document_id,
-                                'iteration': len(self.execution_history) + 1
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to record token usage for thinking: {e}")
+            self._record_usage(response, 'think', iteration=len(self.execution_history) + 1)
 
             return response
 
@@ -358,6 +368,95 @@ class ScholarAgent(LoggerMixin):
                 "final_answer": "抱歉，我遇到了一些问题。请重新表述您的问题。"
             }
 
+    async def _routed_json(self, site: str, **kwargs) -> Dict[str, Any]:
+        """
+        按模型路由调用LLM，并把路由决策记到当前追踪阶段
+        Call the LLM through the model router and record the decision on the current trace span
+
+        Args:
+            site: 调用点 / Call site
+            **kwargs: 传给generate_json的参数 / Arguments for generate_json
+        """
+        if self.batch:
+            # 批量运行的相同提示在作业间共享缓存 / Identical prompts are shared across batch jobs
+            kwargs.setdefault('cacheable', True)
+        response, decision = await self.router.generate_json(
+            self.llm_client, site, self.complexity, **kwargs
+        )
+        self.trace.annotate(**decision)
+        return response
+
+    def _tool_descriptions(self, query: str, required: Optional[list] = None) -> str:
+        """
+        生成与查询相关的工具描述 / Build tool descriptions relevant to a query
+
+        没有命中任何工具时退回完整列表；省下的描述长度记录到当前追踪阶段。
+        Falls back to the full list when nothing matches; the characters saved are recorded on the current trace span.
+
+        Args:
+            query: 查询内容 / Query
+            required: 必须包含的工具（计划预估或已使用的工具） / Tools that must be included (estimated or already used)
+
+        Returns:
+            str: 工具描述文本 / Tool descriptions text
+        """
+        selected = ToolRegistry.select_tools(query, top_n=self.TOOL_TOP_N, required=required)
+        description = ToolRegistry.get_tool_descriptions(tool_names=selected)
+        full_length = len(ToolRegistry.get_tool_descriptions()) if selected else len(description)
+        self.trace.annotate(tools=len(selected) or ToolRegistry.count(),
+                            tool_chars_saved=full_length - len(description))
+        return description
+
+    async def _schedule_session_compression(self):
+        """
+        投递增量会话压缩任务 / Enqueue incremental session compression
+
+        延迟执行，以便本轮的回答消息先被保存；投递失败只记录日志，不影响回答。
+        Delayed so this turn's answer message is saved first; failures are only logged.
+        """
+        from apps.agent.tasks import compress_session_task
+
+        if self.batch:
+            return
+
+        try:
+            await sync_to_async(compress_session_task.apply_async)(
+                args=[str(self.user_id), str(self.conversation_id)],
+                kwargs={'min_new_messages': self.SESSION_COMPRESSION_MIN_MESSAGES},
+                countdown=self.SESSION_COMPRESSION_DELAY
+            )
+        except Exception as e:
+            logger.warning(f"Failed to schedule session compression: {e}")
+
+    def _record_usage(self, response: Dict[str, Any], operation: str, **extra):
+        """
+        记录token使用（非阻塞，批量落库） / Record token usage (non-blocking, flushed in batches)
+
+        Args:
+            response: LLM响应，其中的usage字段会被移除 / LLM response, its usage field is removed
+            operation: 操作名称 / Operation name
+            **extra: 额外元数据 / Extra metadata
+        """
+        self.trace.record_llm(response)
+        with self.trace.span('usage', op=operation):
+            TokenUsageService.enqueue_llm_usage(
+                self.user_id,
+                response,
+                api_type='agent_execution',
+                metadata={
+                    'operation': operation,
+                    'conversation_id': str(self.conversation_id),
+                    'document_id': str(self.document_id) if self.document_id else None,
+                    **extra
+                }
+            )
+
+    def _tool_cache_key(self, tool, tool_input: Dict[str, Any]) -> Optional[str]:
+        """批量运行中可缓存工具的结果缓存键 / Result cache key of a cacheable tool in a batch run"""
+        if not (self.batch and tool.cacheable):
+            return None
+        return f"agent_tool:{tool.name}:{CacheService.make_key(tool_input)}"
+
     async def _execute_tool(self, tool_name: str, tool_input: Dict[str, Any], task: AgentTask) -> Dict[str, Any]:
         """
         执行工具 / Execute tool
@@ -374,12 +473,13 @@ class ScholarAgent(LoggerMixin):
 
         try:
             # 创建工具调用记录 / Create tool call record
-            tool_call = await ToolCall.objects.acreate(
-                task=task,
-                tool_name=tool_name,
-                tool_input=tool_input,
-                status='running'
-            )
+            with self.trace.span('db', op='create_tool_call'):
+                tool_call = await ToolCall.objects.acreate(
+                    task=task,
+                    tool_name=tool_name,
+                    tool_input=tool_input,
+                    status='running'
+                )
 
             # 获取工具 / Get tool
             tool = ToolRegistry.get(tool_name)
@@ -392,16 +492,24 @@ class ScholarAgent(LoggerMixin):
                 await tool_call.asave()
                 return {"success": False, "error": error_msg}
 
-            # 执行工具 / Execute tool
+            # 执行工具（批量运行共享只读工具的结果缓存） / Execute tool (batch runs share read-only tool results)
             tool_input["user_id"] = self.user_id
-            result = await tool.safe_execute(**tool_input)
+            cache_key = self._tool_cache_key(tool, tool_input)
+            result = await CacheService.aget(cache_key) if cache_key else None
+            if result is None:
+                result = await tool.safe_execute(**tool_input)
+                if cache_key and result.success:
+                    await CacheService.aset(cache_key, result, self.TOOL_CACHE_TIMEOUT)
+            else:
+                self.trace.annotate(tool_cache_hit=True)
 
             # 更新工具调用记录 / Update tool call record
             tool_call.status = 'success' if result.success else 'failed'
             tool_call.output = result.data if result.success else ""
             tool_call.error = result.error if not result.success else ""
             tool_call.execution_time = time.time() - start_time
-            await tool_call.asave()
+            with self.trace.span('db', op='save_tool_call'):
+                await tool_call.asave()
 
             return {
                 "success": result.success,
@@ -0,0 +1,96 @@
+"""
+对话消息尾部缓存 / Conversation Message Tail Cache
+
+每个对话在缓存中保留最近若干条消息的精简副本，保存消息时追加，
+记忆层读取最近历史时不再每轮查询数据库。
+Each conversation keeps a compact copy of its most recent messages in the cache, appended as
+messages are saved, so the memory layer reads recent history without querying the database
+every turn.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from apps.agent.models import Message
+
+logger = logging.getLogger(__name__)
+
+
+class MessageTail:
+    """
+    对话最近消息 / Recent messages of a conversation
+
+    只在尾部已缓存时追加；缓存缺失时由下一次读取从数据库重建，避免写入不完整的尾部。
+    Appends only when the tail is already cached; on a miss the next read rebuilds it from the
+    database, so a partial tail is never written.
+    """
+
+    KEY_PREFIX = 'agent_history'
+    SIZE = 20  # 保留的消息数 / Messages kept
+    CONTENT_CHARS = 500  # 每条消息保留的字符数 / Characters kept per message
+    TIMEOUT = 86400  # 24小时 / 24 hours
+
+    @classmethod
+    def _key(cls, conversation_id) -> str:
+        return f'{cls.KEY_PREFIX}:{conversation_id}'
+
+    @classmethod
+    def _entry(cls, message: Message) -> Dict[str, Any]:
+        return {
+            'id': str(message.id),
+            'role': message.role,
+            'content': message.content[:cls.CONTENT_CHARS],
+            'created_at': message.created_at.isoformat() if message.created_at else None,
+        }
+
+    @classmethod
+    def append(cls, message: Message):
+        """
+        追加新保存的消息 / Append a newly saved message
+
+        同一对话的消息由同一次运行顺序保存，读-改-写足够 / Messages of a conversation are saved
+        sequentially by one run, so read-modify-write is sufficient
+        """
+        key = cls._key(message.conversation_id)
+        tail = cache.get(key)
+        if tail is None:
+            return
+        if any(entry['id'] == str(message.id) for entry in tail):
+            return
+        tail.append(cls._entry(message))
+        cache.set(key, tail[-cls.SIZE:], cls.TIMEOUT)
+
+    @classmethod
+    def invalidate(cls, conversation_id):
+        """删除或批量写入消息后使尾部失效 / Invalidate after deletes or bulk writes"""
+        cache.delete(cls._key(conversation_id))
+
+    @classmethod
+    def get_recent(cls, conversation_id, limit: int = SIZE) -> List[Dict[str, Any]]:
+        """
+        最近的消息（从旧到新） / Recent messages, oldest first
+
+        Args:
+            conversation_id: 对话ID / Conversation ID
+            limit: 返回数量，不超过SIZE / Number to return, at most SIZE
+        """
+        key = cls._key(conversation_id)
+        tail = cache.get(key)
+        if tail is None:
+            messages = Message.objects.filter(
+                conversation_id=conversation_id
+            ).only('id', 'role', 'content', 'created_at').order_by('-created_at', '-id')[:cls.SIZE]
+            tail = [cls._entry(message) for message in reversed(messages)]
+            cache.set(key, tail, cls.TIMEOUT)
+        return tail[-limit:] if limit else []
+
+    @classmethod
+    async def aget_recent(cls, conversation_id, limit: int = SIZE) -> List[Dict[str, Any]]:
+        """get_recent 的异步版本 / Async version of get_recent"""
+        tail = await cache.aget(cls._key(conversation_id))
+        if tail is None:
+            return await sync_to_async(cls.get_recent)(conversation_id, limit)
+        return tail[-limit:] if limit else []
@@ -8,22 +8,23 @@ import logging
 import json
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
-from django.utils import timezone
 
 from apps.agent.models import AgentMemory, Conversation, Message
-from core.llm import get_llm_client
+from core.llm import get_llm_client, LaneScheduler
 from apps.billing.services import TokenUsageService
-from django.contrib.auth import get_user_model
+from .history import MessageTail
+from .memory_index import MemoryIndex
+from .router import get_model_router
 from .prompts import MEMORY_COMPRESSION_PROMPT, USER_PROFILE_PROMPT
 
-User = get_user_model()
-
 logger = logging.getLogger(__name__)
 
 
 class MemoryManager:
     """Agent记忆管理器 / Agent Memory Manager"""
 
+    COMPRESSION_BATCH_SIZE = 50  # 单次增量压缩的最大消息数 / Max messages per incremental compression
+
     def __init__(self, user_id: str, conversation_id: str):
         """
         初始化记忆管理器 / Initialize memory manager
@@ -110,18 +111,16 @@ class MemoryManager:
             Dict: 生成的用户画像 / Generated user profile
         """
         try:
-            # 获取最近的对话历史 / Get recent conversation history
-            messages = await Message.objects.filter(
-                conversation_id=self.conversation_id
-            ).order_by('-created_at')[:20]
+            # 获取最近的对话历史（缓存的消息尾部） / Get recent conversation history (cached message tail)
+            messages = await MessageTail.aget_recent(self.conversation_id, 20)
 
             if not messages:
                 return {}
 
             # 准备提示词 / Prepare prompt
             messages_text = "\n".join([
-                f"{msg.role}: {msg.content[:200]}..."
-                for msg in reversed(messages)
+                f"{msg['role']}: {msg['content'][:200]}..."
+                for msg in messages
             ])
 
             prompt = USER_PROFILE_PROMPT.format(
@@ -130,29 +129,12 @@ class MemoryManager:
             )
 
             # 调用LLM生成画像 / Call LLM to generate profile
-            llm_client = get_llm_client()
-            response = await llm_client.generate_json(prompt=prompt)
+            response, _ = await get_model_router().generate_json(
+                get_llm_client(), 'user_profile', prompt=prompt
+            )
 
             # 记录token使用
-            if 'usage' in response:
-                usage = response['usage']
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                if input_tokens > 0 or output_tokens > 0:
-                    try:
-                        user = await User.objects.aget(id=self.user_id)
-                        await TokenUsageService.record_token_usage(
-                            user=user,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            api_type='agent_execution',
-                            metadata={
-                                'function': 'generate_user_profile',
-                                'conversation_id': self.conversation_id
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"记录token使用失败: {e}")
+            self._record_usage(response, 'generate_user_profile')
 
             return response
 
@@ -196,46 +178,27 @@ class MemoryManager:
             str: 生成的摘要 / Generated summary
         """
         try:
-            # 获取最近的消息 / Get recent messages
-            messages = await Message.objects.filter(
-                conversation_id=self.conversation_id
-            ).order_by('-created_at')[:10]
+            # 获取最近的消息（缓存的消息尾部） / Get recent messages (cached message tail)
+            messages = await MessageTail.aget_recent(self.conversation_id, 10)
 
             if not messages:
                 return ""
 
             # 准备消息历史 / Prepare message history
             messages_text = "\n".join([
-                f"{msg.role}: {msg.content[:300]}..."
-                for msg in reversed(messages)
+                f"{msg['role']}: {msg['content'][:300]}..."
+                for msg in messages
             ])
 
             prompt = MEMORY_COMPRESSION_PROMPT.format(messages=messages_text)
 
             # 调用LLM生成摘要 / Call LLM to generate summary
-            llm_client = get_llm_client()
-            response = await llm_client.generate_json(prompt=prompt)
+            response, _ = await get_model_router().generate_json(
+                get_llm_client(), 'session_summary', prompt=prompt
+            )
 
             # 记录token使用
-            if 'usage' in response:
-                usage = response['usage']
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                if input_tokens > 0 or output_tokens > 0:
-                    try:
-                        user = await User.objects.aget(id=self.user_id)
-                        await TokenUsageService.record_token_usage(
-                            user=user,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            api_type='agent_execution',
-                            metadata={
-                                'function': 'generate_session_summary',
-                                'conversation_id': self.conversation_id
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"记录token使用失败: {e}")
+            self._record_usage(response, 'generate_session_summary')
 
             return response.get("summary", "")
 
@@ -247,6 +210,9 @@ class MemoryManager:
         """
         获取相关记忆 / Get relevant memories
 
+        通过用户的记忆倒排索引召回，按相关性、重要性和时效性综合排序
+        Recalled through the user's memory inverted index, ranked by relevance, importance and recency
+
         Args:
             query: 查询内容 / Query content
 
@@ -254,97 +220,112 @@ class MemoryManager:
             List[Dict]: 相关记忆列表 / List of relevant memories
         """
         try:
-            # 搜索相关记忆 / Search relevant memories
-            memories = await AgentMemory.objects.filter(
-                user_id=self.user_id,
-                expires_at__isnull=True  # 未过期 / Not expired
-            ).filter(
-                # 简单关键词匹配 / Simple keyword matching
-                content__icontains=query
-            ).order_by('-importance', '-access_count', '-updated_at')[:5]
-
-            # 更新访问计数 / Update access count
-            for memory in memories:
-                memory.access_count += 1
-                memory.last_accessed = timezone.now()
-                await memory.asave()
+            ranked = await MemoryIndex.asearch(self.user_id, query, limit=5)
 
             return [
                 {
                     "type": mem.memory_type,
                     "content": mem.content,
                     "importance": mem.importance,
-                    "related_concept": mem.related_concept
+                    "related_concept": mem.related_concept,
+                    "score": round(score, 3)
                 }
-                for mem in memories
+                for score, mem in ranked
             ]
 
         except Exception as e:
             logger.error(f"获取相关记忆失败: {e}")
             return []
 
-    async def compress_and_save_session(self, messages: List[Dict[str, Any]]):
-        """
-        压缩并保存会话历史 / Compress and save session history
-
-        Args:
-            messages: 消息列表 / List of messages
+    async def compress_and_save_session(self, min_new_messages: int = 1) -> int:
         """
-        try:
-            if not messages:
-                return
-
-            # 生成压缩摘要 / Generate compressed summary
-            messages_text = "\n".join([
-                f"{msg.get('role', 'unknown')}: {msg.get('content', '')[:300]}..."
-                for msg in messages[-20:]  # 最近20条消息 / Last 20 messages
-            ])
+        增量压缩并保存会话历史 / Incrementally compress and save session history
 
-            prompt = MEMORY_COMPRESSION_PROMPT.format(messages=messages_text)
+        只读取上次压缩之后的新消息，与已有摘要合并后生成新摘要；
+        由后台任务调用，异常向上抛出以便任务重试。
+        Only messages newer than the last compression are read and merged with the
+        existing summary. Called from a background job; errors propagate for retry.
 
-            llm_client = get_llm_client()
-            response = await llm_client.generate_json(prompt=prompt)
+        Args:
+            min_new_messages: 新消息少于该数量时跳过 / Skip when fewer new messages
 
-            # 记录token使用
-            if 'usage' in response:
-                usage = response['usage']
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                if input_tokens > 0 or output_tokens > 0:
-                    try:
-                        user = await User.objects.aget(id=self.user_id)
-                        await TokenUsageService.record_token_usage(
-                            user=user,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            api_type='agent_execution',
-                            metadata={
-                                'function': 'compress_and_save_session',
-                                'conversation_id': self.conversation_id
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"记录token使用失败: {e}")
-
-            # 保存到对话摘要 / Save to conversation summary
-            conversation = await Conversation.objects.aget(id=self.conversation_id)
-            conversation.summary = response.get("summary", "")
-            conversation.message_count = len(messages)
-            await conversation.asave()
-
-            # 保存关键记忆 / Save key memories
-            key_points = response.get("key_points", [])
-            for point in key_points:
-                await AgentMemory.objects.acreate(
+        Returns:
+            int: 本次压缩的消息数 / Number of messages compressed
+        """
+        conversation = await Conversation.objects.only(
+            'id', 'summary', 'summarized_at'
+        ).aget(id=self.conversation_id)
+
+        queryset = Message.objects.filter(conversation_id=self.conversation_id)
+        if conversation.summarized_at:
+            queryset = queryset.filter(created_at__gt=conversation.summarized_at)
+        new_messages = [
+            msg async for msg in queryset.only('role', 'content', 'created_at')
+            .order_by('created_at')[:self.COMPRESSION_BATCH_SIZE]
+        ]
+
+        if not new_messages or len(new_messages) < min_new_messages:
+            return 0
+
+        # 生成压缩摘要 / Generate compressed summary
+        messages_text = "\n".join([
+            f"{msg.role}: {msg.content[:300]}..."
+            for msg in new_messages
+        ])
+        if conversation.summary:
+            messages_text = f"已有摘要 / Previous summary: {conversation.summary}\n\n{messages_text}"
+
+        prompt = MEMORY_COMPRESSION_PROMPT.format(messages=messages_text)
+
+        # 会话压缩不在回答的关键路径上，走后台通道 / Off the answer path, use background lane
+        response, _ = await get_model_router().generate_json(
+            get_llm_client(), 'session_summary', prompt=prompt, lane=LaneScheduler.BACKGROUND
+        )
+
+        # 记录token使用
+        self._record_usage(response, 'compress_and_save_session')
+
+        # 保存到对话摘要并推进水位 / Save summary and advance the watermark
+        await Conversation.objects.filter(id=self.conversation_id).aupdate(
+            summary=response.get("summary", "") or conversation.summary,
+            summarized_at=new_messages[-1].created_at
+        )
+
+        # 批量保存关键记忆 / Bulk save key memories
+        key_points = [point for point in response.get("key_points", []) if point]
+        if key_points:
+            memories = await AgentMemory.objects.abulk_create([
+                AgentMemory(
                     user_id=self.user_id,
                     memory_type="conversation",
                     content=point,
                     importance=0.5,
                     related_concept=""
                 )
+                for point in key_points
+            ])
+            # bulk_create不触发信号，显式建立索引 / bulk_create skips signals, index explicitly
+            await MemoryIndex.aindex_memories(memories)
 
-        except Exception as e:
-            logger.error(f"压缩会话历史失败: {e}")
+        return len(new_messages)
+
+    def _record_usage(self, response: Dict[str, Any], function: str):
+        """
+        记录token使用（非阻塞，批量落库） / Record token usage (non-blocking, flushed in batches)
+
+        Args:
+            response: LLM响应 / LLM response
+            function: 调用函数名 / Calling function name
+        """
+        TokenUsageService.enqueue_llm_usage(
+            self.user_id,
+            response,
+            api_type='agent_execution',
+            metadata={
+                'function': function,
+                'conversation_id': str(self.conversation_id)
+            }
+        )
 
     def update_working_memory(self, key: str, value: Any):
         """
@@ -0,0 +1,188 @@
+"""
+记忆索引模块 / Memory Index Module
+
+为AgentMemory维护按用户划分的倒排索引，并按相关性、重要性和时效性综合排序召回
+Maintains a per-user inverted index over AgentMemory and ranks recall by relevance, importance and recency
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from apps.agent.models import AgentMemory, AgentMemoryTerm
+
+# 英文/数字词 与 连续的中日韩字符 / Latin words and runs of CJK characters
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+_STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'of', 'to', 'in', 'on', 'and', 'or', 'for',
+    'what', 'how', 'why', 'i', 'me', 'my', 'you', 'it', 'this', 'that', 'be', 'do',
+    '什么', '怎么', '如何', '为什', '一个', '这个', '那个', '我们', '你们', '是不', '可以',
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词 / Tokenize text
+
+    英文按单词切分，中文按相邻字符二元组切分（单字成词时保留单字）。
+    Latin text is split into words; CJK runs become character bigrams (single characters kept as-is).
+
+    Args:
+        text: 文本 / Text
+
+    Returns:
+        List[str]: 词项列表（可能重复） / Terms (may repeat)
+    """
+    terms = []
+    for token in _TOKEN_RE.findall((text or '').lower()):
+        if token[0].isascii():
+            if len(token) > 1 and token not in _STOPWORDS:
+                terms.append(token[:64])
+        elif len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(
+                token[i:i + 2] for i in range(len(token) - 1)
+                if token[i:i + 2] not in _STOPWORDS
+            )
+    return terms
+
+
+def term_weights(text: str) -> Dict[str, float]:
+    """
+    计算归一化词频 / Compute normalized term frequencies
+
+    Returns:
+        Dict[str, float]: 词项 -> 权重(0-1] / Term -> weight in (0, 1]
+    """
+    counts = Counter(tokenize(text))
+    if not counts:
+        return {}
+    top = max(counts.values())
+    return {term: count / top for term, count in counts.items()}
+
+
+class MemoryIndex:
+    """Agent记忆倒排索引 / Agent memory inverted index"""
+
+    CANDIDATE_LIMIT = 50  # 从索引中取出的候选数 / Candidates pulled from the index
+    RECENCY_HALF_LIFE_DAYS = 30.0  # 时效性半衰期 / Recency half-life
+
+    # 综合评分权重 / Blended score weights
+    RELEVANCE_WEIGHT = 0.6
+    IMPORTANCE_WEIGHT = 0.25
+    RECENCY_WEIGHT = 0.15
+
+    @staticmethod
+    def build_terms(memories: Iterable[AgentMemory]) -> List[AgentMemoryTerm]:
+        """为记忆生成索引项 / Build index rows for memories"""
+        rows = []
+        for memory in memories:
+            text = f"{memory.content} {memory.related_concept or ''}"
+            for term, weight in term_weights(text).items():
+                rows.append(AgentMemoryTerm(
+                    memory_id=memory.id,
+                    user_id=memory.user_id,
+                    term=term,
+                    weight=weight
+                ))
+        return rows
+
+    @classmethod
+    def index_memories(cls, memories: Iterable[AgentMemory]):
+        """
+        （重新）索引记忆 / (Re)index memories
+
+        Args:
+            memories: 记忆列表 / Memories
+        """
+        memories = list(memories)
+        if not memories:
+            return
+        AgentMemoryTerm.objects.filter(memory_id__in=[m.id for m in memories]).delete()
+        AgentMemoryTerm.objects.bulk_create(cls.build_terms(memories), ignore_conflicts=True)
+
+    @classmethod
+    async def aindex_memories(cls, memories: Iterable[AgentMemory]):
+        """异步（重新）索引记忆 / Async (re)index memories"""
+        memories = list(memories)
+        if not memories:
+            return
+        await AgentMemoryTerm.objects.filter(memory_id__in=[m.id for m in memories]).adelete()
+        await AgentMemoryTerm.objects.abulk_create(cls.build_terms(memories), ignore_conflicts=True)
+
+    @classmethod
+    def _candidates_queryset(cls, user_id, terms: List[str]):
+        """
+        候选查询：一次走(user, term)索引的连接查询 / Candidate query: one join on the (user, term) index
+        """
+        now = timezone.now()
+        return AgentMemory.objects.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+            user_id=user_id,
+            index_terms__user_id=user_id,
+            index_terms__term__in=terms,
+        ).annotate(
+            matched_terms=Count('index_terms'),
+            matched_weight=Sum('index_terms__weight')
+        ).order_by('-matched_terms', '-matched_weight', '-importance', '-updated_at')[:cls.CANDIDATE_LIMIT]
+
+    @classmethod
+    def score(cls, memory: AgentMemory, query_term_count: int, now=None) -> float:
+        """
+        综合评分 / Blended score
+
+        relevance = 查询词项覆盖率为主，命中词项在记忆中的词频为辅 / mostly query-term coverage, plus matched term frequency
+        recency = 按半衰期指数衰减 / exponential decay by half-life
+        """
+        now = now or timezone.now()
+        coverage = min(1.0, memory.matched_terms / max(1, query_term_count))
+        density = (memory.matched_weight or 0.0) / max(1, memory.matched_terms)
+        relevance = 0.8 * coverage + 0.2 * density
+        age_days = max(0.0, (now - memory.updated_at).total_seconds() / 86400)
+        recency = math.pow(0.5, age_days / cls.RECENCY_HALF_LIFE_DAYS)
+        importance = max(0.0, min(1.0, memory.importance))
+        return (
+            cls.RELEVANCE_WEIGHT * relevance
+            + cls.IMPORTANCE_WEIGHT * importance
+            + cls.RECENCY_WEIGHT * recency
+        )
+
+    @classmethod
+    def _rank(cls, candidates: List[AgentMemory], query_term_count: int, limit: int) -> List[Tuple[float, AgentMemory]]:
+        now = timezone.now()
+        ranked = [(cls.score(memory, query_term_count, now), memory) for memory in candidates]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return ranked[:limit]
+
+    @classmethod
+    async def asearch(cls, user_id, query: str, limit: int = 5) -> List[Tuple[float, AgentMemory]]:
+        """
+        召回并排序记忆，批量更新访问计数 / Recall and rank memories, bulk-update access counters
+
+        Args:
+            user_id: 用户ID / User ID
+            query: 查询内容 / Query
+            limit: 返回数量 / Number of results
+
+        Returns:
+            List[Tuple[float, AgentMemory]]: (评分, 记忆) / (score, memory)
+        """
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+
+        candidates = [memory async for memory in cls._candidates_queryset(user_id, terms)]
+        ranked = cls._rank(candidates, len(terms), limit)
+
+        if ranked:
+            await AgentMemory.objects.filter(
+                id__in=[memory.id for _, memory in ranked]
+            ).aupdate(access_count=F('access_count') + 1, last_accessed=timezone.now())
+
+        return ranked
@@ -0,0 +1,192 @@
+"""
+执行计划缓存 / Execution Plan Cache
+
+同一文档上的相似问题（"定理3是什么"、"explain eq. 2.1"）产生相同形态的计划。按规范化意图指纹
+（小写、屏蔽编号/公式/引用等实体）、文档ID和工具目录版本缓存计划，命中时跳过规划LLM调用，
+并把当前问题的实体代回计划。
+Similar questions on the same document ("what is theorem 3", "explain eq. 2.1") yield plans of
+the same shape. Plans are cached by a normalized intent fingerprint (lowercased, with numbers,
+formulas and quotes masked), document ID and tool catalogue version; a hit skips the planner
+LLM call and substitutes the current question's entities back into the plan.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+
+from apps.agent.tools.registry import ToolRegistry
+from core.llm_cache import LLMCache
+
+from .prompts import PLANNER_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# 实体：行内公式、引号内容、编号 / Entities: inline math, quoted text, reference numbers
+_ENTITY_RE = re.compile(
+    r'(?P<math>\$[^$]+\$)'
+    r'|(?P<quote>"[^"]+"|“[^”]+”|「[^」]+」|《[^》]+》)'
+    r'|(?P<num>\d+(?:[.\-]\d+)*)'
+)
+# 指纹中忽略的标点 / Punctuation ignored in fingerprints
+_PUNCT_RE = re.compile(r'[^\w<>]+')
+# 计划模板中的实体占位符 / Entity placeholder in plan templates
+_SLOT_RE = re.compile(r'⟦(\d+)⟧')
+
+
+def _extract_entities(text: str) -> Tuple[str, List[Tuple[str, str, str]]]:
+    """
+    提取实体 / Extract entities
+
+    Returns:
+        Tuple[str, List]: (屏蔽后的文本, [(实体, 类型, 锚点)]) / (masked text, [(entity, kind, anchor)])
+        锚点是实体前最后一个非空白字符，用于在计划中定位同一实体 / The anchor is the last
+        non-space character before the entity, used to locate the same entity in the plan
+    """
+    text = unicodedata.normalize('NFKC', text or '')
+    entities: List[Tuple[str, str, str]] = []
+
+    def mask(match):
+        before = text[:match.start()].rstrip()
+        entities.append((match.group(0), match.lastgroup, before[-1:]))
+        return f' <{match.lastgroup}> '
+
+    return _ENTITY_RE.sub(mask, text), entities
+
+
+def intent_fingerprint(text: str) -> Tuple[str, List[str]]:
+    """
+    规范化意图指纹 / Normalized intent fingerprint
+
+    Returns:
+        Tuple[str, List[str]]: (指纹, 按出现顺序的实体) / (fingerprint, entities in order of appearance)
+    """
+    masked, entities = _extract_entities(text)
+    return ' '.join(_PUNCT_RE.sub(' ', masked.lower()).split()), [entity for entity, _, _ in entities]
+
+
+def _entity_pattern(entity: str, kind: str, anchor: str) -> re.Pattern:
+    """
+    JSON文本中实体的匹配模式 / Pattern of an entity in JSON text
+
+    编号必须跟在与问题中相同的锚点之后（"定理3"而不是"共3步"），且不匹配更长编号的一部分。
+    Numbers must follow the same anchor as in the question ("theorem 3", not "3 steps") and never
+    match inside a longer number.
+    """
+    escaped = re.escape(json.dumps(entity, ensure_ascii=False)[1:-1])
+    if kind != 'num':
+        return re.compile(f'()({escaped})')
+    prefix = rf'({re.escape(anchor)}\s*)' if anchor else r'((?<![\d.]))'
+    return re.compile(rf'{prefix}({escaped})(?![\d.])')
+
+
+def mask_plan(plan: Dict[str, Any], user_input: str) -> str:
+    """把计划中出现的问题实体替换为占位符 / Replace the question's entities in a plan with placeholders"""
+    text = json.dumps(plan, ensure_ascii=False)
+    _, entities = _extract_entities(user_input)
+    for index, (entity, kind, anchor) in sorted(enumerate(entities), key=lambda item: -len(item[1][0])):
+        text = _entity_pattern(entity, kind, anchor).sub(lambda m: f'{m.group(1)}⟦{index}⟧', text)
+    return text
+
+
+def fill_plan(template: str, entities: List[str]) -> Optional[Dict[str, Any]]:
+    """用当前问题的实体填充计划模板，无法填充时返回None / Fill a plan template with the current entities, None if impossible"""
+    try:
+        text = _SLOT_RE.sub(lambda m: json.dumps(entities[int(m.group(1))], ensure_ascii=False)[1:-1], template)
+        return json.loads(text)
+    except (IndexError, ValueError):
+        return None
+
+
+class PlanCache:
+    """执行计划缓存 / Execution plan cache"""
+
+    KEY_PREFIX = 'agent_plan'
+    TIMEOUT = 86400  # 24小时 / 24 hours
+
+    STATS_PREFIX = 'agent_plan:stats'
+    STATS_FIELDS = ('hits', 'misses', 'sets', 'saved_ms')
+
+    @classmethod
+    def _make_key(cls, fingerprint: str, document_id: Optional[str]) -> str:
+        """
+        缓存键：工具目录或规划模板变化后旧计划自然失效
+        Cache key: old plans expire naturally when the tool catalogue or planner template changes
+        """
+        digest = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+        namespace = LLMCache.template_namespace(PLANNER_PROMPT)
+        return f'{cls.KEY_PREFIX}:{ToolRegistry.catalogue_version()}:{namespace}:{document_id or "-"}:{digest}'
+
+    @staticmethod
+    def is_valid_plan(plan: Any) -> bool:
+        """只缓存结构完整的计划 / Only well-formed plans are cached"""
+        return isinstance(plan, dict) and isinstance(plan.get('plan'), list) and 'needs_tools' in plan
+
+    @classmethod
+    async def aget(cls, user_input: str, document_id: Optional[str] = None) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        查找缓存的计划 / Look up a cached plan
+
+        Returns:
+            Optional[Tuple[Dict, float]]: (计划, 原规划耗时ms)，未命中时为None / (plan, original planning ms), None on miss
+        """
+        fingerprint, entities = intent_fingerprint(user_input)
+        entry = await cache.aget(cls._make_key(fingerprint, document_id))
+        plan = fill_plan(entry['plan'], entities) if entry else None
+
+        if plan is None:
+            await cls._incr('misses')
+            return None
+        await cls._incr('hits')
+        await cls._incr('saved_ms', int(entry.get('plan_ms', 0)))
+        return plan, entry.get('plan_ms', 0.0)
+
+    @classmethod
+    async def aset(cls, user_input: str, plan: Dict[str, Any], plan_ms: float,
+                   document_id: Optional[str] = None) -> None:
+        """
+        缓存计划 / Cache a plan
+
+        Args:
+            user_input: 用户输入 / User input
+            plan: 规划结果 / Planner output
+            plan_ms: 规划耗时（毫秒），命中时计入节省的延迟 / Planning latency (ms), counted as saved on hits
+            document_id: 文档ID / Document ID
+        """
+        if not cls.is_valid_plan(plan):
+            return
+        fingerprint, _ = intent_fingerprint(user_input)
+        entry = {'plan': mask_plan(plan, user_input), 'plan_ms': round(plan_ms, 1)}
+        await cache.aset(cls._make_key(fingerprint, document_id), entry, cls.TIMEOUT)
+        await cls._incr('sets')
+
+    @classmethod
+    async def _incr(cls, field: str, delta: int = 1) -> None:
+        """累加统计计数（跨进程共享，失败时忽略） / Add to a stats counter (shared across processes, errors ignored)"""
+        if not delta:
+            return
+        key = f'{cls.STATS_PREFIX}:{field}'
+        try:
+            if not await cache.aadd(key, delta, None):
+                await cache.aincr(key, delta)
+        except Exception as e:
+            logger.debug(f"更新计划缓存统计失败: {e}")
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """命中、未命中、写入次数、命中率和节省的规划延迟 / Hits, misses, sets, hit rate and saved planning latency"""
+        keys = {f'{cls.STATS_PREFIX}:{field}': field for field in cls.STATS_FIELDS}
+        values = cache.get_many(list(keys))
+        stats = {field: int(values.get(key, 0)) for key, field in keys.items()}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        """重置统计计数 / Reset stats counters"""
+        cache.delete_many([f'{cls.STATS_PREFIX}:{field}' for field in cls.STATS_FIELDS])
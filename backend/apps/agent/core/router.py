@@ -0,0 +1,160 @@
+"""
+模型路由 / Model Routing
+
+按本轮对话的复杂度和调用点为每次LLM调用选择模型档位：简单意图和后台摘要走快速档，
+复杂的多步推理走强档；JSON解析失败时按配置升级到下一档（模型不同时）重试。
+Picks a model tier per LLM call from the turn's complexity and the call site: simple intents and
+background summaries use the fast tier, complex multi-step reasoning uses the strong tier; a JSON
+parse failure escalates to the next tier when configured and it uses a different model.
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRouter:
+    """模型档位路由器 / Model tier router"""
+
+    FAST = 'fast'
+    STRONG = 'strong'
+    TIER_ORDER = [FAST, STRONG]  # 升级顺序 / Escalation order
+
+    SIMPLE = 'simple'
+    COMPLEX = 'complex'
+
+    # 调用点 -> {复杂度: 档位} / Call site -> {complexity: tier}
+    ROUTES = {
+        'plan': {SIMPLE: FAST, COMPLEX: STRONG},
+        'think': {SIMPLE: FAST, COMPLEX: STRONG},
+        'user_profile': {SIMPLE: FAST, COMPLEX: FAST},
+        'session_summary': {SIMPLE: FAST, COMPLEX: FAST},
+    }
+
+    SIMPLE_MAX_CHARS = 80  # 超过该长度的输入不视为简单意图 / Longer inputs are never simple
+
+    # 简单意图：定义、解释、总结、翻译 / Simple intents: define, explain, summarize, translate
+    _SIMPLE_RE = re.compile(
+        r'什么是|是什么|定义|含义|意思|解释一下|总结|概括|摘要|翻译'
+        r'|\b(define|definition|what is|what are|meaning|summari[sz]e|tl;?dr|translate)\b',
+        re.IGNORECASE
+    )
+    # 多步推理线索 / Multi-step reasoning cues
+    _COMPLEX_RE = re.compile(
+        r'比较|对比|证明|推导|为什么|分析|步骤|然后|并且|计划|设计|区别'
+        r'|\b(compare|prove|derive|why|analy[sz]e|step|then|plan|design|difference)\b',
+        re.IGNORECASE
+    )
+
+    def __init__(self, tiers: Optional[Dict[str, str]] = None, escalation: bool = True):
+        """
+        Args:
+            tiers: 档位 -> 模型名称，缺省的档位使用客户端默认模型 / Tier -> model name, missing tiers use the client default
+            escalation: JSON解析失败时是否升级档位重试 / Whether to escalate on JSON parse failure
+        """
+        self.tiers = tiers or {}
+        self.escalation = escalation
+
+    @classmethod
+    def classify(cls, user_input: str, context: Optional[Dict[str, Any]] = None,
+                 plan: Optional[Dict[str, Any]] = None) -> str:
+        """
+        判断本轮复杂度 / Classify the turn's complexity
+
+        有计划时以计划为准：不需要工具为简单，预估多个工具或多个步骤为复杂；否则按输入启发式判断。
+        With a plan, the plan decides: no tools is simple, several tools or steps is complex;
+        otherwise input heuristics decide.
+
+        Returns:
+            str: SIMPLE 或 COMPLEX / SIMPLE or COMPLEX
+        """
+        if plan:
+            if not plan.get('needs_tools', False):
+                return cls.SIMPLE
+            if len(plan.get('estimated_tools') or []) > 1 or len(plan.get('plan') or []) > 2:
+                return cls.COMPLEX
+
+        text = (user_input or '').strip()
+        if len(text) > cls.SIMPLE_MAX_CHARS or cls._COMPLEX_RE.search(text):
+            return cls.COMPLEX
+        if cls._SIMPLE_RE.search(text):
+            return cls.SIMPLE
+        # 选中文本的简单操作也视为简单 / Simple actions on a selection count as simple
+        if context and context.get('selection') and len(text) <= cls.SIMPLE_MAX_CHARS // 2:
+            return cls.SIMPLE
+        return cls.COMPLEX
+
+    def tier_for(self, site: str, complexity: str) -> str:
+        """调用点和复杂度对应的档位 / Tier for a call site and complexity"""
+        return self.ROUTES.get(site, {}).get(complexity, self.STRONG)
+
+    def _escalation_chain(self, tier: str, default_model: str) -> List[Tuple[str, str]]:
+        """
+        从指定档位开始的(档位, 模型)链 / (tier, model) chain starting at a tier
+
+        模型已在链中出现的档位跳过：升级到同一模型只会重复同一次调用（还可能命中响应缓存）。
+        Tiers whose model is already in the chain are skipped: escalating to the same model would
+        only repeat the same call (and may even hit the response cache).
+        """
+        tiers = [tier]
+        if self.escalation and tier in self.TIER_ORDER:
+            tiers = self.TIER_ORDER[self.TIER_ORDER.index(tier):]
+
+        chain, seen = [], set()
+        for name in tiers:
+            model = self.tiers.get(name) or default_model
+            if model not in seen:
+                seen.add(model)
+                chain.append((name, model))
+        return chain
+
+    async def generate_json(self, llm_client, site: str, complexity: str = COMPLEX,
+                            **kwargs) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        按路由调用generate_json / Call generate_json according to the route
+
+        Args:
+            llm_client: LLM客户端 / LLM client
+            site: 调用点 / Call site
+            complexity: 本轮复杂度 / Turn complexity
+            **kwargs: 传给generate_json的参数 / Arguments for generate_json
+
+        Returns:
+            Tuple[Dict, Dict]: (响应, 路由决策) / (response, routing decision)
+
+        Raises:
+            ValueError: 所有档位都返回了无效JSON / Every tier returned invalid JSON
+        """
+        chain = self._escalation_chain(self.tier_for(site, complexity), llm_client.default_model)
+        decision = {'complexity': complexity, 'tier': chain[0][0], 'model': None, 'escalated': False}
+
+        for attempt, (tier, model) in enumerate(chain):
+            decision.update(tier=tier, model=model, escalated=attempt > 0)
+            try:
+                response = await llm_client.generate_json(model=model, **kwargs)
+                return response, decision
+            except ValueError as e:
+                if attempt == len(chain) - 1:
+                    raise
+                logger.warning(f"{site} returned invalid JSON on tier {tier}, escalating: {e}")
+
+
+_global_router = None
+
+
+def get_model_router() -> ModelRouter:
+    """
+    获取全局模型路由器（单例），配置从Django设置读取
+    Get the global model router (singleton), configured from Django settings
+    """
+    global _global_router
+    if _global_router is None:
+        _global_router = ModelRouter(
+            tiers=getattr(settings, 'AGENT_MODEL_TIERS', None),
+            escalation=getattr(settings, 'AGENT_MODEL_ESCALATION', True),
+        )
+    return _global_router
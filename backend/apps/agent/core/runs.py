@@ -0,0 +1,339 @@
+"""
+Agent运行管理 / Agent Run Management
+
+Agent运行与WebSocket连接解耦：运行在服务端独立执行，事件带序号写入缓存并广播到对话分组。
+客户端重连后可从上次收到的序号继续接收，多个标签页订阅同一运行而不重复执行。
+Agent runs are decoupled from WebSocket connections: a run executes server-side, its events are
+sequence-numbered, buffered in the cache and broadcast to the conversation group. Reconnecting
+clients resume from their last seen sequence and several tabs share one run.
+"""
+
+import asyncio
+import logging
+import uuid
+from typing import Any, Dict, List, Optional
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.utils import timezone
+
+from apps.agent.models import AgentTask, Conversation, Message
+
+from .executor import ScholarAgent
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_group(conversation_id) -> str:
+    """对话的广播分组名 / Broadcast group name of a conversation"""
+    return f'agent_conversation_{conversation_id}'
+
+
+class RunEventLog:
+    """
+    运行事件日志 / Run event log
+
+    每个事件单独缓存，键中带序号；元数据记录最后序号、运行状态以及所属对话和用户。
+    每个运行只有一个写入者，因此序号在进程内递增即可。
+    Each event is cached under its own sequence-numbered key; metadata tracks the last
+    sequence, run status and the owning conversation and user. A run has a single writer,
+    so an in-process counter suffices.
+    """
+
+    KEY_PREFIX = 'agent_run'
+    TIMEOUT = 3600  # 事件保留时间（秒） / Event retention (seconds)
+
+    def __init__(self, run_id: str, conversation_id: Optional[str] = None, user_id: Optional[str] = None):
+        self.run_id = run_id
+        self.conversation_id = str(conversation_id) if conversation_id is not None else None
+        self.user_id = str(user_id) if user_id is not None else None
+        self.seq = 0
+        self.status = 'running'
+
+    @classmethod
+    def _event_key(cls, run_id: str, seq: int) -> str:
+        return f'{cls.KEY_PREFIX}:{run_id}:event:{seq}'
+
+    @classmethod
+    def _meta_key(cls, run_id: str) -> str:
+        return f'{cls.KEY_PREFIX}:{run_id}:meta'
+
+    def _meta(self) -> Dict[str, Any]:
+        return {
+            'last_seq': self.seq, 'status': self.status,
+            'conversation_id': self.conversation_id, 'user_id': self.user_id,
+        }
+
+    async def append(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        追加事件并分配序号 / Append an event and assign its sequence number
+
+        Returns:
+            Dict: 带run_id和seq的事件 / Event with run_id and seq
+        """
+        self.seq += 1
+        event = {**event, 'run_id': self.run_id, 'seq': self.seq}
+        await cache.aset_many({
+            self._event_key(self.run_id, self.seq): event,
+            self._meta_key(self.run_id): self._meta(),
+        }, self.TIMEOUT)
+        return event
+
+    async def set_status(self, status: str):
+        """更新运行状态 / Update run status"""
+        self.status = status
+        await cache.aset(self._meta_key(self.run_id), self._meta(), self.TIMEOUT)
+
+    @classmethod
+    async def aget_meta(cls, run_id: str) -> Optional[Dict[str, Any]]:
+        """获取运行元数据 / Get run metadata"""
+        return await cache.aget(cls._meta_key(run_id))
+
+    @staticmethod
+    def owned_by(meta: Dict[str, Any], conversation_id=None, user_id=None) -> bool:
+        """运行是否属于指定的对话和用户 / Whether the run belongs to the given conversation and user"""
+        if conversation_id is not None and meta.get('conversation_id') != str(conversation_id):
+            return False
+        if user_id is not None and meta.get('user_id') != str(user_id):
+            return False
+        return True
+
+    @classmethod
+    async def replay(cls, run_id: str, after_seq: int = 0,
+                     conversation_id=None, user_id=None) -> List[Dict[str, Any]]:
+        """
+        读取指定序号之后的事件 / Read events after a sequence number
+
+        Args:
+            run_id: 运行ID / Run ID
+            after_seq: 客户端最后收到的序号 / Last sequence seen by the client
+            conversation_id: 指定时只重放属于该对话的运行 / When given, only replay runs of this conversation
+            user_id: 指定时只重放属于该用户的运行 / When given, only replay runs of this user
+
+        Returns:
+            List[Dict]: 按序号排列的事件，运行不存在或不属于指定对话/用户时为空
+            Events in sequence order; empty if the run is missing or owned by another conversation/user
+        """
+        meta = await cls.aget_meta(run_id)
+        if not meta or not cls.owned_by(meta, conversation_id, user_id):
+            return []
+        keys = [cls._event_key(run_id, seq) for seq in range(after_seq + 1, meta['last_seq'] + 1)]
+        if not keys:
+            return []
+        events = await cache.aget_many(keys)
+        return [events[key] for key in keys if key in events]
+
+
+class AgentRun:
+    """
+    单次Agent运行 / A single agent run
+
+    负责消息与任务记录的持久化、执行Agent、记录并广播事件。
+    Persists the message and task records, executes the agent, logs and broadcasts events.
+    """
+
+    def __init__(self, run_id: str, user_id: str, conversation_id: str, document_id: Optional[str] = None):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.document_id = document_id
+        self.group = conversation_group(conversation_id)
+        self.log = RunEventLog(run_id, conversation_id, user_id)
+        self.channel_layer = get_channel_layer()
+
+    async def publish(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        记录并广播事件 / Log and broadcast an event
+        """
+        event = await self.log.append(event)
+        if self.channel_layer is not None:
+            try:
+                await self.channel_layer.group_send(self.group, {'type': 'agent.event', 'event': event})
+            except Exception as e:
+                # 订阅者可通过重放补齐 / Subscribers can catch up by replaying
+                logger.warning(f"Broadcast agent event failed: {e}")
+        return event
+
+    async def execute(self, content: str, context: Dict[str, Any]):
+        """
+        执行运行 / Execute the run
+
+        Args:
+            content: 查询内容 / Query content
+            context: 查询上下文 / Query context
+        """
+        task = None
+        status = 'failed'
+
+        try:
+            message = await self.save_message(content, context, 'user')
+            task = await self.create_task(message)
+            agent = ScholarAgent(
+                user_id=self.user_id,
+                conversation_id=self.conversation_id,
+                document_id=self.document_id
+            )
+
+            async for event in agent.run(content, context):
+                await self.publish(event)
+
+                if event.get('type') == 'answer':
+                    await self.save_message(event['data']['content'], {}, 'assistant')
+                    status = 'completed'
+                    break
+
+                if await AgentRunManager.cancel_requested(self.run_id):
+                    raise asyncio.CancelledError()
+
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            logger.info(f"Agent run {self.run_id} cancelled")
+            await self.publish({"type": "cancelled", "message": "查询已取消"})
+            if task:
+                await self.update_task_status(task, 'cancelled')
+
+        except Exception as e:
+            logger.error(f"Agent run {self.run_id} failed: {e}")
+            await self.publish({
+                "type": "error",
+                "message": "Agent执行出错",
+                "code": "execution_error"
+            })
+            if task:
+                await self.update_task_status(task, 'failed', str(e))
+
+        finally:
+            await self.log.set_status(status)
+            await AgentRunManager.release(self)
+
+    @database_sync_to_async
+    def save_message(self, content: str, context: Dict[str, Any], role: str) -> Message:
+        """
+        保存消息到数据库 / Save message to database
+        """
+        message = Message.objects.create(
+            conversation_id=self.conversation_id,
+            role=role,
+            content=content,
+            context_data=context,
+            context_type=context.get('type', 'none') if context else 'none'
+        )
+
+        # 更新对话的消息计数 / Update conversation message count
+        conversation = Conversation.objects.get(id=self.conversation_id)
+        conversation.message_count += 1
+        conversation.updated_at = timezone.now()
+        conversation.save()
+
+        return message
+
+    @database_sync_to_async
+    def create_task(self, message: Message) -> AgentTask:
+        """创建任务记录 / Create task record"""
+        return AgentTask.objects.create(
+            conversation_id=self.conversation_id,
+            message=message,
+            status='executing'
+        )
+
+    @database_sync_to_async
+    def update_task_status(self, task: AgentTask, status: str, error_message: str = ""):
+        """更新任务状态 / Update task status"""
+        try:
+            task.status = status
+            if error_message:
+                task.error_message = error_message
+            task.completed_at = timezone.now()
+            task.save()
+        except Exception as e:
+            logger.error(f"Update task status error: {e}")
+
+
+class AgentRunManager:
+    """
+    Agent运行管理器 / Agent run manager
+
+    每个对话同一时间最多一个活动运行，通过缓存原子占位保证跨进程唯一。
+    At most one active run per conversation, enforced across processes by an atomic cache claim.
+    """
+
+    ACTIVE_TIMEOUT = 900  # 活动运行占位的最长时间（秒） / Max lifetime of an active-run claim (seconds)
+
+    # 本进程内执行中的运行 / Runs executing in this process
+    _tasks: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _active_key(conversation_id) -> str:
+        return f'{RunEventLog.KEY_PREFIX}:conversation:{conversation_id}'
+
+    @staticmethod
+    def _cancel_key(run_id: str) -> str:
+        return f'{RunEventLog.KEY_PREFIX}:{run_id}:cancel'
+
+    @classmethod
+    async def get_active_run(cls, conversation_id) -> Optional[Dict[str, Any]]:
+        """
+        获取对话的活动运行 / Get the conversation's active run
+
+        Returns:
+            Optional[Dict]: {'run_id', 'last_seq', 'status'}，没有活动运行时为None
+        """
+        run_id = await cache.aget(cls._active_key(conversation_id))
+        if not run_id:
+            return None
+        meta = await RunEventLog.aget_meta(run_id) or {'last_seq': 0, 'status': 'running'}
+        return {'run_id': run_id, **meta}
+
+    @classmethod
+    async def start(cls, user_id: str, conversation_id: str, content: str,
+                    context: Dict[str, Any], document_id: Optional[str] = None) -> Optional[AgentRun]:
+        """
+        启动运行 / Start a run
+
+        Returns:
+            Optional[AgentRun]: 新运行；对话已有活动运行时返回None
+            The new run, or None if the conversation already has an active run
+        """
+        run = AgentRun(uuid.uuid4().hex, user_id, conversation_id, document_id)
+        if not await cache.aadd(cls._active_key(conversation_id), run.run_id, cls.ACTIVE_TIMEOUT):
+            return None
+
+        await run.log.set_status('running')
+        cls._tasks[run.run_id] = asyncio.create_task(run.execute(content, context))
+        return run
+
+    @classmethod
+    async def cancel(cls, conversation_id) -> Optional[str]:
+        """
+        取消对话的活动运行 / Cancel the conversation's active run
+
+        本进程内的运行立即取消；其他进程中的运行在下一个事件后检查取消标记。
+        Runs in this process are cancelled immediately; runs elsewhere check the flag after their next event.
+
+        Returns:
+            Optional[str]: 被取消的运行ID / Cancelled run ID
+        """
+        run_id = await cache.aget(cls._active_key(conversation_id))
+        if not run_id:
+            return None
+
+        await cache.aset(cls._cancel_key(run_id), True, cls.ACTIVE_TIMEOUT)
+        task = cls._tasks.get(run_id)
+        if task and not task.done():
+            task.cancel()
+        return run_id
+
+    @classmethod
+    async def cancel_requested(cls, run_id: str) -> bool:
+        """是否已请求取消 / Whether cancellation was requested"""
+        return bool(await cache.aget(cls._cancel_key(run_id)))
+
+    @classmethod
+    async def release(cls, run: AgentRun):
+        """运行结束后释放占位 / Release the claim once a run finishes"""
+        cls._tasks.pop(run.run_id, None)
+        key = cls._active_key(run.conversation_id)
+        if await cache.aget(key) == run.run_id:
+            await cache.adelete(key)
+        await cache.adelete(cls._cancel_key(run.run_id))
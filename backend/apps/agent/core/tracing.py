@@ -0,0 +1,159 @@
+"""
+Agent执行追踪 / Agent Execution Tracing
+
+记录一次Agent运行中各阶段（记忆加载、规划、思考、工具、数据库写入、token记账）的耗时、
+token数和缓存命中，紧凑地保存到AgentTask，并可导出为Chrome trace格式。
+Records per-phase latency, token counts and cache hits of an agent run (memory loading, planning,
+thinking, tools, DB writes, token accounting), stored compactly on AgentTask and exportable as
+Chrome trace JSON.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from core.llm import percentile
+
+# 汇总时累加的阶段属性 / Span attributes summed when aggregating
+COUNTER_FIELDS = ('prompt_tokens', 'completion_tokens', 'cache_hits', 'tool_chars_saved', 'plan_cache_hits')
+
+
+class RunTrace:
+    """
+    单次运行的追踪记录 / Trace of a single run
+
+    紧凑格式 / Compact format:
+        {"v": 1, "started_at": 秒级时间戳, "total_ms": 总耗时,
+         "spans": [[名称, 开始ms, 耗时ms, 属性], ...]}
+    """
+
+    VERSION = 1
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._stack: List[Dict[str, Any]] = []
+
+    def _elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        记录一个阶段，可嵌套 / Record a phase, may be nested
+
+        Args:
+            name: 阶段名称 / Phase name
+            **attrs: 附加属性 / Extra attributes
+        """
+        span = {'name': name, 'start': self._elapsed_ms(), 'attrs': attrs}
+        self._stack.append(span)
+        try:
+            yield span
+        except BaseException:
+            span['attrs']['error'] = True
+            raise
+        finally:
+            self._stack.pop()
+            span['dur'] = self._elapsed_ms() - span['start']
+            self.spans.append(span)
+
+    def record_llm(self, response: Optional[Dict[str, Any]]):
+        """
+        把LLM响应的token数和缓存命中记到当前阶段 / Add an LLM response's tokens and cache hit to the current span
+
+        需在usage被记账取走之前调用 / Must be called before usage is taken for billing
+        """
+        if not isinstance(response, dict):
+            return
+        usage = response.get('usage') or {}
+        self.annotate(**{field: usage[field] for field in ('prompt_tokens', 'completion_tokens') if usage.get(field)})
+        if response.get('cached'):
+            self.annotate(cache_hits=1)
+
+    def annotate(self, **attrs):
+        """给当前阶段添加属性，数值累加 / Add attributes to the current span, summing numbers"""
+        if not self._stack:
+            return
+        current = self._stack[-1]['attrs']
+        for key, value in attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(current.get(key), (int, float)):
+                current[key] += value
+            else:
+                current[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出紧凑格式 / Export the compact format"""
+        spans = sorted(self.spans, key=lambda s: s['start'])
+        return {
+            'v': self.VERSION,
+            'started_at': round(self.started_at, 3),
+            'total_ms': round(self._elapsed_ms(), 1),
+            'spans': [
+                [s['name'], round(s['start'], 1), round(s['dur'], 1), s['attrs']]
+                for s in spans
+            ],
+        }
+
+
+def to_chrome_trace(trace: Dict[str, Any], name: str = 'agent_run') -> Dict[str, Any]:
+    """
+    紧凑追踪转Chrome trace格式 / Convert a compact trace to Chrome trace JSON
+
+    可在 chrome://tracing 或 Perfetto 中打开 / Opens in chrome://tracing or Perfetto
+
+    Args:
+        trace: RunTrace.to_dict() 的结果 / Output of RunTrace.to_dict()
+        name: 进程名称 / Process name
+    """
+    base_us = (trace.get('started_at') or 0) * 1_000_000
+    events = [{
+        'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 1,
+        'args': {'name': name},
+    }]
+    for span_name, start_ms, dur_ms, attrs in trace.get('spans', []):
+        events.append({
+            'name': span_name,
+            'cat': span_name.split(':', 1)[0],
+            'ph': 'X',
+            'ts': int(base_us + start_ms * 1000),
+            'dur': int(dur_ms * 1000),
+            'pid': 1,
+            'tid': 1,
+            'args': attrs,
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def phase_stats(traces: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    汇总多次运行的分阶段统计 / Aggregate per-phase statistics across runs
+
+    Returns:
+        Dict: 阶段名 -> {count, p50_ms, p95_ms, total_ms, 以及 COUNTER_FIELDS 的合计 / plus COUNTER_FIELDS totals}
+    """
+    durations: Dict[str, List[float]] = {}
+    totals: Dict[str, Dict[str, int]] = {}
+
+    for trace in traces:
+        if not trace:
+            continue
+        durations.setdefault('run', []).append(trace.get('total_ms', 0.0))
+        for span_name, _, dur_ms, attrs in trace.get('spans', []):
+            durations.setdefault(span_name, []).append(dur_ms)
+            counters = totals.setdefault(span_name, dict.fromkeys(COUNTER_FIELDS, 0))
+            for field in counters:
+                counters[field] += attrs.get(field, 0)
+
+    stats = {}
+    for span_name, values in durations.items():
+        values.sort()
+        stats[span_name] = {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 0.5), 1),
+            'p95_ms': round(percentile(values, 0.95), 1),
+            'total_ms': round(sum(values), 1),
+            **totals.get(span_name, {}),
+        }
+    return stats
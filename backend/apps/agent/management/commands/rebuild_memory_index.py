@@ -0,0 +1,50 @@
+"""
+管理命令：重建Agent记忆倒排索引
+用于上线索引后回填历史记忆，或修复索引数据
+"""
+from django.core.management.base import BaseCommand
+
+from apps.agent.core.memory_index import MemoryIndex
+from apps.agent.models import AgentMemory
+
+
+class Command(BaseCommand):
+    help = '重建Agent记忆的倒排索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=str,
+            help='指定用户ID，只重建该用户的记忆索引'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='每批处理的记忆数量'
+        )
+
+    def handle(self, *args, **options):
+        user_id = options.get('user_id')
+        batch_size = options['batch_size']
+
+        memories = AgentMemory.objects.order_by('id')
+        if user_id:
+            memories = memories.filter(user_id=user_id)
+
+        total = memories.count()
+        self.stdout.write(f'开始索引 {total} 条记忆...')
+
+        indexed = 0
+        batch = []
+        for memory in memories.only('id', 'user_id', 'content', 'related_concept').iterator(chunk_size=batch_size):
+            batch.append(memory)
+            if len(batch) >= batch_size:
+                MemoryIndex.index_memories(batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            MemoryIndex.index_memories(batch)
+            indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'完成，共索引 {indexed} 条记忆'))
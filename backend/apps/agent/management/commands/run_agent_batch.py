@@ -0,0 +1,70 @@
+"""
+管理命令：对一组文档或问题批量运行Agent
+作业文件为JSON数组 [{"document_id": ..., "question": ...}]，或用 --document-ids 加 --template
+"""
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.agent.core.batch import AgentBatchService
+from apps.agent.models import AgentBatch
+
+
+class Command(BaseCommand):
+    help = '对一组文档或问题批量运行Agent'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='用户名或用户ID')
+        parser.add_argument('--file', help='作业JSON文件')
+        parser.add_argument('--document-ids', nargs='+', default=[], help='文档ID列表')
+        parser.add_argument('--template', default='', help='问题模板，{title}替换为文档标题')
+        parser.add_argument('--name', default='批量任务', help='批量任务名称')
+        parser.add_argument('--wait', action='store_true', help='等待全部作业结束并输出进度')
+        parser.add_argument('--interval', type=float, default=5.0, help='--wait时的进度刷新间隔（秒）')
+
+    def handle(self, *args, **options):
+        user = self._get_user(options['user'])
+
+        jobs = []
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                jobs = json.load(f)
+            if not isinstance(jobs, list):
+                raise CommandError('作业文件必须是JSON数组')
+
+        try:
+            expanded = AgentBatchService.expand_jobs(
+                user, jobs=jobs, document_ids=options['document_ids'], template=options['template']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        batch = AgentBatchService.create_batch(user, options['name'], expanded)
+        self.stdout.write(f'已创建批量任务 {batch.id}，共 {batch.total_jobs} 个作业')
+
+        if not options['wait']:
+            return
+
+        while True:
+            batch = AgentBatch.objects.get(pk=batch.pk)
+            done = batch.completed_jobs + batch.failed_jobs
+            self.stdout.write(
+                f'[{batch.status}] {done}/{batch.total_jobs} '
+                f'(成功 {batch.completed_jobs}, 失败 {batch.failed_jobs})'
+            )
+            if batch.status in ('completed', 'cancelled'):
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'批量任务 {batch.id} 已结束: {batch.status}'))
+
+    def _get_user(self, value):
+        User = get_user_model()
+        user = User.objects.filter(username=value).first()
+        if user is None and value.isdigit():
+            user = User.objects.filter(pk=value).first()
+        if user is None:
+            raise CommandError(f'用户不存在: {value}')
+        return user
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0002_remove_conversation_agent_conve_documen_6d7cff_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summarized_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0003_conversation_summarized_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentMemoryTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField(default=1.0)),
+                ('memory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='index_terms', to='agent.agentmemory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_memory_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'agent_memory_terms',
+                'indexes': [models.Index(fields=['user', 'term'], name='agent_memor_user_id_d3f501_idx')],
+                'constraints': [models.UniqueConstraint(fields=('memory', 'term'), name='uniq_agent_memory_term')],
+            },
+        ),
+    ]
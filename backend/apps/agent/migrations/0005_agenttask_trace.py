@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0004_agentmemoryterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agenttask',
+            name='trace',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:24
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0005_agenttask_trace'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(default='批量任务', max_length=200)),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '执行中'), ('completed', '已完成'), ('cancelled', '已取消')], default='pending', max_length=20)),
+                ('total_jobs', models.IntegerField(default=0)),
+                ('completed_jobs', models.IntegerField(default=0)),
+                ('failed_jobs', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batches', to='agent.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'agent_batches',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='agenttask',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='agent.agentbatch'),
+        ),
+        migrations.AddIndex(
+            model_name='agentbatch',
+            index=models.Index(fields=['user', '-created_at'], name='agent_batch_user_id_d4dab9_idx'),
+        ),
+    ]
@@ -14,6 +14,7 @@ class Conversation(models.Model):
     document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='conversations')
     title = models.CharField(max_length=200, default='新对话')
     summary = models.TextField(default='', blank=True)  # 压缩的历史
+    summarized_at = models.DateTimeField(null=True, blank=True)  # 摘要已覆盖到的最后一条消息时间
     is_active = models.BooleanField(default=True)
     message_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -70,6 +71,37 @@ class Message(models.Model):
         return f"{self.role}: {self.content[:50]}..."
 
 
+class AgentBatch(models.Model):
+    """Agent批量运行（对多个文档或问题执行Agent）"""
+    STATUS_CHOICES = [
+        ('pending', '等待中'),
+        ('running', '执行中'),
+        ('completed', '已完成'),
+        ('cancelled', '已取消'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='agent_batches')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='batches')
+    name = models.CharField(max_length=200, default='批量任务')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_jobs = models.IntegerField(default=0)
+    completed_jobs = models.IntegerField(default=0)
+    failed_jobs = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'agent_batches'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} - {self.status} ({self.completed_jobs + self.failed_jobs}/{self.total_jobs})"
+
+
 class AgentTask(models.Model):
     """Agent执行任务"""
     STATUS_CHOICES = [
@@ -85,6 +117,7 @@ class AgentTask(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='tasks')
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='tasks')
+    batch = models.ForeignKey(AgentBatch, on_delete=models.CASCADE, null=True, blank=True, related_name='tasks')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     plan = models.JSONField(default=list, blank=True)  # 执行计划
     execution_history = models.JSONField(default=list, blank=True)  # 执行历史
@@ -92,6 +125,7 @@ class AgentTask(models.Model):
     error_message = models.TextField(default='', blank=True)
     iterations = models.IntegerField(default=0)
     execution_time = models.FloatField(default=0.0)  # 执行时间（秒）
+    trace = models.JSONField(default=dict, blank=True)  # 分阶段执行追踪
     created_at = models.DateTimeField(auto_now_add=True)
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -179,3 +213,24 @@ class AgentMemory(models.Model):
 
     def __str__(self):
         return f"{self.memory_type}: {self.content[:50]}..."
+
+
+class AgentMemoryTerm(models.Model):
+    """Agent记忆倒排索引项（每条记忆的每个词项一行）"""
+    memory = models.ForeignKey(AgentMemory, on_delete=models.CASCADE, related_name='index_terms')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='agent_memory_terms')
+    term = models.CharField(max_length=64)
+    weight = models.FloatField(default=1.0)  # 词项在该记忆中的归一化词频
+
+    class Meta:
+        db_table = 'agent_memory_terms'
+        indexes = [
+            models.Index(fields=['user', 'term']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['memory', 'term'], name='uniq_agent_memory_term'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.memory_id}"
+
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Conversation, Message, AgentTask, ToolCall, AgentMemory
+from .models import Conversation, Message, AgentTask, AgentBatch, ToolCall, AgentMemory
 
 
 class ConversationSerializer(serializers.ModelSerializer):
@@ -82,15 +82,15 @@ class AgentTaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = AgentTask
         fields = [
-            'id', 'conversation', 'message', 'message_preview',
+            'id', 'conversation', 'batch', 'message', 'message_preview',
             'status', 'plan', 'execution_history',
             'result', 'error_message', 'iterations', 'execution_time',
-            'tool_calls',
+            'trace', 'tool_calls',
             'created_at', 'started_at', 'completed_at'
         ]
         read_only_fields = [
-            'id', 'status', 'execution_history', 'result',
-            'error_message', 'iterations', 'execution_time',
+            'id', 'batch', 'status', 'execution_history', 'result',
+            'error_message', 'iterations', 'execution_time', 'trace',
             'created_at', 'started_at', 'completed_at'
         ]
 
@@ -102,6 +102,58 @@ class AgentTaskCreateSerializer(serializers.ModelSerializer):
         fields = ['conversation', 'message', 'plan']
 
 
+class AgentBatchSerializer(serializers.ModelSerializer):
+    """Agent批量运行序列化器"""
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AgentBatch
+        fields = [
+            'id', 'name', 'conversation', 'status',
+            'total_jobs', 'completed_jobs', 'failed_jobs', 'progress',
+            'created_at', 'completed_at'
+        ]
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        """已结束作业的比例"""
+        if not obj.total_jobs:
+            return 0.0
+        return round((obj.completed_jobs + obj.failed_jobs) / obj.total_jobs, 3)
+
+
+class AgentBatchJobSerializer(serializers.Serializer):
+    """批量运行中的单个作业"""
+    document_id = serializers.UUIDField(required=False, allow_null=True)
+    question = serializers.CharField(max_length=4000)
+
+
+class AgentBatchCreateSerializer(serializers.Serializer):
+    """
+    创建批量运行
+
+    jobs: 显式作业列表；或 document_ids + template（template中的{title}替换为文档标题）
+    """
+    name = serializers.CharField(max_length=200, required=False, default='批量任务')
+    jobs = AgentBatchJobSerializer(many=True, required=False)
+    document_ids = serializers.ListField(child=serializers.UUIDField(), required=False)
+    template = serializers.CharField(max_length=4000, required=False, allow_blank=True, default='')
+
+    def validate(self, attrs):
+        from .core.batch import AgentBatchService
+
+        try:
+            attrs['expanded_jobs'] = AgentBatchService.expand_jobs(
+                self.context['request'].user,
+                jobs=attrs.get('jobs'),
+                document_ids=attrs.get('document_ids'),
+                template=attrs.get('template', '')
+            )
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return attrs
+
+
 class AgentMemorySerializer(serializers.ModelSerializer):
     """Agent记忆序列化器"""
     created_at = serializers.DateTimeField(read_only=True)
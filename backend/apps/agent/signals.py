@@ -0,0 +1,38 @@
+"""
+Agent信号处理器
+保存记忆时同步更新记忆倒排索引，保存消息时更新对话的最近消息缓存
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.agent.models import AgentMemory, Message
+from apps.agent.core.history import MessageTail
+from apps.agent.core.memory_index import MemoryIndex
+
+INDEXED_FIELDS = {'content', 'related_concept'}
+
+
+@receiver(post_save, sender=AgentMemory)
+def index_agent_memory(sender, instance, created, update_fields=None, **kwargs):
+    """
+    记忆内容变化时重建其索引项（bulk_create不触发信号，需调用方显式索引）
+    """
+    if created or update_fields is None or INDEXED_FIELDS & set(update_fields):
+        MemoryIndex.index_memories([instance])
+
+
+@receiver(post_save, sender=Message)
+def append_message_tail(sender, instance, created, **kwargs):
+    """
+    新消息追加到对话的最近消息缓存，修改过的消息使缓存失效
+    """
+    if created:
+        MessageTail.append(instance)
+    else:
+        MessageTail.invalidate(instance.conversation_id)
+
+
+@receiver(post_delete, sender=Message)
+def invalidate_message_tail(sender, instance, **kwargs):
+    """删除消息后使对话的最近消息缓存失效"""
+    MessageTail.invalidate(instance.conversation_id)
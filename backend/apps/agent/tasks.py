@@ -0,0 +1,80 @@
+import logging
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from core.async_runner import run_async
+
+from .core.batch import AgentBatchService, BatchSlots
+from .core.memory import MemoryManager
+from .models import AgentTask, Conversation
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3)
+def compress_session_task(self, user_id: str, conversation_id: str, min_new_messages: int = 1):
+    """
+    回答之后的会话压缩任务
+
+    增量压缩上次压缩之后的新消息，并批量写入关键记忆。
+    失败时按指数退避重试，不影响回答的完成时间。
+    """
+    try:
+        compressed = run_async(
+            MemoryManager(user_id, conversation_id).compress_and_save_session(min_new_messages)
+        )
+
+        if compressed:
+            logger.info(f"Compressed {compressed} messages for conversation {conversation_id}")
+        return compressed
+
+    except Conversation.DoesNotExist:
+        return 0
+    except Exception as e:
+        logger.warning(f"Session compression failed for conversation {conversation_id}: {e}")
+        raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
+
+
+@shared_task(bind=True, max_retries=None)
+def run_agent_batch_job(self, task_id: str):
+    """
+    执行批量运行中的单个作业
+
+    先占用全局并发槽，槽位已满时稍后重试，因此吞吐受LLM限流约束而不是worker数量。
+    重复投递时只执行仍处于等待状态的作业。
+    """
+    try:
+        task = AgentTask.objects.select_related('batch', 'message', 'conversation').get(id=task_id)
+    except AgentTask.DoesNotExist:
+        return None
+
+    if task.status != 'pending':
+        return task.status
+
+    if not BatchSlots.acquire(getattr(settings, 'AGENT_BATCH_MAX_CONCURRENCY', 4)):
+        raise self.retry(countdown=getattr(settings, 'AGENT_BATCH_RETRY_DELAY', 5))
+
+    try:
+        # 占槽后再检查，避免执行已取消的作业 / Re-check after taking the slot so cancelled jobs are skipped
+        if AgentTask.objects.filter(id=task_id, status='pending').update(status='planning') == 0:
+            return None
+
+        try:
+            succeeded = run_async(AgentBatchService.run_job(task))
+        except Exception as e:
+            logger.error(f"Batch job {task_id} failed: {e}")
+            AgentTask.objects.filter(id=task_id).update(
+                status='failed', error_message=str(e), completed_at=timezone.now()
+            )
+            succeeded = False
+    finally:
+        BatchSlots.release()
+
+    if not succeeded:
+        # 没有答案的作业按失败计 / Jobs that produced no answer count as failed
+        AgentTask.objects.filter(id=task_id, status__in=['planning', 'executing']).update(
+            status='failed', completed_at=timezone.now()
+        )
+    AgentBatchService.record_result(task.batch_id, succeeded)
+    return 'completed' if succeeded else 'failed'
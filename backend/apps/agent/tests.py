@@ -1,6 +1,18 @@
+import uuid
+
 import pytest
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
+from asgiref.sync import async_to_sync
+from apps.agent.core.batch import BatchSlots
 from apps.agent.core.executor import ScholarAgent
+from apps.agent.core.history import MessageTail
+from apps.agent.core.memory import MemoryManager
+from apps.agent.core.plan_cache import PlanCache, intent_fingerprint
+from apps.agent.core.context import ContextBuilder, estimate_tokens
+from apps.agent.core.router import ModelRouter
+from apps.agent.core.runs import AgentRunManager, RunEventLog
+from apps.agent.core.tracing import RunTrace, phase_stats, to_chrome_trace
+from apps.agent.models import AgentBatch, Conversation, Message, AgentMemory
 from apps.agent.tools.registry import ToolRegistry
 from tests.base import BaseAPITestCase
 
@@ -72,4 +84,314 @@ class AgentExecutorTest(BaseAPITestCase):
 
             event_types = [e['type'] for e in events]
             self.assertIn('action', event_types)
-            self.assertIn('answer', event_types)
\ No newline at end of file
+            self.assertIn('answer', event_types)
+
+
+class SessionCompressionTest(BaseAPITestCase):
+    """增量会话压缩测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = Conversation.objects.create(user=self.user)
+        for i in range(3):
+            Message.objects.create(conversation=self.conversation, role='user', content=f'问题{i}')
+
+    def test_compress_only_new_messages(self):
+        """只压缩上次压缩之后的新消息"""
+        llm = MagicMock()
+        llm.generate_json = AsyncMock(return_value={
+            "summary": "讨论了导数",
+            "key_points": ["导数是变化率", "链式法则"]
+        })
+        manager = MemoryManager(self.user.id, self.conversation.id)
+
+        with patch('apps.agent.core.memory.get_llm_client', return_value=llm):
+            self.assertEqual(async_to_sync(manager.compress_and_save_session)(), 3)
+            self.assertEqual(async_to_sync(manager.compress_and_save_session)(), 0)
+
+            Message.objects.create(conversation=self.conversation, role='assistant', content='回答')
+            self.assertEqual(async_to_sync(manager.compress_and_save_session)(), 1)
+
+        self.assertEqual(llm.generate_json.await_count, 2)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, "讨论了导数")
+        self.assertIsNotNone(self.conversation.summarized_at)
+        self.assertEqual(AgentMemory.objects.filter(user=self.user).count(), 4)
+
+
+class MemoryIndexTest(BaseAPITestCase):
+    """记忆倒排索引召回测试"""
+
+    def test_ranks_relevant_memories_and_counts_access(self):
+        """按相关性召回记忆并批量更新访问计数"""
+        relevant = AgentMemory.objects.create(
+            user=self.user, memory_type='concept', content='链式法则用于复合函数求导', importance=0.5
+        )
+        AgentMemory.objects.create(
+            user=self.user, memory_type='concept', content='矩阵乘法不满足交换律', importance=0.9
+        )
+        manager = MemoryManager(self.user.id, None)
+
+        memories = async_to_sync(manager._get_relevant_memories)('复合函数怎么求导')
+
+        self.assertEqual([m['content'] for m in memories], [relevant.content])
+        relevant.refresh_from_db()
+        self.assertEqual(relevant.access_count, 1)
+        self.assertIsNotNone(relevant.last_accessed)
+
+
+class AgentRunTest(BaseAPITestCase):
+    """可续传Agent运行测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = Conversation.objects.create(user=self.user)
+
+    def run_agent(self, events):
+        """启动运行并等待结束，返回运行和同时发起的第二次启动结果"""
+        async def fake_run(content, context):
+            for event in events:
+                yield event
+
+        agent = MagicMock()
+        agent.run = fake_run
+
+        async def run():
+            with patch('apps.agent.core.runs.ScholarAgent', return_value=agent):
+                run = await AgentRunManager.start(str(self.user.id), str(self.conversation.id), '问题', {})
+                duplicate = await AgentRunManager.start(str(self.user.id), str(self.conversation.id), '问题', {})
+                await AgentRunManager._tasks[run.run_id]
+            return run, duplicate
+
+        return async_to_sync(run)()
+
+    def test_events_are_sequenced_and_replayable(self):
+        """事件带序号缓存，可从任意序号续传"""
+        run, duplicate = self.run_agent([
+            {"type": "state", "data": {"state": "planning"}},
+            {"type": "plan", "data": {"plan": []}},
+            {"type": "answer", "data": {"content": "回答"}},
+        ])
+
+        self.assertIsNone(duplicate)
+        events = async_to_sync(RunEventLog.replay)(run.run_id, 1)
+        self.assertEqual([e['seq'] for e in events], [2, 3])
+        self.assertEqual(events[-1]['type'], 'answer')
+        self.assertEqual(async_to_sync(RunEventLog.aget_meta)(run.run_id)['status'], 'completed')
+
+        # 其他对话或用户不能重放该运行
+        replay = async_to_sync(RunEventLog.replay)
+        self.assertEqual(len(replay(run.run_id, 0, self.conversation.id, self.user.id)), 3)
+        self.assertEqual(replay(run.run_id, 0, uuid.uuid4(), self.user.id), [])
+        self.assertEqual(replay(run.run_id, 0, self.conversation.id, 'other'), [])
+
+        self.assertIsNone(async_to_sync(AgentRunManager.get_active_run)(self.conversation.id))
+        self.assertEqual(
+            list(Message.objects.filter(conversation=self.conversation).values_list('role', flat=True)),
+            ['user', 'assistant']
+        )
+
+
+class AgentBatchTest(BaseAPITestCase):
+    """Agent批量运行测试"""
+
+    def test_batch_runs_jobs_and_counts_results(self):
+        """每个作业一个任务，全部结束后批量运行完成"""
+        async def fake_run(content, context):
+            if content == '问题一':
+                yield {"type": "answer", "data": {"content": "回答"}}
+
+        agent = MagicMock()
+        agent.run = fake_run
+
+        with patch('apps.agent.core.batch.ScholarAgent', return_value=agent) as agent_class:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/agent/batches/', {
+                    'name': '测试批量',
+                    'jobs': [{'question': '问题一'}, {'question': '问题二'}],
+                }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(all(call.kwargs['batch'] for call in agent_class.call_args_list))
+        batch = AgentBatch.objects.get(pk=response.data['id'])
+        self.assertEqual((batch.status, batch.completed_jobs, batch.failed_jobs), ('completed', 1, 1))
+        self.assertEqual(batch.tasks.count(), 2)
+
+        results = self.client.get(f'/api/agent/batches/{batch.id}/results/')
+        self.assertEqual(results.status_code, 200)
+
+    def test_batch_slots_limit_concurrency(self):
+        """并发槽用尽后拒绝占用，释放后可再次占用"""
+        self.assertTrue(BatchSlots.acquire(1))
+        self.assertFalse(BatchSlots.acquire(1))
+        BatchSlots.release()
+        self.assertTrue(BatchSlots.acquire(1))
+        BatchSlots.release()
+
+        # 多余的释放（计数过期重建后）不会让计数变为负数
+        BatchSlots.release()
+        self.assertTrue(BatchSlots.acquire(1))
+        self.assertFalse(BatchSlots.acquire(1))
+        BatchSlots.release()
+
+
+class RunTraceTest(BaseAPITestCase):
+    """Agent执行追踪测试"""
+
+    def test_spans_tokens_and_stats(self):
+        """阶段记录token与缓存命中，可导出Chrome trace并汇总分位数"""
+        trace = RunTrace()
+        with trace.span('plan'):
+            trace.record_llm({'plan': [], 'usage': {'prompt_tokens': 12, 'completion_tokens': 4}})
+        with trace.span('think', iteration=1):
+            trace.record_llm({'content': '...', 'cached': True})
+            with trace.span('db', op='save'):
+                pass
+
+        data = trace.to_dict()
+        self.assertEqual([span[0] for span in data['spans']], ['plan', 'think', 'db'])
+        self.assertEqual(data['spans'][0][3], {'prompt_tokens': 12, 'completion_tokens': 4})
+        self.assertEqual(data['spans'][1][3]['cache_hits'], 1)
+
+        chrome = to_chrome_trace(data)
+        self.assertEqual([e['ph'] for e in chrome['traceEvents']], ['M', 'X', 'X', 'X'])
+
+        stats = phase_stats([data, data])
+        self.assertEqual(stats['plan']['count'], 2)
+        self.assertEqual(stats['plan']['prompt_tokens'], 24)
+        self.assertIn('p95_ms', stats['run'])
+
+
+class ModelRouterTest(BaseAPITestCase):
+    """模型路由测试"""
+
+    def test_classify_turns(self):
+        """简单意图与多步推理的判断"""
+        self.assertEqual(ModelRouter.classify('什么是导数'), ModelRouter.SIMPLE)
+        self.assertEqual(ModelRouter.classify('比较导数和积分的区别'), ModelRouter.COMPLEX)
+        self.assertEqual(
+            ModelRouter.classify('比较导数和积分', plan={'needs_tools': False}),
+            ModelRouter.SIMPLE
+        )
+        self.assertEqual(
+            ModelRouter.classify('什么是导数', plan={'needs_tools': True, 'estimated_tools': ['a', 'b']}),
+            ModelRouter.COMPLEX
+        )
+
+    def test_escalates_on_invalid_json(self):
+        """快速档返回无效JSON时升级到强档"""
+        router = ModelRouter(tiers={'fast': 'cheap-model', 'strong': 'big-model'})
+        llm = MagicMock()
+        llm.generate_json = AsyncMock(side_effect=[ValueError('bad json'), {'plan': []}])
+
+        response, decision = async_to_sync(router.generate_json)(llm, 'plan', ModelRouter.SIMPLE, prompt='p')
+
+        self.assertEqual(response, {'plan': []})
+        self.assertEqual(
+            [call.kwargs['model'] for call in llm.generate_json.await_args_list],
+            ['cheap-model', 'big-model']
+        )
+        self.assertEqual(decision['tier'], ModelRouter.STRONG)
+        self.assertTrue(decision['escalated'])
+
+    def test_no_escalation_to_same_model(self):
+        """两档是同一模型时不升级重试"""
+        router = ModelRouter(tiers={})
+        llm = MagicMock(default_model='default-model')
+        llm.generate_json = AsyncMock(side_effect=ValueError('bad json'))
+
+        with self.assertRaises(ValueError):
+            async_to_sync(router.generate_json)(llm, 'plan', ModelRouter.SIMPLE, prompt='p')
+        self.assertEqual(llm.generate_json.await_count, 1)
+
+
+class MessageHistoryTest(BaseAPITestCase):
+    """消息键集分页与最近消息缓存测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = Conversation.objects.create(user=self.user)
+        for i in range(5):
+            Message.objects.create(conversation=self.conversation, role='user', content=f'消息{i}')
+        self.url = f'/api/agent/conversations/{self.conversation.id}/messages/'
+
+    def test_keyset_pages_and_incremental_fetch(self):
+        """游标从新到旧翻页，since只返回之后的新消息"""
+        first = self.client.get(self.url, {'page_size': 2}).data
+        self.assertEqual([m['content'] for m in first['results']], ['消息4', '消息3'])
+        self.assertTrue(first['has_more'])
+
+        second = self.client.get(self.url, {'page_size': 2, 'cursor': first['cursor']}).data
+        self.assertEqual([m['content'] for m in second['results']], ['消息2', '消息1'])
+
+        latest = self.client.get(self.url, {'since': ''}).data['cursor']
+        Message.objects.create(conversation=self.conversation, role='assistant', content='回答')
+        new = self.client.get(self.url, {'since': latest}).data
+        self.assertEqual([m['content'] for m in new['results']], ['回答'])
+
+        self.assertEqual(self.client.get(self.url, {'cursor': 'bad'}).status_code, 404)
+
+    def test_tail_is_appended_on_save(self):
+        """读取一次后，新消息追加到缓存尾部而不再查询数据库"""
+        self.assertEqual([m['content'] for m in MessageTail.get_recent(self.conversation.id, 2)], ['消息3', '消息4'])
+        Message.objects.create(conversation=self.conversation, role='assistant', content='回答')
+
+        with self.assertNumQueries(0):
+            recent = MessageTail.get_recent(self.conversation.id, 2)
+        self.assertEqual([m['content'] for m in recent], ['消息4', '回答'])
+
+
+class PlanCacheTest(BaseAPITestCase):
+    """执行计划缓存测试"""
+
+    def setUp(self):
+        super().setUp()
+        PlanCache.reset_stats()
+
+    def test_fingerprint_masks_entities(self):
+        """编号和大小写不同的问题得到相同指纹"""
+        self.assertEqual(intent_fingerprint('What is Theorem 3?')[0], intent_fingerprint('what is theorem 5')[0])
+        self.assertEqual(intent_fingerprint('解释式2.1')[1], ['2.1'])
+        self.assertNotEqual(intent_fingerprint('解释式2.1')[0], intent_fingerprint('证明式2.1')[0])
+
+    def test_hit_skips_planner_and_fills_entities(self):
+        """命中时不调用规划LLM，计划中的实体替换为当前问题的实体"""
+        plan = {'intent': '解释定理3', 'needs_tools': True, 'plan': ['检索定理3', '共3步'], 'estimated_tools': []}
+        agent = ScholarAgent(user_id=str(self.user.id), conversation_id='c', document_id='doc-1')
+        agent._routed_json = AsyncMock(return_value=plan)
+        agent._record_usage = MagicMock()
+
+        async def plan_twice():
+            await agent._create_plan('定理3是什么？', {}, {})
+            return await agent._create_plan('定理7是什么', {}, {})
+
+        second = async_to_sync(plan_twice)()
+
+        agent._routed_json.assert_awaited_once()
+        self.assertEqual(second['intent'], '解释定理7')
+        self.assertEqual(second['plan'], ['检索定理7', '共3步'])
+        stats = PlanCache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['sets']), (1, 1, 1))
+        self.assertIsNone(async_to_sync(PlanCache.aget)('定理7是什么', 'doc-2'))
+
+
+class ContextBuilderTest(BaseAPITestCase):
+    """上下文窗口预算测试"""
+
+    def test_history_stays_within_budget(self):
+        """大观察按相关性截断，较早步骤压缩为摘要"""
+        observation = {'success': True, 'data': {'chunks': [
+            '积分是求面积的方法。' * 80,
+            '链式法则用于复合函数求导。',
+            '矩阵乘法不满足交换律。' * 80,
+        ]}}
+        history = [{'thought': '检索', 'action': 'search_content', 'observation': observation}] * 4
+        builder = ContextBuilder(budget=400)
+
+        plan_text, history_text, stats = builder.build('链式法则', {'intent': '求导', 'plan': ['检索']}, history)
+
+        self.assertLessEqual(estimate_tokens(plan_text) + estimate_tokens(history_text), 400)
+        self.assertIn('链式法则用于复合函数求导', history_text)
+        self.assertNotIn('矩阵乘法', history_text)
+        self.assertEqual(stats['observations_truncated'], 2)
+        self.assertIn('summary', history_text)
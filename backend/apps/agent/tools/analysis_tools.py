@@ -23,6 +23,7 @@ class AnalyzeFormulaTool(BaseTool):
     description_zh = "分析和解释数学公式"
     description_en = "Analyze and explain mathematical formulas"
     async_execution = True
+    cacheable = True
     timeout = 45.0  # 需要更长时间调用 LLM
 
     parameters = {
@@ -194,6 +195,7 @@ class CompareConceptsTool(BaseTool):
     description_zh = "对比多个概念的异同"
     description_en = "Compare similarities and differences between multiple concepts"
     async_execution = True
+    cacheable = True
     timeout = 45.0
 
     parameters = {
@@ -383,6 +385,7 @@ class GenerateExplanationTool(BaseTool):
     description_zh = "生成详细解释，支持不同难度级别"
     description_en = "Generate detailed explanations with different difficulty levels"
     async_execution = True
+    cacheable = True
     timeout = 45.0
 
     parameters = {
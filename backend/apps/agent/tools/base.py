@@ -13,6 +13,8 @@ from dataclasses import dataclass, field
 from typing import Any, Optional, Dict, List, Union
 from enum import Enum
 
+from core.async_runner import run_async
+
 
 class Language(Enum):
     """支持的语言 / Supported languages"""
@@ -89,6 +91,7 @@ class BaseTool(ABC):
     timeout: float = 30.0  # 超时时间（秒）
     max_retries: int = 3   # 最大重试次数
     async_execution: bool = True  # 是否异步执行
+    cacheable: bool = False  # 只读工具：批量运行中结果可在作业间共享 / Read-only: results shareable across batch jobs
 
     def __init__(self):
         """初始化工具 / Initialize tool"""
@@ -140,7 +143,7 @@ class BaseTool(ABC):
                 )
             else:
                 # 对于同步工具，在线程池中执行
-                loop = asyncio.get_event_loop()
+                loop = asyncio.get_running_loop()
                 result = await loop.run_in_executor(
                     None, self._sync_execute_wrapper, kwargs
                 )
@@ -175,13 +178,10 @@ class BaseTool(ABC):
             )
 
     def _sync_execute_wrapper(self, kwargs: Dict[str, Any]) -> ToolResult:
-        """同步执行包装器 / Sync execution wrapper"""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(self.execute(**kwargs))
-        finally:
-            loop.close()
+        """
+        同步执行包装器，在共享事件循环中执行 / Sync execution wrapper, runs on the shared event loop
+        """
+        return run_async(self.execute(**kwargs), timeout=self.timeout)
 
     def _validate_parameters(self, parameters: Dict[str, Any]) -> ToolResult:
         """
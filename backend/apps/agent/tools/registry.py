@@ -5,6 +5,9 @@
 Manages registration, lookup, and description generation for all Agent tools
 """
 
+import hashlib
+import json
+import math
 from typing import Dict, List, Type, Optional, Any
 from .base import BaseTool, ToolResult, Language
 
@@ -14,6 +17,8 @@ class ToolRegistry:
 
     _tools: Dict[str, BaseTool] = {}
     _categories: Dict[str, List[str]] = {}
+    _index: Optional[Dict[str, Dict[str, float]]] = None  # 词项 -> {工具名: 权重} / Term -> {tool name: weight}
+    _version: Optional[str] = None  # 工具目录版本 / Tool catalogue version
 
     @classmethod
     def register(cls, tool_class: Type[BaseTool]) -> Type[BaseTool]:
@@ -36,6 +41,8 @@ class ToolRegistry:
 
             # 注册工具
             cls._tools[tool_name] = tool_instance
+            cls._index = None
+            cls._version = None
 
             # 按类别组织
             category = tool_instance.category
@@ -111,29 +118,42 @@ class ToolRegistry:
         return list(cls._tools.keys())
 
     @classmethod
-    def get_tool_descriptions(cls, language: Language = Language.CHINESE) -> str:
+    def get_tool_descriptions(cls, language: Language = Language.CHINESE,
+                              tool_names: Optional[List[str]] = None) -> str:
         """
         生成工具描述文本（用于 Prompt）
         Generate tool descriptions text (for prompts)
 
         Args:
             language: 语言偏好 / Language preference
+            tool_names: 只描述这些工具，为空时描述全部 / Only describe these tools, all when empty
 
         Returns:
             str: 格式化的工具描述 / Formatted tool descriptions
         """
         if language == Language.CHINESE:
-            return cls._get_descriptions_zh()
+            return cls._get_descriptions_zh(tool_names)
         else:
-            return cls._get_descriptions_en()
+            return cls._get_descriptions_en(tool_names)
 
     @classmethod
-    def _get_descriptions_zh(cls) -> str:
+    def _filtered_categories(cls, tool_names: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """按类别列出要描述的工具 / Tools to describe, grouped by category"""
+        if not tool_names:
+            return cls._categories
+        allowed = set(tool_names)
+        return {
+            category: [name for name in names if name in allowed]
+            for category, names in cls._categories.items()
+        }
+
+    @classmethod
+    def _get_descriptions_zh(cls, tool_names: Optional[List[str]] = None) -> str:
         """生成中文描述 / Generate Chinese descriptions"""
         descriptions = []
         descriptions.append("可用工具列表：\n")
 
-        for category, tool_names in cls._categories.items():
+        for category, tool_names in cls._filtered_categories(tool_names).items():
             if not tool_names:
                 continue
 
@@ -164,12 +184,12 @@ class ToolRegistry:
         return "\n".join(descriptions)
 
     @classmethod
-    def _get_descriptions_en(cls) -> str:
+    def _get_descriptions_en(cls, tool_names: Optional[List[str]] = None) -> str:
         """生成英文描述 / Generate English descriptions"""
         descriptions = []
         descriptions.append("Available tools:\n")
 
-        for category, tool_names in cls._categories.items():
+        for category, tool_names in cls._filtered_categories(tool_names).items():
             if not tool_names:
                 continue
 
@@ -288,11 +308,91 @@ class ToolRegistry:
 
         return matching_tools
 
+    @classmethod
+    def _tool_text(cls, tool: BaseTool) -> str:
+        """用于建立索引的工具文本 / Tool text used for indexing"""
+        parts = [tool.name.replace('_', ' '), tool.category, tool.description_zh, tool.description_en]
+        for param, spec in (tool.parameters or {}).get('properties', {}).items():
+            parts.append(param.replace('_', ' '))
+            parts.append(spec.get('description_zh', ''))
+            parts.append(spec.get('description_en', spec.get('description', '')))
+        return ' '.join(parts)
+
+    @classmethod
+    def _get_index(cls) -> Dict[str, Dict[str, float]]:
+        """
+        获取工具倒排索引（按需构建，注册新工具后重建）
+        Get the tool inverted index (built lazily, rebuilt after registration)
+        """
+        if cls._index is None:
+            # 延迟导入，避免与Agent核心模块循环导入 / Lazy import avoids a cycle with the agent core package
+            from apps.agent.core.memory_index import term_weights
+
+            index: Dict[str, Dict[str, float]] = {}
+            for tool_name, tool in cls._tools.items():
+                for term, weight in term_weights(cls._tool_text(tool)).items():
+                    index.setdefault(term, {})[tool_name] = weight
+            cls._index = index
+        return cls._index
+
+    @classmethod
+    def select_tools(cls, query: str, top_n: int = 5, required: Optional[List[str]] = None,
+                     language: Language = Language.CHINESE) -> List[str]:
+        """
+        为查询挑选最相关的工具 / Select the tools most relevant to a query
+
+        名称、类别、描述和参数按TF-IDF打分，并复用search_tools的直接匹配与按类别召回。
+        Names, categories, descriptions and parameters are scored with TF-IDF, plus the direct
+        matches of search_tools and category recall.
+
+        Args:
+            query: 查询内容（用户输入、计划步骤等） / Query (user input, plan steps, ...)
+            top_n: 最多返回的工具数 / Maximum number of tools
+            required: 必须包含的工具 / Tools that must be included
+            language: 语言偏好 / Language preference
+
+        Returns:
+            List[str]: 工具名称，按相关性排序；没有命中时为空 / Tool names by relevance, empty when nothing matches
+        """
+        from apps.agent.core.memory_index import tokenize
+
+        index = cls._get_index()
+        total = len(cls._tools) or 1
+        scores: Dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = index.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + total / len(postings))
+            for tool_name, weight in postings.items():
+                scores[tool_name] = scores.get(tool_name, 0.0) + idf * weight
+
+        for tool_name in cls.search_tools(query, language):
+            scores[tool_name] = scores.get(tool_name, 0.0) + 1.0
+
+        lowered = query.lower()
+        for category in cls._categories:
+            if category in lowered:
+                for tool_name in cls.get_by_category(category):
+                    scores[tool_name] = scores.get(tool_name, 0.0) + 0.5
+
+        selected = [name for name in dict.fromkeys(required or []) if name in cls._tools]
+        limit = max(top_n, len(selected))
+        for tool_name in sorted(scores, key=scores.get, reverse=True):
+            if len(selected) >= limit:
+                break
+            if tool_name not in selected:
+                selected.append(tool_name)
+        return selected
+
     @classmethod
     def clear(cls) -> None:
         """清空注册表 / Clear registry (for testing)"""
         cls._tools.clear()
         cls._categories.clear()
+        cls._index = None
+        cls._version = None
 
     @classmethod
     def count(cls) -> int:
@@ -304,6 +404,25 @@ class ToolRegistry:
         """
         return len(cls._tools)
 
+    @classmethod
+    def catalogue_version(cls) -> str:
+        """
+        工具目录版本：工具名称、描述和参数的摘要，工具变化时随之变化
+        Tool catalogue version: a digest of tool names, descriptions and parameters that changes with the tools
+
+        Returns:
+            str: 12位十六进制摘要 / 12-hex-digit digest
+        """
+        if cls._version is None:
+            catalogue = [
+                [name, tool.category, tool.description_zh, tool.description_en,
+                 tool.parameters, tool.required_parameters]
+                for name, tool in sorted(cls._tools.items())
+            ]
+            data = json.dumps(catalogue, sort_keys=True, ensure_ascii=False, default=str)
+            cls._version = hashlib.sha256(data.encode('utf-8')).hexdigest()[:12]
+        return cls._version
+
     @classmethod
     def get_stats(cls) -> Dict[str, Any]:
         """
@@ -25,6 +25,7 @@ class SearchConceptsTool(BaseTool):
     description_zh = "在知识库中搜索概念定义、定理、公式"
     description_en = "Search for concept definitions, theorems, formulas in knowledge base"
     async_execution = True
+    cacheable = True
 
     parameters = {
         "type": "object",
@@ -145,6 +146,7 @@ class SearchContentTool(BaseTool):
     description_zh = "在文档内容中全文搜索"
     description_en = "Full-text search within document content"
     async_execution = True
+    cacheable = True
 
     parameters = {
         "type": "object",
@@ -284,6 +286,7 @@ class GetSectionTool(BaseTool):
     description_zh = "获取文档特定章节内容"
     description_en = "Get specific section content from a document"
     async_execution = True
+    cacheable = True
 
     parameters = {
         "type": "object",
@@ -408,6 +411,7 @@ class GetDocumentSummaryTool(BaseTool):
     description_zh = "获取文档摘要、结构和关键信息"
     description_en = "Get document summary, structure and key information"
     async_execution = True
+    cacheable = True
 
     parameters = {
         "type": "object",
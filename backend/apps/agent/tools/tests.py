@@ -339,4 +339,35 @@ class TestRealTools(TestCase):
             self.assertFalse(result.success)
             self.assertIn("timeout", result.error.lower())
 
-        asyncio.run(test_timeout())
\ No newline at end of file
+        asyncio.run(test_timeout())
+
+
+class ToolSelectionTest(TestCase):
+    """工具选择测试 / Tool selection tests"""
+
+    def setUp(self):
+        """其他测试会清空注册表，这里重新注册 / Other tests clear the registry, so re-register here"""
+        for tool_class in (SearchConceptsTool, AnalyzeFormulaTool, CreateNoteTool):
+            ToolRegistry.register(tool_class)
+
+    def test_select_relevant_tools(self):
+        """只挑选与查询相关的工具 / Only relevant tools are selected"""
+        selected = ToolRegistry.select_tools("帮我分析这个数学公式", top_n=2)
+
+        self.assertIn("analyze_formula", selected)
+        self.assertLessEqual(len(selected), 2)
+
+    def test_required_tools_are_kept(self):
+        """计划中预估的工具总会被包含 / Tools estimated by the plan are always included"""
+        selected = ToolRegistry.select_tools("公式", top_n=1, required=["create_note"])
+
+        self.assertEqual(selected[0], "create_note")
+
+    def test_filtered_descriptions_are_shorter(self):
+        """只描述选中的工具 / Only the selected tools are described"""
+        full = ToolRegistry.get_tool_descriptions()
+        partial = ToolRegistry.get_tool_descriptions(tool_names=["analyze_formula"])
+
+        self.assertIn("analyze_formula", partial)
+        self.assertNotIn("create_note", partial)
+        self.assertLess(len(partial), len(full))
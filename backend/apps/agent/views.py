@@ -1,4 +1,4 @@
-from rest_framework import viewsets, status, permissions
+from rest_framework import mixins, viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.generics import get_object_or_404
@@ -7,15 +7,20 @@ from django.db.models import Q, Prefetch
 from asgiref.sync import async_to_sync
 import logging
 
-from .models import Conversation, Message, AgentTask, ToolCall, AgentMemory
+from .models import Conversation, Message, AgentTask, AgentBatch, ToolCall, AgentMemory
 from .serializers import (
     ConversationSerializer, ConversationDetailSerializer, ConversationCreateSerializer,
     MessageSerializer, MessageCreateSerializer,
     AgentTaskSerializer, AgentTaskCreateSerializer,
+    AgentBatchSerializer, AgentBatchCreateSerializer,
     AgentMemorySerializer
 )
 from .permissions import IsOwner
+from .core.batch import AgentBatchService
+from .core.plan_cache import PlanCache
+from .core.tracing import phase_stats, to_chrome_trace
 from core.llm import get_llm_client
+from core.pagination import KeysetPagination
 from apps.billing.services import TokenUsageService
 
 logger = logging.getLogger(__name__)
@@ -54,12 +59,16 @@ class ConversationViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
-        """获取对话的所有消息"""
+        """
+        获取对话的消息（键集分页）
+
+        ?cursor=: 从新到旧翻页；?since=<游标>: 增量获取该游标之后的新消息（从旧到新）
+        """
         conversation = self.get_object()
-        messages = conversation.messages.all()
-        page = self.paginate_queryset(messages)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(conversation.messages.all(), request, view=self)
         serializer = MessageSerializer(page, many=True)
-        return self.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post'])
     def add_message(self, request, pk=None):
@@ -120,9 +129,12 @@ class ConversationViewSet(viewsets.ModelViewSet):
 
 
 class MessageViewSet(viewsets.ModelViewSet):
-    """消息视图集"""
+    """消息视图集（键集分页，支持 ?since= 增量获取）"""
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['conversation', 'role']
 
     def get_queryset(self):
         """只返回当前用户可以访问的消息"""
@@ -151,7 +163,7 @@ class AgentTaskViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = AgentTaskSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwner]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['status', 'conversation']
+    filterset_fields = ['status', 'conversation', 'batch']
 
     def get_queryset(self):
         """只返回当前用户的任务"""
@@ -174,6 +186,98 @@ class AgentTaskViewSet(viewsets.ReadOnlyModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(detail=True, methods=['get'])
+    def trace(self, request, pk=None):
+        """导出任务执行追踪（Chrome trace格式，可在chrome://tracing或Perfetto中打开）"""
+        task = self.get_object()
+        if not task.trace:
+            return Response({'error': 'Task has no trace'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(to_chrome_trace(task.trace, name=f'agent_task_{task.id}'))
+
+    @action(detail=False, methods=['get'])
+    def trace_stats(self, request):
+        """最近任务的分阶段耗时（p50/p95）、token统计和计划缓存命中率"""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 200)), 1000))
+        except ValueError:
+            limit = 200
+
+        traces = AgentTask.objects.filter(
+            conversation__user=request.user
+        ).exclude(trace={}).order_by('-created_at').values_list('trace', flat=True)[:limit]
+        traces = list(traces)
+
+        return Response({
+            'runs': len(traces),
+            'phases': phase_stats(traces),
+            'plan_cache': PlanCache.get_stats(),
+        })
+
+
+class AgentBatchViewSet(mixins.CreateModelMixin,
+                        mixins.ListModelMixin,
+                        mixins.RetrieveModelMixin,
+                        viewsets.GenericViewSet):
+    """Agent批量运行视图集：对一组文档或问题执行Agent，作业由Celery在全局并发限制下执行"""
+    serializer_class = AgentBatchSerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwner]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status']
+
+    def get_queryset(self):
+        """只返回当前用户的批量运行"""
+        return AgentBatch.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        """创建批量运行并投递作业"""
+        serializer = AgentBatchCreateSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        batch = AgentBatchService.create_batch(
+            request.user,
+            serializer.validated_data['name'],
+            serializer.validated_data['expanded_jobs']
+        )
+        return Response(AgentBatchSerializer(batch).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """取消批量运行，尚未开始的作业不再执行"""
+        batch = self.get_object()
+        if batch.status not in ['pending', 'running']:
+            return Response(
+                {'error': 'Batch cannot be cancelled'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        cancelled = AgentBatchService.cancel(batch)
+        return Response({'status': 'cancelled', 'cancelled_jobs': cancelled})
+
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        """各作业的问题、状态和结果（分页）"""
+        batch = self.get_object()
+        tasks = batch.tasks.select_related('message').order_by('created_at').only(
+            'id', 'status', 'result', 'error_message', 'execution_time', 'completed_at',
+            'message__content', 'message__context_data'
+        )
+
+        page = self.paginate_queryset(tasks)
+        rows = [
+            {
+                'task_id': str(task.id),
+                'document_id': (task.message.context_data or {}).get('document_id'),
+                'question': task.message.content,
+                'status': task.status,
+                'answer': task.result,
+                'error': task.error_message,
+                'execution_time': task.execution_time,
+                'completed_at': task.completed_at,
+            }
+            for task in (page if page is not None else tasks)
+        ]
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+
 
 class AgentMemoryViewSet(viewsets.ModelViewSet):
     """Agent记忆视图集"""
@@ -270,8 +374,8 @@ def ai_chat(request):
         output_tokens = usage.get('completion_tokens', 0)
 
         if input_tokens > 0 or output_tokens > 0:
-            TokenUsageService.record_token_usage(
-                user=request.user,
+            TokenUsageService.enqueue_token_usage(
+                user_id=request.user.pk,
                 input_tokens=input_tokens,
                 output_tokens=output_tokens,
                 api_type='ai_chat',
@@ -296,8 +400,8 @@ def ai_chat(request):
         estimated_input_tokens = len(message.split()) + len(str(context))
         estimated_output_tokens = len(fallback_response.split())
 
-        TokenUsageService.record_token_usage(
-            user=request.user,
+        TokenUsageService.enqueue_token_usage(
+            user_id=request.user.pk,
             input_tokens=estimated_input_tokens,
             output_tokens=estimated_output_tokens,
             api_type='ai_chat',
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import atexit
 import logging
-from typing import Optional, Dict, Any, TYPE_CHECKING
+import threading
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, TYPE_CHECKING
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.db import InterfaceError, OperationalError, transaction, close_old_connections
+from django.db.models import F
 from django.utils import timezone
 
 from .models import UserTokenUsage, SystemTokenUsage, TokenUsageRecord
@@ -50,13 +55,11 @@ class TokenUsageService:
                 metadata=metadata or {}
             )
 
-            # 更新用户统计
-            user_usage, created = UserTokenUsage.objects.get_or_create(user=user)
-            user_usage.add_usage(input_tokens, output_tokens)
-
-            # 更新系统统计
-            system_usage = SystemTokenUsage.get_or_create_today()
-            system_usage.add_usage(input_tokens, output_tokens)
+            # 更新用户和系统统计
+            TokenUsageService.apply_aggregates(
+                {user.pk: (input_tokens, output_tokens, 1)},
+                {timezone.now().date(): (input_tokens, output_tokens, 1)},
+            )
 
             logger.info(
                 f"Token usage recorded: user={user.username}, "
@@ -70,6 +73,97 @@ class TokenUsageService:
             logger.error(f"Failed to record token usage: {e}")
             raise
 
+    @staticmethod
+    def enqueue_token_usage(
+        user_id,
+        input_tokens: int,
+        output_tokens: int,
+        api_type: str = 'other',
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        非阻塞地记录token使用情况（可在异步代码中直接调用，无需await）
+
+        事件先进入进程内缓冲区，由后台线程定期批量落库。
+
+        Returns:
+            bool: 是否有token被记录
+        """
+        if not user_id or (input_tokens <= 0 and output_tokens <= 0):
+            return False
+        token_usage_buffer.add(user_id, input_tokens, output_tokens, api_type, metadata)
+        return True
+
+    @staticmethod
+    def enqueue_llm_usage(
+        user_id,
+        response: Dict[str, Any],
+        api_type: str = 'other',
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        从LLM响应中取出usage并非阻塞地记录（缓存命中的响应没有usage）
+
+        Args:
+            user_id: 用户ID
+            response: LLM响应字典，其中的usage字段会被移除
+            api_type: API类型
+            metadata: 额外元数据
+
+        Returns:
+            bool: 是否有token被记录
+        """
+        usage = response.pop('usage', None) if isinstance(response, dict) else None
+        if not isinstance(usage, dict):
+            return False
+        return TokenUsageService.enqueue_token_usage(
+            user_id=user_id,
+            input_tokens=usage.get('prompt_tokens', 0),
+            output_tokens=usage.get('completion_tokens', 0),
+            api_type=api_type,
+            metadata=metadata
+        )
+
+    @staticmethod
+    def apply_aggregates(user_totals: Dict[Any, tuple], daily_totals: Dict[Any, tuple]) -> None:
+        """
+        使用F()增量更新用户和系统统计，每个用户/每天一条UPDATE语句
+
+        Args:
+            user_totals: {user_id: (input_tokens, output_tokens, call_count)}
+            daily_totals: {date: (input_tokens, output_tokens, call_count)}
+        """
+        now = timezone.now()
+
+        existing = set(
+            UserTokenUsage.objects.filter(user_id__in=list(user_totals)).values_list('user_id', flat=True)
+        )
+        missing = [UserTokenUsage(user_id=user_id) for user_id in user_totals if user_id not in existing]
+        if missing:
+            UserTokenUsage.objects.bulk_create(missing, ignore_conflicts=True)
+
+        for user_id, (input_tokens, output_tokens, calls) in user_totals.items():
+            UserTokenUsage.objects.filter(user_id=user_id).update(
+                total_input_tokens=F('total_input_tokens') + input_tokens,
+                total_output_tokens=F('total_output_tokens') + output_tokens,
+                total_tokens=F('total_tokens') + input_tokens + output_tokens,
+                api_call_count=F('api_call_count') + calls,
+                last_updated=now,
+            )
+
+        for date, (input_tokens, output_tokens, calls) in daily_totals.items():
+            SystemTokenUsage.objects.get_or_create(date=date)
+            SystemTokenUsage.objects.filter(date=date).update(
+                daily_input_tokens=F('daily_input_tokens') + input_tokens,
+                daily_output_tokens=F('daily_output_tokens') + output_tokens,
+                daily_total_tokens=F('daily_total_tokens') + input_tokens + output_tokens,
+                daily_api_calls=F('daily_api_calls') + calls,
+                total_input_tokens=F('total_input_tokens') + input_tokens,
+                total_output_tokens=F('total_output_tokens') + output_tokens,
+                total_tokens=F('total_tokens') + input_tokens + output_tokens,
+                total_api_calls=F('total_api_calls') + calls,
+            )
+
     @staticmethod
     def get_user_token_usage(user: User) -> Dict[str, Any]:
         """
@@ -220,3 +314,152 @@ class TokenUsageService:
         except Exception as e:
             logger.error(f"Failed to get top users by token usage: {e}")
             return []
+
+
+class TokenUsageBuffer:
+    """
+    进程内token使用缓冲区
+
+    add()只在内存中追加事件，不访问数据库，可以安全地在事件循环中调用；
+    后台线程每隔flush_interval秒（或积压超过max_pending条时）批量写入：
+    一次bulk_create写明细，每个用户/每天一条F()增量UPDATE写统计。
+    """
+
+    def __init__(self, flush_interval: float = None, max_pending: int = None, auto_flush: bool = None):
+        self.flush_interval = flush_interval or getattr(settings, 'TOKEN_USAGE_FLUSH_INTERVAL', 5.0)
+        self.max_pending = max_pending or getattr(settings, 'TOKEN_USAGE_MAX_PENDING', 500)
+        self.auto_flush = (
+            auto_flush if auto_flush is not None
+            else getattr(settings, 'TOKEN_USAGE_AUTO_FLUSH', True)
+        )
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def add(self, user_id, input_tokens: int, output_tokens: int,
+            api_type: str = 'other', metadata: Optional[Dict[str, Any]] = None) -> None:
+        """追加一条使用事件"""
+        event = {
+            'user_id': user_id,
+            'input_tokens': int(input_tokens or 0),
+            'output_tokens': int(output_tokens or 0),
+            'api_type': api_type,
+            'metadata': metadata or {},
+            'date': timezone.now().date(),
+        }
+        with self._lock:
+            self._pending.append(event)
+            backlog = len(self._pending)
+
+        if self.auto_flush:
+            self._ensure_worker()
+            if backlog >= self.max_pending:
+                self._wakeup.set()
+
+    @property
+    def pending_count(self) -> int:
+        """尚未落库的事件数量"""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        将缓冲区中的事件写入数据库（同步调用，不要在事件循环中直接调用）
+
+        Returns:
+            int: 写入的事件数量
+        """
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = self._pending, []
+            if not events:
+                return 0
+
+            written = self._write_isolating(events)
+            logger.debug(f"Flushed {written} token usage events")
+            return written
+
+    def _write_isolating(self, events: List[Dict[str, Any]]) -> int:
+        """
+        写入事件，写入失败的批次对半拆分重试，单独失败的事件记录日志后丢弃，
+        一条坏事件（如用户已删除、元数据无法序列化）不会阻塞其他事件落库；
+        数据库不可用时未写入的事件放回缓冲区等待下次重试，超出上限的旧事件丢弃
+
+        Returns:
+            int: 写入的事件数量
+        """
+        batches, written = [events], 0
+        while batches:
+            batch = batches.pop()
+            try:
+                self._write(batch)
+            except (OperationalError, InterfaceError) as e:
+                remaining = [event for chunk in batches for event in chunk] + batch
+                logger.error(f"Failed to flush token usage ({len(remaining)} events): {e}")
+                with self._lock:
+                    self._pending = (remaining + self._pending)[-self.max_pending * 10:]
+                return written
+            except Exception as e:
+                if len(batch) == 1:
+                    logger.error(f"Dropped token usage event for user {batch[0]['user_id']}: {e}")
+                else:
+                    middle = len(batch) // 2
+                    batches.extend([batch[middle:], batch[:middle]])
+            else:
+                written += len(batch)
+        return written
+
+    @staticmethod
+    @transaction.atomic
+    def _write(events: List[Dict[str, Any]]) -> None:
+        TokenUsageRecord.objects.bulk_create([
+            TokenUsageRecord(
+                user_id=event['user_id'],
+                api_type=event['api_type'],
+                input_tokens=event['input_tokens'],
+                output_tokens=event['output_tokens'],
+                total_tokens=event['input_tokens'] + event['output_tokens'],
+                metadata=event['metadata'],
+            )
+            for event in events
+        ])
+
+        user_totals = defaultdict(lambda: [0, 0, 0])
+        daily_totals = defaultdict(lambda: [0, 0, 0])
+        for event in events:
+            for totals in (user_totals[event['user_id']], daily_totals[event['date']]):
+                totals[0] += event['input_tokens']
+                totals[1] += event['output_tokens']
+                totals[2] += 1
+
+        TokenUsageService.apply_aggregates(
+            {key: tuple(value) for key, value in user_totals.items()},
+            {key: tuple(value) for key, value in daily_totals.items()},
+        )
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(
+                target=self._run, name='token-usage-flusher', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+# 全局缓冲区实例
+token_usage_buffer = TokenUsageBuffer()
+atexit.register(token_usage_buffer.flush)
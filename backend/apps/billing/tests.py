@@ -0,0 +1,63 @@
+from apps.billing.models import UserTokenUsage, SystemTokenUsage, TokenUsageRecord
+from apps.billing.services import TokenUsageBuffer, TokenUsageService, token_usage_buffer
+from tests.base import BaseAPITestCase
+
+
+class TokenUsageBufferTest(BaseAPITestCase):
+    """token使用缓冲区测试"""
+
+    def test_flush_writes_records_and_aggregates(self):
+        """批量落库明细并增量更新统计"""
+        buffer = TokenUsageBuffer(auto_flush=False)
+        buffer.add(self.user.id, 100, 50, 'agent_execution', {'operation': 'think'})
+        buffer.add(self.user.id, 20, 10, 'document_index')
+
+        self.assertEqual(TokenUsageRecord.objects.count(), 0)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending_count, 0)
+
+        self.assertEqual(TokenUsageRecord.objects.filter(user=self.user).count(), 2)
+        usage = UserTokenUsage.objects.get(user=self.user)
+        self.assertEqual(usage.total_input_tokens, 120)
+        self.assertEqual(usage.total_output_tokens, 60)
+        self.assertEqual(usage.total_tokens, 180)
+        self.assertEqual(usage.api_call_count, 2)
+
+        system = SystemTokenUsage.objects.get()
+        self.assertEqual(system.daily_total_tokens, 180)
+        self.assertEqual(system.total_api_calls, 2)
+
+    def test_flush_accumulates_existing_usage(self):
+        """多次刷新累加到已有统计"""
+        buffer = TokenUsageBuffer(auto_flush=False)
+        buffer.add(self.user.id, 10, 5)
+        buffer.flush()
+        buffer.add(self.user.id, 10, 5)
+        buffer.flush()
+
+        usage = UserTokenUsage.objects.get(user=self.user)
+        self.assertEqual(usage.total_tokens, 30)
+        self.assertEqual(usage.api_call_count, 2)
+
+    def test_bad_event_dropped_without_blocking_batch(self):
+        """单独写入失败的事件被丢弃，同批其他事件照常落库"""
+        buffer = TokenUsageBuffer(auto_flush=False)
+        buffer.add(self.user.id, 10, 5)
+        buffer.add(self.user.id, 20, 10, metadata={'bad': object()})
+        buffer.add(self.user.id, 30, 15)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending_count, 0)
+        self.assertEqual(TokenUsageRecord.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(UserTokenUsage.objects.get(user=self.user).total_tokens, 60)
+
+    def test_enqueue_llm_usage_strips_usage(self):
+        """从LLM响应中取出usage"""
+        response = {'plan': [], 'usage': {'prompt_tokens': 7, 'completion_tokens': 3}}
+
+        self.assertTrue(TokenUsageService.enqueue_llm_usage(self.user.id, response))
+        self.assertNotIn('usage', response)
+        self.assertFalse(TokenUsageService.enqueue_llm_usage(self.user.id, {'content': 'cached'}))
+
+        self.assertEqual(token_usage_buffer.flush(), 1)
+        self.assertEqual(UserTokenUsage.objects.get(user=self.user).total_tokens, 10)
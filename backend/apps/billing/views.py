@@ -2,9 +2,11 @@ import logging
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.utils import timezone
 
+from core.llm import get_llm_client
+from core.llm_cache import LLMCache
 from .services import TokenUsageService
 
 logger = logging.getLogger(__name__)
@@ -103,4 +105,19 @@ class TokenUsageViewSet(viewsets.ViewSet):
             return Response(
                 {'error': f'获取仪表板统计失败: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def llm_metrics(self, request):
+        """获取LLM客户端运行指标（排队深度、等待时间、重试、合并）和缓存命中统计"""
+        try:
+            return Response({
+                'client': get_llm_client().get_metrics(),
+                'cache': LLMCache.get_stats(),
+            })
+        except Exception as e:
+            logger.error(f"Failed to get LLM metrics: {str(e)}", exc_info=True)
+            return Response(
+                {'error': f'获取LLM指标失败: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
@@ -5,7 +5,8 @@ import logging
 from typing import Dict, Any, Optional
 from dataclasses import dataclass, asdict
 
-from core.llm import get_llm_client
+from core.llm import get_llm_client, LaneScheduler
+from core.llm_cache import LLMCache
 from apps.billing.services import TokenUsageService
 
 logger = logging.getLogger(__name__)
@@ -38,6 +39,12 @@ INDEX_GENERATION_PROMPT = """
 """
 
 
+INDEX_SYSTEM_PROMPT = "你是一位严谨的学术助手，请准确分析文档并生成结构化索引。"
+
+# 索引结果的缓存命名空间，模板变化后旧缓存自动失效
+INDEX_CACHE_NAMESPACE = LLMCache.template_namespace(INDEX_GENERATION_PROMPT, INDEX_SYSTEM_PROMPT)
+
+
 @dataclass
 class IndexData:
     """索引数据结构"""
@@ -94,31 +101,25 @@ class DocumentIndexer:
             prompt = INDEX_GENERATION_PROMPT.format(content=content[:8000])  # 限制长度避免token超限
             result = await self.llm_client.generate_json(
                 prompt=prompt,
-                system_prompt="你是一位严谨的学术助手，请准确分析文档并生成结构化索引。",
+                system_prompt=INDEX_SYSTEM_PROMPT,
                 model=model,
                 temperature=0.2,
                 max_tokens=2500,
+                cacheable=True,  # 相同内容重新索引直接命中缓存
+                cache_namespace=INDEX_CACHE_NAMESPACE,
+                lane=LaneScheduler.BACKGROUND,  # 索引让位于交互式对话
             )
 
-            # 记录token使用
-            if user and 'usage' in result:
-                usage = result['usage']
-                input_tokens = usage.get('prompt_tokens', 0)
-                output_tokens = usage.get('completion_tokens', 0)
-                if input_tokens > 0 or output_tokens > 0:
-                    try:
-                        await TokenUsageService.record_token_usage(
-                            user=user,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            api_type='document_index',
-                            metadata={
-                                'content_length': len(content),
-                                'model': model or 'default'
-                            }
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to record token usage for document indexing: {e}")
+            # 记录token使用（非阻塞，批量落库）
+            TokenUsageService.enqueue_llm_usage(
+                user.pk if user else None,
+                result,
+                api_type='document_index',
+                metadata={
+                    'content_length': len(content),
+                    'model': model or 'default'
+                }
+            )
 
             # 验证结果字段
             validated = self._validate_index(result)
@@ -1,8 +1,7 @@
 import logging
 from celery import shared_task
 from django.utils import timezone
-from asgiref.sync import async_to_sync
-import asyncio
+from core.async_runner import run_async
 
 from .models import Document, DocumentChunk, Formula, DocumentSection
 from .services.parser import get_parser
@@ -91,16 +90,11 @@ def process_document_task(self, document_id: str):
 
         # 6. 调用LLM生成索引（异步转同步）
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                index_data = loop.run_until_complete(
-                    document_indexer.generate_index(parsed.cleaned_content, user=document.user)
-                )
-                document.index_data = index_data
-                logger.info(f"LLM indexing successful for document {document_id}")
-            finally:
-                loop.close()
+            index_data = run_async(
+                document_indexer.generate_index(parsed.cleaned_content, user=document.user)
+            )
+            document.index_data = index_data
+            logger.info(f"LLM indexing successful for document {document_id}")
         except Exception as llm_error:
             # LLM 服务不可用时的处理
             logger.warning(f"LLM indexing failed for document {document_id}: {llm_error}")
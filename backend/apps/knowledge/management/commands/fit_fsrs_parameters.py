@@ -0,0 +1,54 @@
+"""
+管理命令：拟合用户的FSRS参数
+默认对数据库中的用户执行与定时任务相同的批量拟合；--synthetic 在模拟数据上测试拟合的吞吐量和效果
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.knowledge.services.fsrs_optimizer import (
+    ReviewHistory, SchedulerParameterJob, fit_weights, synthetic_sequences
+)
+
+
+class Command(BaseCommand):
+    help = '拟合用户的FSRS参数（或在模拟数据上测试拟合性能）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='+', help='只拟合指定用户ID')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批拟合的用户数')
+        parser.add_argument('--iterations', type=int, default=40, help='梯度下降迭代次数')
+        parser.add_argument('--synthetic', type=int, default=0, help='模拟的用户数（不访问数据库）')
+        parser.add_argument('--cards', type=int, default=40, help='模拟时每个用户的卡片数')
+        parser.add_argument('--reviews', type=int, default=8, help='模拟时每张卡片的复习次数')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            self._benchmark(options)
+            return
+
+        result = SchedulerParameterJob.run(options['user'], options['batch_size'], options['iterations'])
+        self.stdout.write(
+            f"{result['users']} 个用户, 更新 {result['updated']} 个, 耗时 {result['seconds']}s"
+        )
+
+    def _benchmark(self, options):
+        users, batch_size = options['synthetic'], options['batch_size']
+        start = time.perf_counter()
+        sequences = synthetic_sequences(users, options['cards'], options['reviews'])
+        self.stdout.write(f'模拟数据: {users} 个用户 ({time.perf_counter() - start:.2f}s)')
+
+        start = time.perf_counter()
+        before_total = after_total = 0.0
+        user_ids = list(sequences)
+        for offset in range(0, users, batch_size):
+            batch = {user_id: sequences[user_id] for user_id in user_ids[offset:offset + batch_size]}
+            _, before, after = fit_weights(ReviewHistory.build(batch), options['iterations'])
+            before_total += before.sum()
+            after_total += after.sum()
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'拟合耗时 {elapsed:.2f}s ({users / elapsed * 60:.0f} 用户/分钟), '
+            f'平均损失 {before_total / users:.4f} -> {after_total / users:.4f}'
+        )
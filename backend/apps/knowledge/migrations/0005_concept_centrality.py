@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0004_notehistory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConceptCentrality',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('graph_version', models.IntegerField()),
+                ('betweenness', models.FloatField(default=0.0)),
+                ('closeness', models.FloatField(default=0.0)),
+                ('in_degree', models.IntegerField(default=0)),
+                ('out_degree', models.IntegerField(default=0)),
+                ('approximate', models.BooleanField(default=False)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('concept', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='centralities', to='knowledge.concept')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='concept_centralities', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'knowledge_concept_centrality',
+                'indexes': [models.Index(fields=['user', 'concept'], name='knowledge_c_user_id_1582e6_idx')],
+            },
+        ),
+    ]
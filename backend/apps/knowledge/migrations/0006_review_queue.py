@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0005_concept_centrality'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewQueueEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('flashcard', '卡片'), ('vocabulary', '生词')], max_length=20)),
+                ('object_id', models.UUIDField()),
+                ('deck', models.CharField(blank=True, max_length=100)),
+                ('due_at', models.DateTimeField()),
+                ('rank', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_queue', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'knowledge_review_queue',
+                'indexes': [models.Index(fields=['user', 'item_type', 'due_at', 'rank'], name='knowledge_r_user_id_05c317_idx'), models.Index(fields=['user', 'item_type', 'rank', 'due_at'], name='knowledge_r_user_id_3919d5_idx')],
+                'unique_together': {('item_type', 'object_id')},
+            },
+        ),
+    ]
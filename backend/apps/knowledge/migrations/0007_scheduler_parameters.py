@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0006_review_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flashcard',
+            name='memory_difficulty',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='flashcard',
+            name='stability',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SchedulerParameters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('algorithm', models.CharField(choices=[('sm2', 'SM-2'), ('fsrs', 'FSRS')], default='sm2', max_length=10)),
+                ('weights', models.JSONField(blank=True, default=list)),
+                ('desired_retention', models.FloatField(default=0.9)),
+                ('review_count', models.IntegerField(default=0)),
+                ('log_loss', models.FloatField(blank=True, null=True)),
+                ('fitted_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='scheduler_parameters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'knowledge_scheduler_parameters',
+            },
+        ),
+    ]
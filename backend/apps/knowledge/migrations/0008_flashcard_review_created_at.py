@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0007_scheduler_parameters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='flashcardreview',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
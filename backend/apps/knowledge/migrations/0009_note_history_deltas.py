@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:08
+
+from django.db import migrations, models
+
+from apps.knowledge.services.text_delta import apply_delta, content_hash, make_delta
+
+SNAPSHOT_INTERVAL = 20
+
+
+def compress_history(apps, schema_editor):
+    """为已有记录编号，除每条快照链的首条外改存相对上一版本的差异"""
+    NoteHistory = apps.get_model('knowledge', 'NoteHistory')
+    note_ids = NoteHistory.objects.values_list('note_id', flat=True).order_by().distinct()
+    for note_id in note_ids.iterator():
+        previous, base_version = None, 1
+        entries = NoteHistory.objects.filter(note_id=note_id).order_by('edited_at', 'id')
+        for version, entry in enumerate(entries.iterator(), start=1):
+            content = entry.content
+            entry.version, entry.content_hash = version, content_hash(content)
+            delta = make_delta(previous, content) if previous is not None else None
+            if (delta is not None and version - base_version < SNAPSHOT_INTERVAL
+                    and len(delta) < len(content.encode('utf-8')) // 2):
+                entry.is_snapshot, entry.content, entry.content_delta = False, '', delta
+            else:
+                entry.is_snapshot, entry.content_delta, base_version = True, None, version
+            entry.base_version = base_version
+            entry.save(update_fields=[
+                'version', 'base_version', 'is_snapshot', 'content', 'content_delta', 'content_hash'
+            ])
+            previous = content
+
+
+def expand_history(apps, schema_editor):
+    """回滚时把差异还原为完整内容"""
+    NoteHistory = apps.get_model('knowledge', 'NoteHistory')
+    note_ids = NoteHistory.objects.filter(is_snapshot=False).values_list('note_id', flat=True).order_by().distinct()
+    for note_id in note_ids.iterator():
+        content = None
+        for entry in NoteHistory.objects.filter(note_id=note_id).order_by('version').iterator():
+            if entry.is_snapshot:
+                content = entry.content
+                continue
+            content = apply_delta(content, bytes(entry.content_delta))
+            entry.content = content
+            entry.save(update_fields=['content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0008_flashcard_review_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notehistory',
+            name='base_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notehistory',
+            name='content_delta',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notehistory',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='notehistory',
+            name='is_snapshot',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='notehistory',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='notehistory',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(compress_history, expand_history),
+        migrations.AlterUniqueTogether(
+            name='notehistory',
+            unique_together={('note', 'version')},
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
-from django.db import models
+from typing import Optional
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from apps.documents.models import Document, DocumentChunk
@@ -127,6 +128,38 @@ class ConceptRelation(models.Model):
         return f"{self.source_concept.name} -> {self.target_concept.name} ({self.get_relation_type_display()})"
 
 
+class ConceptCentrality(models.Model):
+    """概念中心性（按图版本由分析任务批量计算）"""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='concept_centralities',
+        null=True,
+        blank=True  # 为空表示全部概念的图
+    )
+    concept = models.ForeignKey(
+        Concept,
+        on_delete=models.CASCADE,
+        related_name='centralities'
+    )
+    graph_version = models.IntegerField()  # 计算时的图版本
+    betweenness = models.FloatField(default=0.0)  # 介数中心性（归一化）
+    closeness = models.FloatField(default=0.0)  # 接近中心性
+    in_degree = models.IntegerField(default=0)
+    out_degree = models.IntegerField(default=0)
+    approximate = models.BooleanField(default=False)  # 介数是否为抽样近似值
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'knowledge_concept_centrality'
+        indexes = [
+            models.Index(fields=['user', 'concept']),
+        ]
+
+    def __str__(self):
+        return f"Centrality of {self.concept_id} (v{self.graph_version})"
+
+
 class Note(models.Model):
     """用户笔记"""
     NOTE_TYPE_CHOICES = [
@@ -192,56 +225,34 @@ class Note(models.Model):
     def __str__(self):
         return f"{self.title} - {self.user.email}"
 
+    # 记入编辑历史的字段
+    HISTORY_FIELDS = ('title', 'content', 'tags', 'is_public', 'is_bookmarked')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if set(cls.HISTORY_FIELDS) <= set(field_names):
+            instance._saved_state = instance._history_state()
+        return instance
+
+    def _history_state(self) -> dict:
+        """当前的历史字段值"""
+        state = {field: getattr(self, field) for field in self.HISTORY_FIELDS}
+        state['tags'] = list(state['tags'] or [])
+        return state
+
     def save(self, *args, **kwargs):
-        # 检查是否是更新操作
-        is_update = self.pk is not None
-        if is_update:
-            # 获取之前的版本用于比较
-            try:
-                previous_note = Note.objects.get(pk=self.pk)
-                super().save(*args, **kwargs)  # 先保存当前更改
-                self._create_history_entry(previous_note, 'updated')
-                return
-            except Note.DoesNotExist:
-                # 如果找不到之前的版本，当作创建处理
-                pass
+        # 上一版本取自加载或上次保存时记下的状态；没有记录（如只加载了部分字段）时才查询
+        previous = getattr(self, '_saved_state', None)
+        if previous is None and not self._state.adding:
+            previous = Note.objects.filter(pk=self.pk).values(*self.HISTORY_FIELDS).first()
 
-        # 创建新笔记或更新失败的情况
         super().save(*args, **kwargs)
 
-    def _create_history_entry(self, previous_note=None, change_type='updated'):
-        """创建历史记录条目"""
-        from .models import NoteHistory
-
-        # 如果是创建操作，previous_note为None
-        if change_type == 'created' or previous_note is None:
-            change_summary = "创建了笔记"
-        else:
-            # 分析变更
-            changes = []
-            if previous_note.title != self.title:
-                changes.append("标题")
-            if previous_note.content != self.content:
-                changes.append("内容")
-            if set(previous_note.tags) != set(self.tags):
-                changes.append("标签")
-            if (previous_note.is_public != self.is_public or
-                previous_note.is_bookmarked != self.is_bookmarked):
-                changes.append("设置")
-
-            change_summary = f"修改了{', '.join(changes)}" if changes else "笔记已更新"
-
-        NoteHistory.objects.create(
-            note=self,
-            user=self.user,
-            title=self.title,
-            content=self.content,
-            tags=self.tags,
-            is_public=self.is_public,
-            is_bookmarked=self.is_bookmarked,
-            change_type=change_type,
-            change_summary=change_summary,
-        )
+        current = self._history_state()
+        if previous is not None and previous != current:
+            NoteHistory.record(self, previous, current)
+        self._saved_state = current
 
 
 class Flashcard(models.Model):
@@ -275,6 +286,8 @@ class Flashcard(models.Model):
     review_count = models.IntegerField(default=0)  # 复习次数
     ease_factor = models.FloatField(default=2.5)  # 易度因子（SM-2算法）
     interval = models.IntegerField(default=1)  # 复习间隔（天）
+    stability = models.FloatField(null=True, blank=True)  # 记忆稳定性（天，FSRS）
+    memory_difficulty = models.FloatField(null=True, blank=True)  # 记忆难度 1-10（FSRS）
     last_reviewed_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)  # 是否活跃（未被删除）
     created_at = models.DateTimeField(auto_now_add=True)
@@ -328,6 +341,65 @@ class Flashcard(models.Model):
         self.save(update_fields=['interval', 'ease_factor', 'next_review_date', 'review_count', 'last_reviewed_at'])
 
 
+class ReviewQueueEntry(models.Model):
+    """复习队列条目（按到期时间物化的待复习卡片和生词）"""
+    ITEM_TYPE_CHOICES = [
+        ('flashcard', '卡片'),
+        ('vocabulary', '生词'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='review_queue'
+    )
+    item_type = models.CharField(max_length=20, choices=ITEM_TYPE_CHOICES)
+    object_id = models.UUIDField()  # 卡片或生词ID
+    deck = models.CharField(max_length=100, blank=True)  # 卡片的卡组
+    due_at = models.DateTimeField()  # 到期时间
+    rank = models.IntegerField(default=0)  # 优先级（小者优先）
+
+    class Meta:
+        db_table = 'knowledge_review_queue'
+        unique_together = [
+            ['item_type', 'object_id']
+        ]
+        indexes = [
+            models.Index(fields=['user', 'item_type', 'due_at', 'rank']),
+            models.Index(fields=['user', 'item_type', 'rank', 'due_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.item_type} {self.object_id} due {self.due_at}"
+
+
+class SchedulerParameters(models.Model):
+    """用户的复习调度参数"""
+    ALGORITHM_CHOICES = [
+        ('sm2', 'SM-2'),
+        ('fsrs', 'FSRS'),
+    ]
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='scheduler_parameters'
+    )
+    algorithm = models.CharField(max_length=10, choices=ALGORITHM_CHOICES, default='sm2')
+    weights = models.JSONField(default=list, blank=True)  # FSRS参数，为空时使用默认参数
+    desired_retention = models.FloatField(default=0.9)  # 目标保持率
+    review_count = models.IntegerField(default=0)  # 拟合使用的复习数
+    log_loss = models.FloatField(null=True, blank=True)  # 拟合后的平均对数损失
+    fitted_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'knowledge_scheduler_parameters'
+
+    def __str__(self):
+        return f"{self.user.email} - {self.algorithm}"
+
+
 class Highlight(models.Model):
     """文档高亮标注"""
     HIGHLIGHT_TYPE_CHOICES = [
@@ -413,7 +485,7 @@ class FlashcardReview(models.Model):
     previous_ease_factor = models.FloatField()  # 上次易度因子
     new_interval = models.IntegerField()  # 新间隔
     new_ease_factor = models.FloatField()  # 新易度因子
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)  # 复习时间（离线复习为客户端记录的时间）
 
     class Meta:
         db_table = 'flashcard_reviews'
@@ -458,12 +530,18 @@ class StudySession(models.Model):
 
 
 class NoteHistory(models.Model):
-    """笔记编辑历史"""
+    """
+    笔记编辑历史
+
+    每隔若干版本保存一次完整快照，其余版本只保存相对上一版本的压缩差异，读取时从最近的快照向后重建内容；
+    合并窗口内的连续编辑（如自动保存）合并为一条记录，edited_at为窗口内首次编辑的时间。
+    """
     CHANGE_TYPE_CHOICES = [
         ('created', '创建'),
         ('updated', '更新'),
         ('restored', '恢复'),
     ]
+    CHANGE_LABELS = ('标题', '内容', '标签', '设置')
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     note = models.ForeignKey(
@@ -476,8 +554,13 @@ class NoteHistory(models.Model):
         on_delete=models.CASCADE,
         related_name='note_edits'
     )
+    version = models.IntegerField(default=0)  # 笔记内的版本号（从1递增）
+    base_version = models.IntegerField(default=0)  # 重建内容所需的快照版本（快照为自身）
+    is_snapshot = models.BooleanField(default=True)  # 是否保存完整内容
     title = models.CharField(max_length=200)
-    content = models.TextField()
+    content = models.TextField(blank=True)  # 完整内容（仅快照）
+    content_delta = models.BinaryField(null=True, blank=True)  # 相对上一版本的压缩差异（非快照）
+    content_hash = models.CharField(max_length=40, blank=True)  # 该版本内容的SHA1
     tags = models.JSONField(default=list, blank=True)  # 标签列表
     is_public = models.BooleanField(default=False)  # 是否公开
     is_bookmarked = models.BooleanField(default=False)  # 是否收藏
@@ -488,6 +571,9 @@ class NoteHistory(models.Model):
     class Meta:
         db_table = 'knowledge_note_history'
         ordering = ['-edited_at']
+        unique_together = [
+            ['note', 'version']
+        ]
         indexes = [
             models.Index(fields=['note', '-edited_at']),
             models.Index(fields=['user', '-edited_at']),
@@ -497,6 +583,167 @@ class NoteHistory(models.Model):
     def __str__(self):
         return f"History for {self.note.title} - {self.change_type} at {self.edited_at}"
 
+    # ---- 写入 ----
+
+    @classmethod
+    def _summary(cls, previous: dict, current: dict, merged: str = '') -> str:
+        """变更摘要，合并记录时并入已有摘要中的变更项"""
+        changed = {label for label in cls.CHANGE_LABELS if label in merged}
+        if previous['title'] != current['title']:
+            changed.add('标题')
+        if previous['content'] != current['content']:
+            changed.add('内容')
+        if set(previous['tags']) != set(current['tags']):
+            changed.add('标签')
+        if (previous['is_public'], previous['is_bookmarked']) != (current['is_public'], current['is_bookmarked']):
+            changed.add('设置')
+        labels = [label for label in cls.CHANGE_LABELS if label in changed]
+        return f"修改了{', '.join(labels)}" if labels else "笔记已更新"
+
+    def _set_content(self, base: Optional[str], content: str, snapshot_interval: int):
+        """base为上一版本内容（None表示未知）；差异不够小或距快照太远时保存快照"""
+        from apps.knowledge.services.text_delta import content_hash, make_delta
+
+        self.content_hash = content_hash(content)
+        if base is not None and self.version - self.base_version < snapshot_interval:
+            delta = make_delta(base, content)
+            if len(delta) < len(content.encode('utf-8')) // 2:
+                self.is_snapshot, self.content, self.content_delta = False, '', delta
+                return
+        self.is_snapshot, self.content, self.content_delta, self.base_version = True, content, None, self.version
+
+    RECORD_ATTEMPTS = 3  # 版本号冲突时的最多尝试次数
+
+    @classmethod
+    def record(cls, note: 'Note', previous: dict, current: dict) -> 'NoteHistory':
+        """
+        记录一次编辑
+
+        同一笔记的并发保存可能读到相同的最新版本，写入时违反(note, version)唯一约束；
+        此时重新读取最新记录，以下一个版本号重试。
+
+        Args:
+            note: 已保存的笔记
+            previous: 编辑前的历史字段值
+            current: 编辑后的历史字段值
+        """
+        for attempt in range(cls.RECORD_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return cls._record(note, previous, current)
+            except IntegrityError:
+                if attempt == cls.RECORD_ATTEMPTS - 1:
+                    raise
+
+    @classmethod
+    def _latest(cls, note: 'Note') -> Optional['NoteHistory']:
+        """笔记的最新一条记录"""
+        return cls.objects.filter(note=note).order_by('-version').first()
+
+    @classmethod
+    def _record(cls, note: 'Note', previous: dict, current: dict) -> 'NoteHistory':
+        from django.conf import settings
+        from apps.knowledge.services.text_delta import apply_delta, content_hash
+
+        coalesce_seconds = getattr(settings, 'NOTE_HISTORY_COALESCE_SECONDS', 60)
+        snapshot_interval = getattr(settings, 'NOTE_HISTORY_SNAPSHOT_INTERVAL', 20)
+        latest = cls._latest(note)
+        # 最近一条记录的内容即编辑前的内容时，增量才有可靠的基准
+        in_sync = latest is not None and latest.content_hash == content_hash(previous['content'])
+
+        entry = None
+        if (in_sync and latest.user_id == note.user_id
+                and (timezone.now() - latest.edited_at).total_seconds() < coalesce_seconds):
+            # 合并到最近一条：新的增量以它的上一版本为基准
+            entry, summary = latest, cls._summary(previous, current, latest.change_summary)
+            if latest.is_snapshot:
+                entry.content, entry.content_hash = current['content'], content_hash(current['content'])
+            else:
+                try:
+                    base = apply_delta(previous['content'], bytes(latest.content_delta), reverse=True)
+                except ValueError:
+                    base = None
+                entry._set_content(base, current['content'], snapshot_interval)
+        if entry is None:
+            entry = cls(
+                note=note,
+                user=note.user,
+                version=latest.version + 1 if latest else 1,
+                base_version=latest.base_version if latest else 1,
+                change_type='updated',
+            )
+            summary = cls._summary(previous, current)
+            entry._set_content(previous['content'] if in_sync else None, current['content'], snapshot_interval)
+
+        entry.title = current['title']
+        entry.tags = current['tags']
+        entry.is_public = current['is_public']
+        entry.is_bookmarked = current['is_bookmarked']
+        entry.change_summary = summary
+        entry.save()
+        return entry
+
+    # ---- 读取 ----
+
+    @classmethod
+    def attach_contents(cls, entries) -> list:
+        """
+        批量重建一组记录（通常是一页历史）及其上一版本的内容
+
+        每个笔记一次查询取出从最早所需快照到最新版本的记录，按版本顺序应用差异；
+        重建结果缓存在记录上，get_content/get_changes不再查询。
+        """
+        from apps.knowledge.services.text_delta import apply_delta
+
+        entries = list(entries)
+        by_note = {}
+        for entry in entries:
+            by_note.setdefault(entry.note_id, []).append(entry)
+
+        for note_id, note_entries in by_note.items():
+            oldest = min(note_entries, key=lambda entry: entry.version)
+            low = min(entry.base_version for entry in note_entries)
+            if oldest.is_snapshot and oldest.version > 1:
+                # 最早一条的上一版本属于更早的快照链
+                low = min(low, cls.objects.filter(note_id=note_id, version=oldest.version - 1).values_list(
+                    'base_version', flat=True
+                ).first() or low)
+            rows = cls.objects.filter(
+                note_id=note_id, version__gte=low, version__lte=max(entry.version for entry in note_entries)
+            ).order_by('version').only(
+                'id', 'note_id', 'version', 'is_snapshot', 'content', 'content_delta',
+                'title', 'tags', 'is_public', 'is_bookmarked', 'edited_at'
+            )
+
+            contents, content = {}, None
+            for row in rows:
+                if row.is_snapshot:
+                    content = row.content
+                elif content is not None:
+                    content = apply_delta(content, bytes(row.content_delta))
+                row._content = content
+                contents[row.version] = row
+
+            for entry in note_entries:
+                entry._content = contents[entry.version]._content
+                entry._previous = contents.get(entry.version - 1)
+        return entries
+
+    def get_content(self) -> str:
+        """该版本的完整内容（非快照时从快照重建）"""
+        if not hasattr(self, '_content'):
+            if self.is_snapshot:
+                self._content = self.content
+            else:
+                self.attach_contents([self])
+        return self._content
+
+    def get_previous(self) -> Optional['NoteHistory']:
+        """上一版本的记录"""
+        if not hasattr(self, '_previous'):
+            self.attach_contents([self])
+        return self._previous
+
     def get_changes(self, previous_history=None):
         """获取相对于上一次编辑的变更"""
         if not previous_history:
@@ -513,7 +760,7 @@ class NoteHistory(models.Model):
         changes['title_changed'] = self.title != previous_history.title
 
         # 检查内容变更
-        changes['content_changed'] = self.content != previous_history.content
+        changes['content_changed'] = self.get_content() != previous_history.get_content()
 
         # 检查标签变更
         changes['tags_changed'] = set(self.tags) != set(previous_history.tags)
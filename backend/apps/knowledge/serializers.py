@@ -241,15 +241,40 @@ class FlashcardReviewActionSerializer(serializers.Serializer):
         return value
 
 
+class FlashcardBatchReviewItemSerializer(serializers.Serializer):
+    """批量复习中的一次复习"""
+    card_id = serializers.UUIDField(help_text="卡片ID")
+    quality = serializers.IntegerField(min_value=0, max_value=5, help_text="复习质量评分 (0-5)")
+    review_time = serializers.IntegerField(required=False, default=0, min_value=0, help_text="复习用时（秒）")
+    reviewed_at = serializers.DateTimeField(required=False, help_text="复习时间（离线复习），默认为提交时间")
+
+
+class FlashcardBatchReviewSerializer(serializers.Serializer):
+    """批量复习序列化器（按复习顺序排列）"""
+    reviews = serializers.ListField(
+        child=FlashcardBatchReviewItemSerializer(),
+        min_length=1,
+        max_length=500,
+        help_text="复习列表"
+    )
+
+
 class GraphDataSerializer(serializers.Serializer):
     """图谱数据序列化器"""
     concept_id = serializers.UUIDField(required=False, help_text="中心概念ID")
     max_depth = serializers.IntegerField(default=2, min_value=1, max_value=5, help_text="最大深度")
+    max_nodes = serializers.IntegerField(default=500, min_value=1, max_value=5000, help_text="子图最大节点数")
     relation_types = serializers.ListField(
-        child=serializers.CharField(),
+        child=serializers.ChoiceField(choices=ConceptRelation.RELATION_TYPE_CHOICES),
         required=False,
         help_text="关系类型过滤"
     )
+    fields = serializers.ChoiceField(
+        choices=['ids', 'basic', 'full'],
+        default='full',
+        help_text="字段投影：ids仅ID，basic含名称等属性，full另含描述"
+    )
+    stream = serializers.BooleanField(default=False, help_text="以NDJSON流式返回")
 
 
 class RecommendationSerializer(serializers.Serializer):
@@ -306,6 +331,7 @@ class NoteHistorySerializer(serializers.ModelSerializer):
     """笔记历史记录序列化器"""
     user_email = serializers.CharField(source='user.email', read_only=True)
     change_type_display = serializers.CharField(source='get_change_type_display', read_only=True)
+    content = serializers.CharField(source='get_content', read_only=True)
     changes = serializers.SerializerMethodField()
 
     class Meta:
@@ -318,11 +344,5 @@ class NoteHistorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'edited_at']
 
     def get_changes(self, obj):
-        """获取变更详情"""
-        # 获取上一条历史记录
-        previous_history = NoteHistory.objects.filter(
-            note=obj.note,
-            edited_at__lt=obj.edited_at
-        ).order_by('-edited_at').first()
-
-        return obj.get_changes(previous_history)
+        """获取变更详情（与上一版本比较，内容按需重建）"""
+        return obj.get_changes(obj.get_previous())
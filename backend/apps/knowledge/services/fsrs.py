@@ -0,0 +1,108 @@
+"""
+FSRS记忆模型
+按FSRS-4.5的公式用稳定性（S，天）和难度（D，1-10）描述记忆状态：
+回忆概率 R(t) = (1 + FACTOR·t/S)^DECAY，每次复习后按评分更新S和D，
+下次复习间隔取回忆概率降到目标保持率的时间
+"""
+import math
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+DECAY = -0.5
+FACTOR = 19 / 81  # 使 R(S) = 0.9
+
+# FSRS-4.5默认参数
+DEFAULT_WEIGHTS = (
+    0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+    0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+)
+
+# 参数取值范围（拟合时约束）
+WEIGHT_BOUNDS = (
+    (0.1, 100.0), (0.1, 100.0), (0.1, 100.0), (0.1, 100.0),
+    (1.0, 10.0), (0.1, 5.0), (0.1, 5.0), (0.0, 0.5), (0.0, 3.0),
+    (0.1, 0.8), (0.01, 2.5), (0.5, 5.0), (0.01, 0.2), (0.01, 0.9),
+    (0.01, 2.0), (0.0, 1.0), (1.0, 4.0),
+)
+
+MIN_STABILITY = 0.01
+MAX_STABILITY = 36500.0
+
+# 评分：1=忘记 2=困难 3=良好 4=简单
+AGAIN, HARD, GOOD, EASY = 1, 2, 3, 4
+
+
+def grade_from_quality(quality: int) -> int:
+    """SM-2的0-5评分转为FSRS评分"""
+    if quality < 3:
+        return AGAIN
+    return {3: HARD, 4: GOOD}.get(quality, EASY)
+
+
+def grade_from_vocabulary_review(is_correct: bool, difficulty_rating: Optional[int] = None) -> int:
+    """生词复习结果转为FSRS评分（难度评分1-5，越大越难）"""
+    if not is_correct:
+        return AGAIN
+    if difficulty_rating is None or difficulty_rating == 3:
+        return GOOD
+    return HARD if difficulty_rating > 3 else EASY
+
+
+@dataclass
+class MemoryState:
+    """记忆状态"""
+    stability: float
+    difficulty: float
+
+
+def retrievability(elapsed_days: float, stability: float) -> float:
+    """经过elapsed_days天后的回忆概率"""
+    return (1 + FACTOR * max(elapsed_days, 0.0) / stability) ** DECAY
+
+
+def _clamp(value: float, low: float, high: float) -> float:
+    return min(max(value, low), high)
+
+
+def init_difficulty(weights: Sequence[float], grade: int) -> float:
+    return _clamp(weights[4] - (grade - 3) * weights[5], 1.0, 10.0)
+
+
+def next_state(
+    state: Optional[MemoryState],
+    grade: int,
+    elapsed_days: float,
+    weights: Sequence[float] = DEFAULT_WEIGHTS
+) -> MemoryState:
+    """
+    复习后的记忆状态
+
+    Args:
+        state: 复习前的状态，新卡片为None
+        grade: FSRS评分（1-4）
+        elapsed_days: 距上次复习的天数
+        weights: 模型参数
+    """
+    w = weights
+    if state is None:
+        return MemoryState(_clamp(w[grade - 1], MIN_STABILITY, MAX_STABILITY), init_difficulty(w, grade))
+
+    s, d = state.stability, state.difficulty
+    r = retrievability(elapsed_days, s)
+    if grade == AGAIN:
+        stability = min(w[11] * d ** -w[12] * ((s + 1) ** w[13] - 1) * math.exp((1 - r) * w[14]), s)
+    else:
+        hard_penalty = w[15] if grade == HARD else 1.0
+        easy_bonus = w[16] if grade == EASY else 1.0
+        stability = s * (1 + math.exp(w[8]) * (11 - d) * s ** -w[9] * (math.exp((1 - r) * w[10]) - 1)
+                         * hard_penalty * easy_bonus)
+
+    # 难度按评分调整并向初始难度w[4]回归（FSRS-4.5）
+    difficulty = w[7] * w[4] + (1 - w[7]) * (d - w[6] * (grade - 3))
+    return MemoryState(_clamp(stability, MIN_STABILITY, MAX_STABILITY), _clamp(difficulty, 1.0, 10.0))
+
+
+def next_interval(stability: float, desired_retention: float = 0.9, maximum_interval: int = 36500) -> int:
+    """回忆概率降到目标保持率所需的天数（至少1天）"""
+    interval = stability / FACTOR * (desired_retention ** (1 / DECAY) - 1)
+    return int(_clamp(round(interval), 1, maximum_interval))
@@ -0,0 +1,297 @@
+"""
+FSRS参数拟合
+把一批用户的复习历史整理成按卡片对齐的数组，用NumPy对所有用户同时做梯度下降：
+按复习序号逐步推进，每一步对所有仍有复习的卡片向量化计算回忆概率和记忆状态；
+各用户的损失互不相关，每次扰动一个参数即可得到所有用户对该参数的有限差分梯度
+"""
+import logging
+import math
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from apps.knowledge.models import FlashcardReview, SchedulerParameters
+from apps.knowledge.services.fsrs import (
+    AGAIN, DECAY, DEFAULT_WEIGHTS, FACTOR, MAX_STABILITY, MIN_STABILITY, WEIGHT_BOUNDS,
+    grade_from_quality, next_interval, next_state, retrievability
+)
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+# 复习历史来源：user_ids -> (用户ID, 卡片键, FSRS评分, 复习时间)，同一卡片按时间升序
+HistorySource = Callable[[List], Iterable[Tuple[object, object, int, datetime]]]
+
+_LOWER = np.array([low for low, _ in WEIGHT_BOUNDS])
+_RANGE = np.array([high - low for low, high in WEIGHT_BOUNDS])
+_DEFAULT_X = (np.array(DEFAULT_WEIGHTS) - _LOWER) / _RANGE
+
+
+@dataclass
+class ReviewHistory:
+    """一批用户的复习序列，卡片按复习次数降序排列，第k步仍有复习的卡片是前缀"""
+    user_ids: List
+    card_user: np.ndarray  # (C,) 卡片所属用户下标
+    grades: np.ndarray  # (L, C) 第k步各卡片的评分，0为填充
+    elapsed: np.ndarray  # (L, C) 第k步距上次复习的天数
+    lengths: np.ndarray  # (C,) 每张卡片的复习次数
+    active: np.ndarray  # (L,) 第k步仍有复习的卡片数
+    review_counts: np.ndarray  # (U,) 参与损失的复习数（每张卡片首次复习之后的复习）
+
+    @classmethod
+    def build(cls, sequences: Dict[object, List[List[Tuple[int, float]]]],
+              max_reviews: int = 64, same_day_hours: float = 12.0) -> 'ReviewHistory':
+        """
+        Args:
+            sequences: {用户ID: [[(评分, 时间戳秒), ...] 每张卡片一个序列]}
+            max_reviews: 每张卡片最多使用的复习数
+            same_day_hours: 间隔小于该值的复习视为同一次（只保留第一次）
+        """
+        user_ids = list(sequences)
+        cards = []
+        for user_index, user_id in enumerate(user_ids):
+            for reviews in sequences[user_id]:
+                kept = []
+                for grade, timestamp in reviews:
+                    if kept and timestamp - kept[-1][1] < same_day_hours * 3600:
+                        continue
+                    kept.append((grade, timestamp))
+                if len(kept) >= 2:
+                    cards.append((user_index, kept[:max_reviews]))
+        cards.sort(key=lambda card: -len(card[1]))
+
+        width = len(cards[0][1]) if cards else 1
+        grades = np.zeros((width, len(cards)), dtype=np.int8)
+        elapsed = np.zeros((width, len(cards)))
+        lengths = np.zeros(len(cards), dtype=np.int64)
+        card_user = np.zeros(len(cards), dtype=np.int64)
+        for row, (user_index, reviews) in enumerate(cards):
+            card_user[row] = user_index
+            lengths[row] = len(reviews)
+            grades[:len(reviews), row] = [grade for grade, _ in reviews]
+            stamps = np.array([timestamp for _, timestamp in reviews])
+            elapsed[1:len(reviews), row] = np.diff(stamps) / 86400
+
+        active = np.array([(lengths > step).sum() for step in range(width)], dtype=np.int64)
+        review_counts = np.bincount(card_user, weights=lengths - 1, minlength=len(user_ids))
+        return cls(user_ids, card_user, grades, elapsed, lengths, active, review_counts)
+
+
+def user_losses(history: ReviewHistory, weights: np.ndarray, chunk_size: int = 1024) -> np.ndarray:
+    """
+    每个用户的对数损失之和
+
+    Args:
+        weights: (..., U, 17) 每个用户的参数，前导维度可用于一次计算多组参数
+        chunk_size: 每块卡片数，分块使中间数组留在CPU缓存中
+
+    Returns:
+        np.ndarray: (..., U)
+    """
+    batch_shape, users = weights.shape[:-2], len(history.user_ids)
+    card_count = len(history.card_user)
+    loss = np.zeros(batch_shape + (card_count,))
+
+    for offset in range(0, card_count, chunk_size):
+        cards = slice(offset, offset + chunk_size)
+        # 每个参数按卡片展开为 (..., 块内卡片数)
+        w = [weights[..., j][..., history.card_user[cards]] for j in range(weights.shape[-1])]
+        first = history.grades[0, cards].astype(np.int64) - 1
+        stability = np.clip(np.choose(first, w[:4]), MIN_STABILITY, MAX_STABILITY)
+        difficulty = np.clip(w[4] - (first - 2) * w[5], 1, 10)
+        chunk_loss = loss[..., cards]
+
+        for step in range(1, history.grades.shape[0]):
+            n = min(max(history.active[step] - offset, 0), chunk_size)
+            if not n:
+                break
+            s, d = stability[..., :n], difficulty[..., :n]
+            wk = [column[..., :n] for column in w]
+            grade = history.grades[step, offset:offset + n]
+            recalled = grade > 1
+
+            # 幂运算改写为exp/log
+            r = np.clip(
+                np.exp(DECAY * np.log1p(FACTOR * history.elapsed[step, offset:offset + n] / s)), 1e-4, 1 - 1e-4
+            )
+            chunk_loss[..., :n] -= np.log(np.where(recalled, r, 1 - r))
+
+            bonus = np.where(grade == 2, wk[15], 1.0) * np.where(grade == 4, wk[16], 1.0)
+            recall_s = s * (1 + np.exp(wk[8] - wk[9] * np.log(s)) * (11 - d) * np.expm1((1 - r) * wk[10]) * bonus)
+            forget_s = np.minimum(
+                wk[11] * np.exp((1 - r) * wk[14] - wk[12] * np.log(d)) * np.expm1(wk[13] * np.log1p(s)), s
+            )
+            stability[..., :n] = np.clip(np.where(recalled, recall_s, forget_s), MIN_STABILITY, MAX_STABILITY)
+            difficulty[..., :n] = np.clip(
+                wk[7] * wk[4] + (1 - wk[7]) * (d - wk[6] * (grade - 3)), 1, 10
+            )
+
+    flat = loss.reshape(-1, card_count)
+    offsets = (np.arange(flat.shape[0]) * users)[:, None] + history.card_user
+    totals = np.bincount(offsets.ravel(), weights=flat.ravel(), minlength=flat.shape[0] * users)
+    return totals.reshape(batch_shape + (users,))
+
+
+def fit_weights(history: ReviewHistory, iterations: int = 40, learning_rate: float = 0.02,
+                l2: float = 0.05, step: float = 1e-3) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    对所有用户同时拟合参数（Adam，参数按取值范围归一化到[0, 1]，L2正则拉向默认参数）
+
+    梯度用中心差分：每次迭代把17个参数的正负扰动叠成一批，一次前向计算得到全部用户的梯度
+
+    Returns:
+        Tuple: (参数 (U, 17), 默认参数下的平均损失 (U,), 拟合后的平均损失 (U,))
+    """
+    users, size = len(history.user_ids), len(DEFAULT_WEIGHTS)
+    counts = np.maximum(history.review_counts, 1)
+    x = np.tile(_DEFAULT_X, (users, 1))
+    m, v = np.zeros_like(x), np.zeros_like(x)
+    beta1, beta2 = 0.9, 0.999
+    offsets = np.zeros((2 * size, 1, size))
+    offsets[np.arange(size), 0, np.arange(size)] = step
+    offsets[size + np.arange(size), 0, np.arange(size)] = -step
+
+    def objective(params: np.ndarray) -> np.ndarray:
+        return user_losses(history, _LOWER + params * _RANGE) / counts
+
+    initial = objective(x)
+    for iteration in range(1, iterations + 1):
+        perturbed = np.clip(x[None] + offsets, 0, 1)  # (34, U, 17)
+        losses = objective(perturbed)
+        widths = np.maximum(
+            perturbed[:size, :, np.arange(size)].diagonal(axis1=0, axis2=2)
+            - perturbed[size:, :, np.arange(size)].diagonal(axis1=0, axis2=2),
+            1e-12
+        )  # (U, 17)
+        grad = (losses[:size] - losses[size:]).T / widths + 2 * l2 * (x - _DEFAULT_X)
+
+        m = beta1 * m + (1 - beta1) * grad
+        v = beta2 * v + (1 - beta2) * grad ** 2
+        x = np.clip(
+            x - learning_rate * (m / (1 - beta1 ** iteration)) / (np.sqrt(v / (1 - beta2 ** iteration)) + 1e-8),
+            0, 1
+        )
+
+    return _LOWER + x * _RANGE, initial, objective(x)
+
+
+def synthetic_sequences(users: int, cards: int = 40, reviews: int = 8, seed: int = 0,
+                        noise: float = 0.3) -> Dict[int, List[List[Tuple[int, float]]]]:
+    """
+    按扰动后的参数模拟用户复习（用于测试和性能基准）
+
+    每个用户的真实参数为默认参数乘以对数正态噪声，复习间隔按随机保持率排期并加抖动，
+    是否想起按模型的回忆概率抽样
+    """
+    rng = random.Random(seed)
+    sequences = {}
+    for user in range(users):
+        weights = [
+            min(max(value * math.exp(rng.gauss(0, noise)), low), high)
+            for value, (low, high) in zip(DEFAULT_WEIGHTS, WEIGHT_BOUNDS)
+        ]
+        user_cards = []
+        for _ in range(cards):
+            timestamp = rng.uniform(0, 30) * 86400
+            grade = rng.choices((1, 2, 3, 4), (0.2, 0.1, 0.5, 0.2))[0]
+            state = next_state(None, grade, 0, weights)
+            history = [(grade, timestamp)]
+            for _ in range(reviews - 1):
+                days = next_interval(state.stability, rng.uniform(0.7, 0.95)) * rng.uniform(0.5, 1.5)
+                timestamp += days * 86400
+                if rng.random() < retrievability(days, state.stability):
+                    grade = rng.choices((2, 3, 4), (0.15, 0.7, 0.15))[0]
+                else:
+                    grade = AGAIN
+                state = next_state(state, grade, days, weights)
+                history.append((grade, timestamp))
+            user_cards.append(history)
+        sequences[user] = user_cards
+    return sequences
+
+
+# ---- 批量任务 ----
+
+def flashcard_history(user_ids: List) -> Iterable[Tuple[object, object, int, datetime]]:
+    """卡片复习历史"""
+    rows = FlashcardReview.objects.filter(user_id__in=user_ids).order_by(
+        'user_id', 'flashcard_id', 'created_at'
+    ).values_list('user_id', 'flashcard_id', 'rating', 'created_at')
+    for user_id, flashcard_id, rating, created_at in rows.iterator(chunk_size=5000):
+        yield user_id, ('flashcard', flashcard_id), grade_from_quality(rating), created_at
+
+
+class SchedulerParameterJob:
+    """按批拟合用户的FSRS参数并写入 SchedulerParameters"""
+
+    _sources: List[HistorySource] = [flashcard_history]
+
+    @classmethod
+    def register_source(cls, source: HistorySource):
+        """注册复习历史来源（其他应用在ready中注册）"""
+        if source not in cls._sources:
+            cls._sources.append(source)
+
+    @staticmethod
+    def min_reviews() -> int:
+        return getattr(settings, 'FSRS_MIN_REVIEWS', 50)
+
+    @classmethod
+    def load(cls, user_ids: List) -> Dict[object, List[List[Tuple[int, float]]]]:
+        """读取一批用户的复习序列"""
+        cards: Dict[object, Dict[object, List[Tuple[int, float]]]] = defaultdict(lambda: defaultdict(list))
+        for source in cls._sources:
+            for user_id, card_key, grade, created_at in source(user_ids):
+                cards[user_id][card_key].append((grade, created_at.timestamp()))
+        return {user_id: list(user_cards.values()) for user_id, user_cards in cards.items()}
+
+    @classmethod
+    def fit_batch(cls, user_ids: List, iterations: int = 40) -> int:
+        """
+        拟合一批用户，复习数达到阈值的用户改用FSRS调度
+
+        Returns:
+            int: 更新的用户数
+        """
+        sequences = cls.load(user_ids)
+        history = ReviewHistory.build(sequences)
+        eligible = [index for index, count in enumerate(history.review_counts) if count >= cls.min_reviews()]
+        if not eligible:
+            return 0
+
+        weights, before, after = fit_weights(history, iterations)
+        now = timezone.now()
+        for index in eligible:
+            SchedulerParameters.objects.update_or_create(
+                user_id=history.user_ids[index],
+                defaults={
+                    'algorithm': 'fsrs',
+                    'weights': [round(float(value), 4) for value in weights[index]],
+                    'review_count': int(history.review_counts[index]),
+                    'log_loss': round(float(after[index]), 4),
+                    'fitted_at': now,
+                }
+            )
+        logger.info(
+            f"FSRS参数拟合: {len(eligible)} 个用户, 平均损失 {before[eligible].mean():.4f} -> {after[eligible].mean():.4f}"
+        )
+        return len(eligible)
+
+    @classmethod
+    def run(cls, user_ids: Optional[Sequence] = None, batch_size: int = 500, iterations: int = 40) -> Dict:
+        """拟合全部（或指定）用户"""
+        start = time.perf_counter()
+        ids = list(user_ids) if user_ids else list(User.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for offset in range(0, len(ids), batch_size):
+            updated += cls.fit_batch(ids[offset:offset + batch_size], iterations)
+        elapsed = time.perf_counter() - start
+        return {'users': len(ids), 'updated': updated, 'seconds': round(elapsed, 2)}
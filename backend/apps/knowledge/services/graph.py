@@ -2,108 +2,164 @@
 知识图谱服务
 提供概念关系网络的分析和可视化支持
 """
-from typing import List, Dict, Tuple, Set, Optional
+from typing import List, Dict, Iterator, Tuple, Set, Optional
 from collections import defaultdict, deque
 import networkx as nx
 from django.db import transaction
 from apps.knowledge.models import Concept, ConceptRelation
+from apps.knowledge.services.graph_analytics import CentralityService
+from apps.knowledge.services.graph_store import RELATION_CODES, ConceptGraphStore
 
 
 class ConceptGraph:
-    """概念图分析器"""
+    """
+    概念图分析器
+
+    基于缓存的CSR快照（见 graph_store），遍历和统计不查询数据库；
+    需要networkx算法（最短路径、强连通分量、中心性）时按需从快照构建 self.graph。
+    """
 
     def __init__(self, user=None):
         self.user = user
-        self.graph = nx.DiGraph()
-        self._build_graph()
-
-    def _build_graph(self):
-        """构建概念关系图"""
-        # 获取所有概念
-        concepts = Concept.objects.all()
-        if self.user:
-            concepts = concepts.filter(user=self.user)
-
-        # 添加节点
-        for concept in concepts:
-            self.graph.add_node(
-                concept.id,
-                name=concept.name,
-                concept_type=concept.concept_type,
-                importance=concept.importance,
-                is_mastered=concept.is_mastered,
-                mastery_level=concept.mastery_level,
-                description=concept.description
+        self.snapshot = ConceptGraphStore.get(user)
+        self._graph = None
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        """快照对应的networkx图（按需构建）"""
+        if self._graph is None:
+            self._graph = self._to_networkx(self.snapshot.nodes(), self.snapshot.edges())
+        return self._graph
+
+    def _to_networkx(self, nodes, edges) -> nx.DiGraph:
+        """由快照的节点和边下标构建networkx图"""
+        snapshot = self.snapshot
+        graph = nx.DiGraph()
+        graph.add_nodes_from((snapshot.node_ids[node], snapshot.node_data(node)) for node in nodes)
+        graph.add_edges_from(
+            (
+                snapshot.node_ids[snapshot.src[edge]],
+                snapshot.node_ids[snapshot.dst[edge]],
+                {'relation_type': snapshot.relation_type(edge), 'confidence': snapshot.confidence[edge]},
             )
+            for edge in edges
+        )
+        return graph
 
-        # 获取所有关系
-        relations = ConceptRelation.objects.all()
-        if self.user:
-            relations = relations.filter(source_concept__user=self.user)
-
-        # 添加边
-        for relation in relations:
-            self.graph.add_edge(
-                relation.source_concept.id,
-                relation.target_concept.id,
-                relation_type=relation.relation_type,
-                confidence=relation.confidence,
-                description=relation.description
-            )
+    def _neighborhood(self, node: int, max_depth: int) -> Set[int]:
+        """按层BFS获取双向邻域内的节点下标"""
+        snapshot = self.snapshot
+        nodes = {node}
+        current_level = {node}
+        for _ in range(max_depth):
+            next_level = set()
+            for current in current_level:
+                next_level.update(snapshot.dst[edge] for edge in snapshot.out_edges(current))
+                next_level.update(snapshot.src[edge] for edge in snapshot.in_edges(current))
+            next_level -= nodes
+            if not next_level:
+                break
+            nodes |= next_level
+            current_level = next_level
+        return nodes
 
     def get_subgraph(self, center_concept_id: str, max_depth: int = 2) -> nx.DiGraph:
         """获取以指定概念为中心的子图"""
-        if center_concept_id not in self.graph:
+        node = self.snapshot.node_of(center_concept_id)
+        if node is None:
             return nx.DiGraph()
 
-        # 使用BFS获取子图
-        nodes = {center_concept_id}
-        current_level = {center_concept_id}
+        nodes = self._neighborhood(node, max_depth)
+        snapshot = self.snapshot
+        edges = {edge for current in nodes for edge in snapshot.out_edges(current) if snapshot.dst[edge] in nodes}
+        return self._to_networkx(sorted(nodes), sorted(edges))
 
-        for _ in range(max_depth):
-            next_level = set()
-            for node in current_level:
-                # 获取前驱和后继节点
-                next_level.update(self.graph.predecessors(node))
-                next_level.update(self.graph.successors(node))
-
-            nodes.update(next_level)
-            current_level = next_level
+    def select_subgraph(
+        self,
+        center_concept_id: str,
+        max_depth: int = 2,
+        max_nodes: Optional[int] = None,
+        relation_types: Optional[List[str]] = None
+    ) -> Tuple[List[int], List[int], bool]:
+        """
+        服务端按层BFS选择子图（双向），限制深度、节点数和关系类型
+
+        Returns:
+            Tuple: (节点下标（按BFS顺序）, 边下标, 是否因节点数限制被截断)
+        """
+        snapshot = self.snapshot
+        node = snapshot.node_of(center_concept_id)
+        if node is None:
+            return [], [], False
+
+        codes = {RELATION_CODES[relation_type] for relation_type in relation_types} if relation_types else None
+        selected = {node: None}  # 按插入顺序保存
+        frontier = [node]
+        truncated = False
 
-        return self.graph.subgraph(nodes).copy()
+        for _ in range(max_depth):
+            next_level = []
+            for current in frontier:
+                neighbors = [
+                    (edge, snapshot.dst[edge]) for edge in snapshot.out_edges(current)
+                ] + [
+                    (edge, snapshot.src[edge]) for edge in snapshot.in_edges(current)
+                ]
+                for edge, neighbor in neighbors:
+                    if neighbor in selected or (codes is not None and snapshot.relation[edge] not in codes):
+                        continue
+                    if max_nodes is not None and len(selected) >= max_nodes:
+                        truncated = True
+                        break
+                    selected[neighbor] = None
+                    next_level.append(neighbor)
+                if truncated:
+                    break
+            if truncated or not next_level:
+                break
+            frontier = next_level
+
+        edges = [
+            edge
+            for current in selected
+            for edge in snapshot.out_edges(current)
+            if snapshot.dst[edge] in selected and (codes is None or snapshot.relation[edge] in codes)
+        ]
+        return list(selected), edges, truncated
 
     def get_concept_dependencies(self, concept_id: str) -> List[str]:
         """获取概念的前置依赖"""
-        if concept_id not in self.graph:
+        node = self.snapshot.node_of(concept_id)
+        if node is None:
             return []
 
-        # 找到所有前置关系（prerequisite）
-        dependencies = []
-        for predecessor in self.graph.predecessors(concept_id):
-            edge_data = self.graph.get_edge_data(predecessor, concept_id)
-            if edge_data.get('relation_type') == 'prerequisite':
-                dependencies.append(predecessor)
-
-        return dependencies
+        snapshot = self.snapshot
+        prerequisite = RELATION_CODES['prerequisite']
+        return list(dict.fromkeys(
+            snapshot.node_ids[snapshot.src[edge]]
+            for edge in snapshot.in_edges(node)
+            if snapshot.relation[edge] == prerequisite
+        ))
 
     def get_concept_dependents(self, concept_id: str) -> List[str]:
         """获取依赖于当前概念的其他概念"""
-        if concept_id not in self.graph:
+        node = self.snapshot.node_of(concept_id)
+        if node is None:
             return []
 
-        dependents = []
-        for successor in self.graph.successors(concept_id):
-            edge_data = self.graph.get_edge_data(concept_id, successor)
-            if edge_data.get('relation_type') == 'prerequisite':
-                dependents.append(successor)
-
-        return dependents
+        snapshot = self.snapshot
+        prerequisite = RELATION_CODES['prerequisite']
+        return list(dict.fromkeys(
+            snapshot.node_ids[snapshot.dst[edge]]
+            for edge in snapshot.out_edges(node)
+            if snapshot.relation[edge] == prerequisite
+        ))
 
     def find_shortest_path(self, source_id: str, target_id: str) -> Optional[List[str]]:
         """查找两个概念之间的最短路径"""
         try:
-            return nx.shortest_path(self.graph, source_id, target_id)
-        except nx.NetworkXNoPath:
+            return nx.shortest_path(self.graph, str(source_id), str(target_id))
+        except (nx.NetworkXNoPath, nx.NodeNotFound):
             return None
 
     def find_concept_clusters(self, min_cluster_size: int = 3) -> List[Set[str]]:
@@ -112,41 +168,26 @@ class ConceptGraph:
         return [cluster for cluster in clusters if len(cluster) >= min_cluster_size]
 
     def get_centrality_measures(self, concept_id: str) -> Dict[str, float]:
-        """获取概念的中心性指标"""
-        if concept_id not in self.graph:
-            return {}
-
-        # 计算各种中心性
-        try:
-            betweenness = nx.betweenness_centrality(self.graph)[concept_id]
-            closeness = nx.closeness_centrality(self.graph)[concept_id]
-            in_degree = self.graph.in_degree(concept_id)
-            out_degree = self.graph.out_degree(concept_id)
-            degree = self.graph.degree(concept_id)
-
-            return {
-                'betweenness': betweenness,
-                'closeness': closeness,
-                'in_degree': in_degree,
-                'out_degree': out_degree,
-                'total_degree': degree
-            }
-        except:
-            return {}
+        """获取概念的中心性指标（读取分析任务按图版本预先计算的结果）"""
+        return CentralityService.lookup(self.user, self.snapshot, str(concept_id))
 
     def get_learning_sequence(self, target_concept_id: str) -> List[str]:
         """生成学习序列（基于前置依赖的拓扑排序）"""
-        # 获取目标概念的所有依赖子图
-        subgraph = self.get_subgraph(target_concept_id, max_depth=5)
-
-        # 只保留前置依赖边
-        dependency_edges = []
-        for u, v, data in subgraph.edges(data=True):
-            if data.get('relation_type') == 'prerequisite':
-                dependency_edges.append((u, v))
+        node = self.snapshot.node_of(target_concept_id)
+        if node is None:
+            return []
 
+        # 目标概念邻域内的前置依赖边
+        snapshot = self.snapshot
+        nodes = self._neighborhood(node, 5)
+        prerequisite = RELATION_CODES['prerequisite']
         dependency_graph = nx.DiGraph()
-        dependency_graph.add_edges_from(dependency_edges)
+        dependency_graph.add_edges_from(
+            (snapshot.node_ids[current], snapshot.node_ids[snapshot.dst[edge]])
+            for current in nodes
+            for edge in snapshot.out_edges(current)
+            if snapshot.relation[edge] == prerequisite and snapshot.dst[edge] in nodes
+        )
 
         try:
             # 拓扑排序
@@ -163,71 +204,111 @@ class ConceptGraph:
         max_distance: int = 1
     ) -> Dict[str, List[str]]:
         """获取相关概念（按关系类型分组）"""
-        if concept_id not in self.graph:
+        node = self.snapshot.node_of(concept_id)
+        if node is None:
             return {}
 
+        snapshot = self.snapshot
         related = defaultdict(list)
 
+        def add(edge, neighbor):
+            rel_type = snapshot.relation_type(edge)
+            if not relation_types or rel_type in relation_types:
+                related[rel_type].append(snapshot.node_ids[neighbor])
+
         if max_distance == 1:
             # 直接相邻的节点
-            for neighbor in self.graph.successors(concept_id):
-                edge_data = self.graph.get_edge_data(concept_id, neighbor)
-                rel_type = edge_data.get('relation_type', 'related')
-                if not relation_types or rel_type in relation_types:
-                    related[rel_type].append(neighbor)
-
-            for neighbor in self.graph.predecessors(concept_id):
-                edge_data = self.graph.get_edge_data(neighbor, concept_id)
-                rel_type = edge_data.get('relation_type', 'related')
-                if not relation_types or rel_type in relation_types:
-                    related[rel_type].append(neighbor)
+            for edge in snapshot.out_edges(node):
+                add(edge, snapshot.dst[edge])
+            for edge in snapshot.in_edges(node):
+                add(edge, snapshot.src[edge])
         else:
-            # 扩展搜索
+            # 扩展搜索（沿出边）
             visited = set()
-            queue = deque([(concept_id, 0)])
+            queue = deque([(node, 0)])
 
             while queue:
                 current, distance = queue.popleft()
                 if distance >= max_distance:
                     continue
 
-                for neighbor in self.graph.successors(current):
+                for edge in snapshot.out_edges(current):
+                    neighbor = snapshot.dst[edge]
                     if neighbor not in visited:
                         visited.add(neighbor)
-                        edge_data = self.graph.get_edge_data(current, neighbor)
-                        rel_type = edge_data.get('relation_type', 'related')
-                        if not relation_types or rel_type in relation_types:
-                            related[rel_type].append(neighbor)
+                        add(edge, neighbor)
                         queue.append((neighbor, distance + 1))
 
         return dict(related)
 
-    def export_graph_data(self, format: str = 'd3') -> Dict:
-        """导出图数据用于前端可视化"""
-        nodes = []
-        edges = []
-
-        for node_id, data in self.graph.nodes(data=True):
-            node_data = {
-                'id': str(node_id),
-                'name': data.get('name', ''),
-                'concept_type': data.get('concept_type', ''),
-                'importance': data.get('importance', 1.0),
-                'is_mastered': data.get('is_mastered', False),
-                'mastery_level': data.get('mastery_level', 0),
-                'description': data.get('description', ''),
-            }
-            nodes.append(node_data)
-
-        for source, target, data in self.graph.edges(data=True):
-            edge_data = {
-                'source': str(source),
-                'target': str(target),
-                'relation_type': data.get('relation_type', 'related'),
-                'confidence': data.get('confidence', 1.0),
-                'description': data.get('description', ''),
-            }
-            edges.append(edge_data)
+    # 字段投影：ids只含ID，basic含快照中的属性（不查询数据库），full另外按需查询描述
+    FIELD_SETS = ('ids', 'basic', 'full')
+    DESCRIPTION_CHUNK = 1000  # 每次查询描述的节点/边数
+
+    def _descriptions(self, model, ids: List[str]) -> Dict[str, str]:
+        descriptions = model.objects.filter(id__in=ids).exclude(description='').values_list('id', 'description')
+        return {str(key): value for key, value in descriptions}
+
+    def iter_graph_items(
+        self,
+        nodes: Optional[List[int]] = None,
+        edges: Optional[List[int]] = None,
+        fields: str = 'full'
+    ) -> Iterator[Tuple[str, Dict]]:
+        """
+        按字段投影逐个生成 ('node', 数据) 和 ('link', 数据)
+
+        描述按块查询，流式输出大图时内存占用与块大小而不是图大小相关。
+        """
+        snapshot = self.snapshot
+        nodes = list(snapshot.nodes()) if nodes is None else nodes
+        edges = list(snapshot.edges()) if edges is None else edges
+        chunk_size = self.DESCRIPTION_CHUNK
+
+        for offset in range(0, len(nodes), chunk_size):
+            chunk = nodes[offset:offset + chunk_size]
+            descriptions = self._descriptions(
+                Concept, [snapshot.node_ids[node] for node in chunk]
+            ) if fields == 'full' else {}
+            for node in chunk:
+                node_id = snapshot.node_ids[node]
+                if fields == 'ids':
+                    yield 'node', {'id': node_id}
+                    continue
+                node_data = {'id': node_id, **snapshot.node_data(node)}
+                if fields == 'full':
+                    node_data['description'] = descriptions.get(node_id, '')
+                yield 'node', node_data
+
+        for offset in range(0, len(edges), chunk_size):
+            chunk = edges[offset:offset + chunk_size]
+            descriptions = self._descriptions(
+                ConceptRelation, [snapshot.edge_ids[edge] for edge in chunk]
+            ) if fields == 'full' else {}
+            for edge in chunk:
+                edge_data = {
+                    'source': snapshot.node_ids[snapshot.src[edge]],
+                    'target': snapshot.node_ids[snapshot.dst[edge]],
+                    'relation_type': snapshot.relation_type(edge),
+                }
+                if fields != 'ids':
+                    edge_data['confidence'] = snapshot.confidence[edge]
+                if fields == 'full':
+                    edge_data['description'] = descriptions.get(snapshot.edge_ids[edge], '')
+                yield 'link', edge_data
+
+    def export_graph_data(
+        self,
+        format: str = 'd3',
+        fields: str = 'full',
+        nodes: Optional[List[int]] = None,
+        edges: Optional[List[int]] = None
+    ) -> Dict:
+        """导出图数据用于前端可视化（默认全图，可传入select_subgraph选出的节点和边）"""
+        items = {'node': [], 'link': []}
+        for kind, data in self.iter_graph_items(nodes, edges, fields):
+            items[kind].append(data)
+        nodes, edges = items['node'], items['link']
 
         if format == 'd3':
             return {
@@ -246,27 +327,41 @@ class ConceptGraph:
             return {'nodes': nodes, 'edges': edges}
 
     def calculate_graph_statistics(self) -> Dict:
-        """计算图统计信息"""
-        if not self.graph:
+        """计算图统计信息（直接基于快照，连通分量用并查集）"""
+        snapshot = self.snapshot
+        node_count = snapshot.node_count
+        if not node_count:
             return {}
 
+        # 弱连通分量（并查集）
+        parent = {node: node for node in snapshot.nodes()}
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for edge in snapshot.edges():
+            root_a, root_b = find(snapshot.src[edge]), find(snapshot.dst[edge])
+            if root_a != root_b:
+                parent[root_a] = root_b
+        components = len({find(node) for node in parent})
+
+        edge_count = snapshot.edge_count
         stats = {
-            'total_concepts': self.graph.number_of_nodes(),
-            'total_relations': self.graph.number_of_edges(),
-            'average_degree': 0,
-            'is_connected': nx.is_weakly_connected(self.graph),
-            'number_of_components': nx.number_weakly_connected_components(self.graph),
-            'density': nx.density(self.graph),
+            'total_concepts': node_count,
+            'total_relations': edge_count,
+            'average_degree': (2 * edge_count) / node_count,
+            'is_connected': components == 1,
+            'number_of_components': components,
+            'density': edge_count / (node_count * (node_count - 1)) if node_count > 1 else 0,
         }
 
-        if self.graph.number_of_nodes() > 0:
-            stats['average_degree'] = (2 * self.graph.number_of_edges()) / self.graph.number_of_nodes()
-
         # 计算度分布
-        degree_sequence = [d for n, d in self.graph.degree()]
-        if degree_sequence:
-            stats['max_degree'] = max(degree_sequence)
-            stats['min_degree'] = min(degree_sequence)
+        degree_sequence = [snapshot.in_degree(node) + snapshot.out_degree(node) for node in snapshot.nodes()]
+        stats['max_degree'] = max(degree_sequence)
+        stats['min_degree'] = min(degree_sequence)
 
         return stats
 
@@ -365,38 +460,55 @@ class GraphBuilder:
 
 
 class RecommendationEngine:
-    """推荐引擎"""
+    """
+    推荐引擎
+
+    只使用概念图快照中的掌握状态和重要性，推荐、概念簇和学习缺口都不再逐个查询概念
+    """
 
     def __init__(self, user):
         self.user = user
         self.graph = ConceptGraph(user)
+        self.snapshot = self.graph.snapshot
+        self._unmastered = None
+
+    @property
+    def unmastered(self) -> Set[str]:
+        """未掌握的概念ID集合"""
+        if self._unmastered is None:
+            snapshot = self.snapshot
+            self._unmastered = {snapshot.node_ids[node] for node in snapshot.nodes() if not snapshot.mastered[node]}
+        return self._unmastered
+
+    def recommend(self, current_concept_id: str, limit: int = 5, min_size: int = 3) -> Dict:
+        """一次获取下一个学习概念、概念簇和学习缺口"""
+        return {
+            'next_concepts': self.recommend_next_concepts(current_concept_id, limit),
+            'concept_clusters': self.recommend_concept_clusters(min_size),
+            'learning_gaps': self.analyze_learning_gaps(),
+        }
 
     def recommend_next_concepts(self, current_concept_id: str, limit: int = 5) -> List[str]:
         """推荐下一个学习概念"""
-        # 优先推荐前置依赖未掌握的概念
-        dependencies = self.graph.get_concept_dependencies(current_concept_id)
+        unmastered = self.unmastered
 
-        unmastered_deps = []
-        for dep_id in dependencies:
-            concept = Concept.objects.filter(id=dep_id).first()
-            if concept and not concept.is_mastered:
-                unmastered_deps.append(dep_id)
-
-        if len(unmastered_deps) >= limit:
-            return unmastered_deps[:limit]
+        # 优先推荐未掌握的前置依赖
+        dependencies = self.graph.get_concept_dependencies(current_concept_id)
+        recommendations = [dep_id for dep_id in dependencies if dep_id in unmastered]
+        if len(recommendations) >= limit:
+            return recommendations[:limit]
 
-        # 如果前置依赖都掌握了，推荐相关概念
+        # 不足时用未掌握的相关概念补足
         related = self.graph.get_related_concepts(
             current_concept_id,
             relation_types=['related', 'extends'],
             max_distance=2
         )
-
-        recommendations = []
-        for relation_type, concepts in related.items():
+        seen = {*recommendations, str(current_concept_id)}
+        for concepts in related.values():
             for concept_id in concepts:
-                concept = Concept.objects.filter(id=concept_id).first()
-                if concept and not concept.is_mastered and concept_id != current_concept_id:
+                if concept_id in unmastered and concept_id not in seen:
+                    seen.add(concept_id)
                     recommendations.append(concept_id)
 
         return recommendations[:limit]
@@ -411,26 +523,23 @@ class RecommendationEngine:
         return [list(cluster) for cluster in sorted_clusters[:5]]
 
     def analyze_learning_gaps(self) -> Dict[str, List[str]]:
-        """分析学习缺口"""
-        # 找出重要但未掌握的概念
-        unmastered_important = Concept.objects.filter(
-            user=self.user,
-            is_mastered=False,
-            importance__gte=3.0
-        ).values_list('id', flat=True)
-
-        # 分析这些概念的前置依赖
-        gaps = defaultdict(list)
-        for concept_id in unmastered_important:
-            dependencies = self.graph.get_concept_dependencies(concept_id)
-            unmastered_deps = []
-
-            for dep_id in dependencies:
-                dep_concept = Concept.objects.filter(id=dep_id).first()
-                if dep_concept and not dep_concept.is_mastered:
-                    unmastered_deps.append(dep_id)
+        """分析学习缺口（重要但未掌握的概念及其未掌握的前置依赖）"""
+        snapshot = self.snapshot
+        prerequisite = RELATION_CODES['prerequisite']
+
+        unmastered_important = sorted(
+            (node for node in snapshot.nodes() if not snapshot.mastered[node] and snapshot.importance[node] >= 3.0),
+            key=snapshot.names.__getitem__
+        )
 
+        gaps = {}
+        for node in unmastered_important:
+            unmastered_deps = list(dict.fromkeys(
+                snapshot.node_ids[snapshot.src[edge]]
+                for edge in snapshot.in_edges(node)
+                if snapshot.relation[edge] == prerequisite and not snapshot.mastered[snapshot.src[edge]]
+            ))
             if unmastered_deps:
-                gaps[str(concept_id)] = unmastered_deps
+                gaps[snapshot.node_ids[node]] = unmastered_deps
 
-        return dict(gaps)
\ No newline at end of file
+        return gaps
@@ -0,0 +1,225 @@
+"""
+概念图分析任务
+每个图版本计算一次全部节点的中心性并写入 ConceptCentrality 侧表，单个概念的查询只读一行；
+节点数超过阈值时介数中心性用k个枢纽节点抽样近似（Brandes算法），接近中心性由同一批BFS估计
+"""
+import logging
+import random
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.knowledge.models import ConceptCentrality
+from apps.knowledge.services.graph_store import ConceptGraphStore, GraphSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _successors(snapshot: GraphSnapshot, nodes: Sequence[int]) -> List[Optional[List[int]]]:
+    """去重、去自环后的后继节点列表（与networkx DiGraph一致）"""
+    successors: List[Optional[List[int]]] = [None] * len(snapshot.node_ids)
+    dst = snapshot.dst
+    for node in nodes:
+        successors[node] = list(dict.fromkeys(
+            dst[edge] for edge in snapshot.out_edges(node) if dst[edge] != node
+        ))
+    return successors
+
+
+def compute_centrality(snapshot: GraphSnapshot, pivots: Optional[int] = None,
+                       seed: int = 0) -> Dict[str, array]:
+    """
+    计算全部节点的介数和接近中心性
+
+    介数按networkx的归一化方式（有向图、不含端点）；接近中心性按networkx的入向距离和
+    Wasserman-Faust修正。pivots为空或不小于节点数时结果精确，否则从pivots个随机源节点
+    出发做BFS，介数按抽样缩放，接近中心性用到达各节点的枢纽距离估计。
+
+    Returns:
+        Dict: {'nodes': 节点下标, 'betweenness': 对应数组, 'closeness': 对应数组}
+    """
+    nodes = list(snapshot.nodes())
+    n = len(nodes)
+    size = len(snapshot.node_ids)
+    successors = _successors(snapshot, nodes)
+
+    if pivots is None or pivots >= n:
+        sources = nodes
+    else:
+        sources = random.Random(seed).sample(nodes, pivots)
+    sampled = len(sources) < n
+
+    betweenness = array('d', [0.0]) * size
+    reached = array('l', [0]) * size  # 到达该节点的源节点数
+    distance_sum = array('l', [0]) * size  # 源节点到该节点的距离和
+
+    dist = array('l', [-1]) * size
+    sigma = array('d', [0.0]) * size
+    delta = array('d', [0.0]) * size
+    preds: List[List[int]] = [[] for _ in range(size)]
+
+    for source in sources:
+        # BFS记录最短路数和前驱，列表同时作为队列和出栈顺序
+        order = [source]
+        dist[source] = 0
+        sigma[source] = 1.0
+        head = 0
+        while head < len(order):
+            node = order[head]
+            head += 1
+            next_dist = dist[node] + 1
+            paths = sigma[node]
+            for neighbor in successors[node]:
+                if dist[neighbor] < 0:
+                    dist[neighbor] = next_dist
+                    sigma[neighbor] = paths
+                    preds[neighbor] = [node]
+                    order.append(neighbor)
+                elif dist[neighbor] == next_dist:
+                    sigma[neighbor] += paths
+                    preds[neighbor].append(node)
+
+        # 逆序累加依赖值
+        for node in reversed(order):
+            coefficient = (1.0 + delta[node]) / sigma[node]
+            for pred in preds[node]:
+                delta[pred] += sigma[pred] * coefficient
+            if node != source:
+                betweenness[node] += delta[node]
+                reached[node] += 1
+                distance_sum[node] += dist[node]
+
+        for node in order:
+            dist[node] = -1
+            sigma[node] = 0.0
+            delta[node] = 0.0
+            preds[node] = []
+
+    # 归一化：除以可能经过节点的(s, t)对数，抽样时按源节点数缩放
+    k = len(sources)
+    if n - 1 >= 2:
+        if sampled:
+            source_set = set(sources)
+            scale_source = 1 / ((k - 1) * (n - 2)) if k > 1 else 0.0
+            scale_other = 1 / (k * (n - 2))
+            for node in nodes:
+                betweenness[node] *= scale_source if node in source_set else scale_other
+        else:
+            scale = 1 / ((n - 1) * (n - 2))
+            for node in nodes:
+                betweenness[node] *= scale
+
+    # 接近中心性：closeness = (r-1)/Σd · (r-1)/(n-1)；抽样时r-1和Σd都按 (n-1)/k_v 放大，比例抵消
+    closeness = array('d', [0.0]) * size
+    source_set = set(sources) if sampled else None
+    for node in nodes:
+        if not distance_sum[node]:
+            continue
+        pivots_seen = (k - 1 if node in source_set else k) if sampled else n - 1
+        closeness[node] = reached[node] / distance_sum[node] * reached[node] / pivots_seen
+
+    return {'nodes': nodes, 'betweenness': betweenness, 'closeness': closeness}
+
+
+class CentralityService:
+    """概念中心性的计算、存储和查询"""
+
+    LOCK_TIMEOUT = 600  # 计算任务去重锁（秒）
+
+    @staticmethod
+    def pivots() -> int:
+        return getattr(settings, 'GRAPH_CENTRALITY_PIVOTS', 256)
+
+    @staticmethod
+    def exact_max_nodes() -> int:
+        return getattr(settings, 'GRAPH_CENTRALITY_EXACT_MAX_NODES', 2000)
+
+    @classmethod
+    def _lock_key(cls, user_id) -> str:
+        return f'{ConceptGraphStore.KEY_PREFIX}:{ConceptGraphStore.scope_of(user_id)}:centrality_lock'
+
+    @classmethod
+    def refresh(cls, user=None) -> int:
+        """
+        为当前图版本计算并存储全部节点的中心性
+
+        Returns:
+            int: 写入的行数
+        """
+        snapshot = ConceptGraphStore.get(user)
+        approximate = snapshot.node_count > cls.exact_max_nodes()
+        result = compute_centrality(snapshot, cls.pivots() if approximate else None)
+
+        user_id = getattr(user, 'pk', None)
+        betweenness, closeness = result['betweenness'], result['closeness']
+        rows = [
+            ConceptCentrality(
+                user_id=user_id,
+                concept_id=snapshot.node_ids[node],
+                graph_version=snapshot.version,
+                betweenness=betweenness[node],
+                closeness=closeness[node],
+                in_degree=snapshot.in_degree(node),
+                out_degree=snapshot.out_degree(node),
+                approximate=approximate,
+            )
+            for node in result['nodes']
+        ]
+
+        with transaction.atomic():
+            ConceptCentrality.objects.filter(user_id=user_id).delete()
+            ConceptCentrality.objects.bulk_create(rows, batch_size=1000)
+
+        logger.info(
+            f"概念图中心性已更新: scope={ConceptGraphStore.scope_of(user_id)} "
+            f"version={snapshot.version} nodes={len(rows)} approximate={approximate}"
+        )
+        return len(rows)
+
+    @classmethod
+    def schedule(cls, user_id):
+        """投递计算任务，同一范围同时只有一个任务"""
+        if not cache.add(cls._lock_key(user_id), 1, cls.LOCK_TIMEOUT):
+            return
+        from apps.knowledge.tasks import compute_concept_centrality
+
+        transaction.on_commit(lambda: compute_concept_centrality.delay(str(user_id) if user_id else None))
+
+    @classmethod
+    def release(cls, user_id):
+        cache.delete(cls._lock_key(user_id))
+
+    @classmethod
+    def lookup(cls, user, snapshot: GraphSnapshot, concept_id: str) -> Dict:
+        """
+        单个概念的中心性（一次按索引查询）
+
+        存储的值落后于当前图版本时仍返回旧值（stale为True）并在后台重新计算；
+        度数总是取自当前快照。
+        """
+        node = snapshot.node_of(concept_id)
+        if node is None:
+            return {}
+
+        user_id = getattr(user, 'pk', None)
+        row = ConceptCentrality.objects.filter(user_id=user_id, concept_id=concept_id).values(
+            'graph_version', 'betweenness', 'closeness', 'approximate'
+        ).first()
+        stale = row is None or row['graph_version'] != snapshot.version
+        if stale:
+            cls.schedule(user_id)
+
+        in_degree, out_degree = snapshot.in_degree(node), snapshot.out_degree(node)
+        return {
+            'betweenness': row['betweenness'] if row else None,
+            'closeness': row['closeness'] if row else None,
+            'in_degree': in_degree,
+            'out_degree': out_degree,
+            'total_degree': in_degree + out_degree,
+            'approximate': row['approximate'] if row else False,
+            'graph_version': row['graph_version'] if row else None,
+            'stale': stale,
+        }
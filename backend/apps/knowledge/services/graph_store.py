@@ -0,0 +1,445 @@
+"""
+概念图快照存储
+每个用户的概念图以紧凑的CSR邻接数组保存，进程内和缓存（Redis）两级缓存，带版本号；
+概念和关系的保存/删除信号只记录一条增量并推进版本，读取时把缺少的增量补到快照上，
+累计的增量过多时才写回完整快照，图接口不再每次查询数据库重建图
+"""
+import copy
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.core.cache import cache
+
+from apps.knowledge.models import Concept, ConceptRelation
+
+# 关系类型编码（按模型choices顺序）
+RELATION_TYPES = [choice for choice, _ in ConceptRelation.RELATION_TYPE_CHOICES]
+RELATION_CODES = {relation_type: code for code, relation_type in enumerate(RELATION_TYPES)}
+
+# 影响图结构或节点属性的概念字段
+GRAPH_FIELDS = {'name', 'concept_type', 'importance', 'is_mastered', 'mastery_level', 'user'}
+
+# 增量：(操作, 参数...)，只含基本类型，可直接存入缓存
+UPSERT_NODE, REMOVE_NODE, UPSERT_EDGE, REMOVE_EDGE = 'node', '-node', 'edge', '-edge'
+GraphDelta = Tuple
+
+
+def concept_delta(concept: Concept) -> GraphDelta:
+    """新增或更新概念节点的增量"""
+    return (
+        UPSERT_NODE, str(concept.pk), concept.name, concept.concept_type,
+        concept.importance, concept.is_mastered, concept.mastery_level
+    )
+
+
+def relation_delta(relation: ConceptRelation) -> GraphDelta:
+    """新增或更新关系边的增量"""
+    return (
+        UPSERT_EDGE, str(relation.pk), str(relation.source_concept_id), str(relation.target_concept_id),
+        relation.relation_type, relation.confidence
+    )
+
+
+class GraphSnapshot:
+    """
+    概念图快照
+
+    节点和边以整数下标存放在并行数组中，删除用墓碑标记，墓碑过多时压缩；
+    邻接关系以CSR（偏移数组 + 边下标数组）表示，增量修改后按需重建。
+    """
+
+    COMPACT_RATIO = 0.25  # 墓碑占比超过该值时压缩
+
+    def __init__(self, version: int = 0):
+        self.version = version
+
+        # 节点
+        self.node_ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.node_alive = bytearray()
+        self.names: List[str] = []
+        self.concept_types: List[str] = []
+        self.importance = array('d')
+        self.mastered = bytearray()
+        self.mastery_level = array('i')
+
+        # 边
+        self.edge_ids: List[str] = []
+        self.edge_index: Dict[str, int] = {}
+        self.edge_alive = bytearray()
+        self.src = array('l')
+        self.dst = array('l')
+        self.relation = array('b')
+        self.confidence = array('d')
+
+        self.node_count = 0
+        self.edge_count = 0
+        self._csr = None
+
+    def __getstate__(self):
+        # CSR可由边数组重建，不参与序列化
+        state = self.__dict__.copy()
+        state['_csr'] = None
+        return state
+
+    def copy(self) -> 'GraphSnapshot':
+        """副本：数组和索引逐个复制，修改副本不影响正在读取原快照的线程（CSR构建后只读，可共享）"""
+        clone = copy.copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, (list, dict, bytearray, array)):
+                setattr(clone, name, copy.copy(value))
+        clone._csr = self._csr
+        return clone
+
+    # ---- 构建 ----
+
+    @classmethod
+    def build(cls, user=None, version: int = 0) -> 'GraphSnapshot':
+        """从数据库构建快照（两次查询）"""
+        snapshot = cls(version)
+
+        concepts = Concept.objects.all()
+        relations = ConceptRelation.objects.all()
+        if user:
+            concepts = concepts.filter(user=user)
+            relations = relations.filter(source_concept__user=user)
+
+        for row in concepts.values_list('id', 'name', 'concept_type', 'importance', 'is_mastered', 'mastery_level'):
+            snapshot._set_node(str(row[0]), *row[1:])
+        for row in relations.values_list('id', 'source_concept_id', 'target_concept_id', 'relation_type', 'confidence'):
+            snapshot._set_edge(str(row[0]), str(row[1]), str(row[2]), row[3], row[4])
+        return snapshot
+
+    def _ensure_node(self, concept_id: str) -> int:
+        """节点下标，不存在时添加无属性节点（与networkx添加边时的行为一致）"""
+        node = self.index.get(concept_id)
+        if node is not None and self.node_alive[node]:
+            return node
+        return self._set_node(concept_id, '', '', 1.0, False, 0)
+
+    def _set_node(self, concept_id, name, concept_type, importance, is_mastered, mastery_level) -> int:
+        node = self.index.get(concept_id)
+        if node is None:
+            node = len(self.node_ids)
+            self.node_ids.append(concept_id)
+            self.index[concept_id] = node
+            self.node_alive.append(1)
+            self.names.append(name)
+            self.concept_types.append(concept_type)
+            self.importance.append(importance)
+            self.mastered.append(1 if is_mastered else 0)
+            self.mastery_level.append(mastery_level)
+            self.node_count += 1
+            return node
+
+        if not self.node_alive[node]:
+            self.node_alive[node] = 1
+            self.node_count += 1
+        self.names[node] = name
+        self.concept_types[node] = concept_type
+        self.importance[node] = importance
+        self.mastered[node] = 1 if is_mastered else 0
+        self.mastery_level[node] = mastery_level
+        return node
+
+    def _set_edge(self, relation_id, source_id, target_id, relation_type, confidence) -> int:
+        source, target = self._ensure_node(source_id), self._ensure_node(target_id)
+        code = RELATION_CODES.get(relation_type, RELATION_CODES['related'])
+        edge = self.edge_index.get(relation_id)
+        if edge is None:
+            edge = len(self.edge_ids)
+            self.edge_ids.append(relation_id)
+            self.edge_index[relation_id] = edge
+            self.edge_alive.append(1)
+            self.src.append(source)
+            self.dst.append(target)
+            self.relation.append(code)
+            self.confidence.append(confidence)
+            self.edge_count += 1
+        else:
+            if not self.edge_alive[edge]:
+                self.edge_alive[edge] = 1
+                self.edge_count += 1
+            self.src[edge], self.dst[edge] = source, target
+            self.relation[edge], self.confidence[edge] = code, confidence
+        self._csr = None
+        return edge
+
+    # ---- 增量更新 ----
+
+    def apply_delta(self, delta: GraphDelta):
+        """应用一条增量"""
+        operation, *args = delta
+        if operation == UPSERT_NODE:
+            self._set_node(*args)
+        elif operation == REMOVE_NODE:
+            self.remove_concept(*args)
+        elif operation == UPSERT_EDGE:
+            self._set_edge(*args)
+        elif operation == REMOVE_EDGE:
+            self.remove_relation(*args)
+
+    def remove_concept(self, concept_id: str):
+        """删除概念节点及其关联边"""
+        node = self.index.get(concept_id)
+        if node is None or not self.node_alive[node]:
+            return
+        for edge in set(self.out_edges(node)) | set(self.in_edges(node)):
+            self.edge_alive[edge] = 0
+            self.edge_count -= 1
+        self.node_alive[node] = 0
+        self.node_count -= 1
+        self._csr = None
+        self._maybe_compact()
+
+    def remove_relation(self, relation_id: str):
+        """删除关系边"""
+        edge = self.edge_index.get(relation_id)
+        if edge is None or not self.edge_alive[edge]:
+            return
+        self.edge_alive[edge] = 0
+        self.edge_count -= 1
+        self._csr = None
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """墓碑过多时压缩数组，重新分配下标"""
+        dead = (len(self.node_ids) - self.node_count) + (len(self.edge_ids) - self.edge_count)
+        if dead <= self.COMPACT_RATIO * (len(self.node_ids) + len(self.edge_ids)):
+            return
+
+        compacted = GraphSnapshot(self.version)
+        for node in self.nodes():
+            compacted._set_node(
+                self.node_ids[node], self.names[node], self.concept_types[node],
+                self.importance[node], self.mastered[node], self.mastery_level[node]
+            )
+        for edge in self.edges():
+            compacted._set_edge(
+                self.edge_ids[edge], self.node_ids[self.src[edge]], self.node_ids[self.dst[edge]],
+                RELATION_TYPES[self.relation[edge]], self.confidence[edge]
+            )
+        self.__dict__.update(compacted.__dict__)
+
+    # ---- 查询 ----
+
+    def __contains__(self, concept_id) -> bool:
+        node = self.index.get(str(concept_id))
+        return node is not None and bool(self.node_alive[node])
+
+    def node_of(self, concept_id) -> Optional[int]:
+        """概念ID对应的节点下标，不存在时为None"""
+        node = self.index.get(str(concept_id))
+        return node if node is not None and self.node_alive[node] else None
+
+    def nodes(self) -> Iterator[int]:
+        """存活节点下标"""
+        return (node for node in range(len(self.node_ids)) if self.node_alive[node])
+
+    def edges(self) -> Iterator[int]:
+        """存活边下标"""
+        return (edge for edge in range(len(self.edge_ids)) if self.edge_alive[edge])
+
+    def relation_type(self, edge: int) -> str:
+        return RELATION_TYPES[self.relation[edge]]
+
+    def _get_csr(self) -> Tuple[array, array, array, array]:
+        """(出边偏移, 出边下标, 入边偏移, 入边下标)，按需用计数排序构建"""
+        if self._csr is None:
+            size = len(self.node_ids)
+            live = list(self.edges())
+            self._csr = (
+                *self._counting_sort(live, self.src, size),
+                *self._counting_sort(live, self.dst, size),
+            )
+        return self._csr
+
+    @staticmethod
+    def _counting_sort(edges: List[int], keys: array, size: int) -> Tuple[array, array]:
+        offsets = array('l', [0]) * (size + 1)
+        for edge in edges:
+            offsets[keys[edge] + 1] += 1
+        for node in range(size):
+            offsets[node + 1] += offsets[node]
+        cursor = array('l', offsets)
+        ordered = array('l', [0]) * len(edges)
+        for edge in edges:
+            key = keys[edge]
+            ordered[cursor[key]] = edge
+            cursor[key] += 1
+        return offsets, ordered
+
+    def out_edges(self, node: int) -> array:
+        """节点的出边下标"""
+        offsets, ordered, _, _ = self._get_csr()
+        return ordered[offsets[node]:offsets[node + 1]]
+
+    def in_edges(self, node: int) -> array:
+        """节点的入边下标"""
+        _, _, offsets, ordered = self._get_csr()
+        return ordered[offsets[node]:offsets[node + 1]]
+
+    def out_degree(self, node: int) -> int:
+        offsets = self._get_csr()[0]
+        return offsets[node + 1] - offsets[node]
+
+    def in_degree(self, node: int) -> int:
+        offsets = self._get_csr()[2]
+        return offsets[node + 1] - offsets[node]
+
+    def node_data(self, node: int) -> Dict:
+        """节点属性"""
+        return {
+            'name': self.names[node],
+            'concept_type': self.concept_types[node],
+            'importance': self.importance[node],
+            'is_mastered': bool(self.mastered[node]),
+            'mastery_level': self.mastery_level[node],
+        }
+
+
+class ConceptGraphStore:
+    """
+    概念图快照的两级缓存
+
+    缓存中保存每个范围（用户ID，或'all'表示全部概念）的版本号、快照和快照之后每个版本的增量；
+    写入只推进版本并记录增量（O(1)），读取时在进程内快照的副本上补齐缺少的增量，
+    进程内快照版本一致时不反序列化也不查询数据库；增量缺失时从数据库重建。
+    """
+
+    KEY_PREFIX = 'concept_graph'
+    TIMEOUT = 86400  # 快照和增量保留时间（秒）
+    LOCAL_MAX_GRAPHS = 64  # 进程内保留的快照数
+    COMPACT_DELTAS = 200  # 缓存中的快照落后这么多个版本时写回完整快照
+    MAX_REPLAY = 2000  # 一次最多补齐的增量数，更多时直接重建
+
+    _local: 'OrderedDict[str, GraphSnapshot]' = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def scope_of(user_id) -> str:
+        return str(user_id) if user_id else 'all'
+
+    @classmethod
+    def _version_key(cls, scope: str) -> str:
+        return f'{cls.KEY_PREFIX}:{scope}:version'
+
+    @classmethod
+    def _snapshot_key(cls, scope: str) -> str:
+        return f'{cls.KEY_PREFIX}:{scope}:snapshot'
+
+    @classmethod
+    def _snapshot_version_key(cls, scope: str) -> str:
+        return f'{cls.KEY_PREFIX}:{scope}:snapshot_version'
+
+    @classmethod
+    def _delta_key(cls, scope: str, version: int) -> str:
+        return f'{cls.KEY_PREFIX}:{scope}:delta:{version}'
+
+    @classmethod
+    def _remember(cls, scope: str, snapshot: Optional[GraphSnapshot]):
+        with cls._lock:
+            cls._local.pop(scope, None)
+            if snapshot is not None:
+                cls._local[scope] = snapshot
+                while len(cls._local) > cls.LOCAL_MAX_GRAPHS:
+                    cls._local.popitem(last=False)
+
+    @classmethod
+    def _store(cls, scope: str, snapshot: GraphSnapshot):
+        """写回完整快照"""
+        cache.set_many({
+            cls._snapshot_key(scope): snapshot,
+            cls._snapshot_version_key(scope): snapshot.version,
+        }, cls.TIMEOUT)
+
+    @classmethod
+    def _catch_up(cls, scope: str, snapshot: Optional[GraphSnapshot], version: int) -> Optional[GraphSnapshot]:
+        """
+        把快照补到指定版本：在副本上按版本顺序应用缓存中的增量，
+        原快照可能正被其他线程读取，不原地修改；增量缺失时返回None
+        """
+        if snapshot is None or snapshot.version > version or version - snapshot.version > cls.MAX_REPLAY:
+            return None
+        if snapshot.version == version:
+            return snapshot
+        keys = [cls._delta_key(scope, v) for v in range(snapshot.version + 1, version + 1)]
+        deltas = cache.get_many(keys)
+        if len(deltas) != len(keys):
+            return None
+        snapshot = snapshot.copy()
+        for key in keys:
+            snapshot.apply_delta(deltas[key])
+        snapshot.version = version
+        return snapshot
+
+    @classmethod
+    def _cached(cls, scope: str, version: int, stored_version: Optional[int]) -> Optional[GraphSnapshot]:
+        """进程内或缓存中的快照补齐增量后的指定版本"""
+        local = cls._local.get(scope)
+        snapshot = cls._catch_up(scope, local, version)
+        if snapshot is None and stored_version is not None:
+            snapshot = cls._catch_up(scope, cache.get(cls._snapshot_key(scope)), version)
+        if snapshot is None or snapshot is local:
+            return snapshot
+
+        cls._remember(scope, snapshot)
+        if stored_version is None or version - stored_version >= cls.COMPACT_DELTAS:
+            cls._store(scope, snapshot)
+        return snapshot
+
+    @classmethod
+    def version(cls, user=None) -> int:
+        """当前图版本"""
+        return cache.get(cls._version_key(cls.scope_of(getattr(user, 'pk', None)))) or 0
+
+    @classmethod
+    def get(cls, user=None) -> GraphSnapshot:
+        """获取用户的概念图快照，缓存失效时从数据库重建"""
+        scope = cls.scope_of(getattr(user, 'pk', None))
+        values = cache.get_many([cls._version_key(scope), cls._snapshot_version_key(scope)])
+        version = values.get(cls._version_key(scope)) or 0
+        snapshot = cls._cached(scope, version, values.get(cls._snapshot_version_key(scope)))
+        if snapshot is None:
+            snapshot = GraphSnapshot.build(user, version)
+            cls._store(scope, snapshot)
+            cls._remember(scope, snapshot)
+        return snapshot
+
+    @classmethod
+    def _bump(cls, scope: str) -> int:
+        key = cls._version_key(scope)
+        if cache.add(key, 1, None):
+            return 1
+        try:
+            return cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+            return 1
+
+    @classmethod
+    def apply(cls, user_id, delta: GraphDelta):
+        """
+        记录一条增量并推进版本
+
+        不读取、复制或写回快照，下次读取时再补到快照上；
+        读取方看到新版本而增量尚未写入时按缺失处理，从数据库重建。
+        """
+        scope = cls.scope_of(user_id)
+        cache.set(cls._delta_key(scope, cls._bump(scope)), delta, cls.TIMEOUT)
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """使快照失效（批量写入等不触发信号的修改之后调用）"""
+        scope = cls.scope_of(user_id)
+        cls._bump(scope)
+        cls._remember(scope, None)
+        cache.delete_many([cls._snapshot_key(scope), cls._snapshot_version_key(scope)])
+
+    @classmethod
+    def clear_local(cls):
+        """清空进程内快照（测试用）"""
+        with cls._lock:
+            cls._local.clear()
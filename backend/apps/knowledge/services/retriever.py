@@ -1,5 +1,6 @@
 import re
 import math
+from collections import defaultdict, deque
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import date, datetime
 from django.contrib.auth import get_user_model
@@ -18,6 +19,8 @@ User = get_user_model()
 class HybridRetriever:
     """混合检索器 - 实现多路召回和排序"""
 
+    GRAPH_MAX_NODES = 100  # 概念关系图的节点数上限
+
     def __init__(self, user_id: int):
         self.user_id = user_id
         self.user = User.objects.get(id=user_id)
@@ -168,27 +171,45 @@ class HybridRetriever:
         Returns:
             概念关系图
         """
-        try:
-            center_concept = Concept.objects.get(id=concept_id)
-        except Concept.DoesNotExist:
-            return ConceptGraph(nodes=[], edges=[], center_concept_id=concept_id, depth=depth)
-
+        concept_id = str(concept_id)
         nodes = {}
         edges = []
+        edge_keys = set()  # 已添加的边（含反向等价边），用于O(1)去重
         visited = set()
-        to_visit = [(concept_id, 0)]
-
-        # BFS遍历概念关系
-        while to_visit and len(to_visit) < 100:  # 限制节点数量
-            current_id, current_depth = to_visit.pop(0)
-
-            if current_id in visited or current_depth > depth:
-                continue
-
-            visited.add(current_id)
+        center_type = None
+        frontier = deque([concept_id])
+
+        # 按层BFS：每层一次查询概念、一次查询关系
+        for current_depth in range(depth + 1):
+            frontier_ids = [node_id for node_id in dict.fromkeys(frontier) if node_id not in visited]
+            frontier_ids = frontier_ids[:self.GRAPH_MAX_NODES - len(visited)]
+            if not frontier_ids:
+                break
 
-            try:
-                current_concept = Concept.objects.get(id=current_id)
+            concepts = {
+                str(concept.id): concept
+                for concept in Concept.objects.filter(id__in=frontier_ids).only(
+                    'id', 'name', 'concept_type', 'description', 'confidence'
+                )
+            }
+            relations_by_node = defaultdict(list)
+            relations = ConceptRelation.objects.filter(
+                Q(source_concept_id__in=frontier_ids) | Q(target_concept_id__in=frontier_ids)
+            ).only('source_concept_id', 'target_concept_id', 'relation_type', 'confidence', 'description')
+            for relation in relations:
+                relations_by_node[str(relation.source_concept_id)].append(relation)
+                relations_by_node[str(relation.target_concept_id)].append(relation)
+
+            next_frontier = deque()
+            queue = deque(frontier_ids)
+            while queue:
+                current_id = queue.popleft()
+                current_concept = concepts.get(current_id)
+                if current_concept is None:
+                    continue
+                visited.add(current_id)
+                if center_type is None:
+                    center_type = current_concept.concept_type
 
                 # 添加节点
                 nodes[current_id] = GraphNode(
@@ -200,14 +221,9 @@ class HybridRetriever:
                     level=current_depth
                 )
 
-                # 获取相关关系
-                relations = ConceptRelation.objects.filter(
-                    Q(source_concept_id=current_id) | Q(target_concept_id=current_id)
-                ).select_related('source_concept', 'target_concept')
-
-                for relation in relations:
-                    source_id = str(relation.source_concept.id)
-                    target_id = str(relation.target_concept.id)
+                for relation in relations_by_node[current_id]:
+                    source_id = str(relation.source_concept_id)
+                    target_id = str(relation.target_concept_id)
 
                     # 确定边的方向（从当前节点指向其他节点）
                     if source_id == current_id:
@@ -217,34 +233,33 @@ class HybridRetriever:
                         other_id = source_id
                         relation_type = self._reverse_relation(relation.relation_type)
 
-                    # 添加边
-                    edge = GraphEdge(
-                        source=current_id,
-                        target=other_id,
-                        relation_type=relation_type,
-                        weight=relation.confidence,
-                        description=relation.description
-                    )
-
-                    # 避免重复边
-                    edge_key = f"{min(current_id, other_id)}-{max(current_id, other_id)}-{relation_type}"
-                    if not any(e for e in edges if
-                              (e.source == edge.source and e.target == edge.target and e.relation_type == edge.relation_type) or
-                              (e.source == edge.target and e.target == edge.source and e.relation_type == self._reverse_relation(edge.relation_type))):
-                        edges.append(edge)
-
-                    # 添加到待访问列表
+                    # 避免重复边（同向同类型，或反向且类型互逆）
+                    edge_key = (current_id, other_id, relation_type)
+                    if edge_key not in edge_keys:
+                        edge_keys.add(edge_key)
+                        edge_keys.add((other_id, current_id, self._reverse_relation(relation_type)))
+                        edges.append(GraphEdge(
+                            source=current_id,
+                            target=other_id,
+                            relation_type=relation_type,
+                            weight=relation.confidence,
+                            description=relation.description
+                        ))
+
+                    # 添加到下一层
                     if other_id not in visited and current_depth < depth:
-                        to_visit.append((other_id, current_depth + 1))
+                        next_frontier.append(other_id)
 
-            except Concept.DoesNotExist:
-                continue
+            frontier = next_frontier
+
+        if center_type is None:
+            return ConceptGraph(nodes=[], edges=[], center_concept_id=concept_id, depth=depth)
 
         # 转换为列表
         node_list = list(nodes.values())
 
         # 为节点分组（用于可视化）
-        self._group_nodes(node_list, center_concept.concept_type)
+        self._group_nodes(node_list, center_type)
 
         return ConceptGraph(
             nodes=node_list,
@@ -0,0 +1,283 @@
+"""
+复习队列
+每个用户的待复习卡片和生词物化为按到期时间排序的紧凑表（ReviewQueueEntry），复习时按索引更新一行，
+"下一张"是一次索引查找，到期数量从缓存计数器读取；每晚从源表全量重建，修正批量写入等未触发信号的变化
+"""
+import hashlib
+from datetime import datetime, time, timedelta
+from time import time_ns
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from apps.knowledge.models import Flashcard, ReviewQueueEntry
+
+FLASHCARD = 'flashcard'
+VOCABULARY = 'vocabulary'
+
+# 队列来源：item_type -> 生成条目的函数（user_id为空时生成全部用户的条目）
+QueueSource = Callable[[Optional[int]], Iterable[ReviewQueueEntry]]
+
+
+def day_start(day) -> datetime:
+    """某天零点（当前时区）"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def flashcard_entries(user_id=None) -> Iterable[ReviewQueueEntry]:
+    """活跃卡片的队列条目，当天零点到期，同一天内先复习的卡片优先"""
+    queryset = Flashcard.objects.filter(is_active=True)
+    if user_id:
+        queryset = queryset.filter(user_id=user_id)
+    rows = queryset.values_list('id', 'user_id', 'deck', 'next_review_date', 'review_count')
+    for card_id, owner_id, deck, next_review_date, review_count in rows.iterator(chunk_size=2000):
+        yield ReviewQueueEntry(
+            user_id=owner_id, item_type=FLASHCARD, object_id=card_id, deck=deck,
+            due_at=day_start(next_review_date), rank=review_count
+        )
+
+
+class ReviewQueue:
+    """
+    物化复习队列
+
+    用户的队列在首次读取时从源表构建（缓存中记录已构建），之后由保存/删除信号按行维护；
+    到期计数按天缓存，条目跨越"今天"边界时增减。
+    """
+
+    KEY_PREFIX = 'review_queue'
+    BATCH_SIZE = 2000
+    BUILD_LOCK_TIMEOUT = 300  # 用户队列构建锁（秒）
+
+    # 出队顺序：卡片按到期时间，生词按优先级（复习次数、掌握程度）
+    ORDERING = {
+        FLASHCARD: ('due_at', 'rank'),
+        VOCABULARY: ('rank', 'due_at'),
+    }
+
+    _sources: Dict[str, QueueSource] = {FLASHCARD: flashcard_entries}
+
+    @classmethod
+    def register_source(cls, item_type: str, source: QueueSource):
+        """注册队列来源（其他应用在ready中注册）"""
+        cls._sources[item_type] = source
+
+    # ---- 缓存键 ----
+
+    @classmethod
+    def _built_key(cls, user_id, item_type) -> str:
+        return f'{cls.KEY_PREFIX}:{user_id}:{item_type}:built'
+
+    @classmethod
+    def _build_lock_key(cls, user_id, item_type) -> str:
+        return f'{cls.KEY_PREFIX}:{user_id}:{item_type}:building'
+
+    @classmethod
+    def _count_key(cls, user_id, item_type, deck: Optional[str] = None) -> str:
+        """到期计数键：包含全量重建代数和用户队列的构建标记，任一重建后旧计数自然失效"""
+        generation_key, built_key = f'{cls.KEY_PREFIX}:generation', cls._built_key(user_id, item_type)
+        values = cache.get_many([generation_key, built_key])
+        key = (
+            f'{cls.KEY_PREFIX}:{values.get(generation_key, 0)}:{values.get(built_key, 0)}:'
+            f'{user_id}:{item_type}:{timezone.now().date().isoformat()}:due'
+        )
+        if deck is not None:
+            key += ':' + hashlib.md5(deck.encode('utf-8')).hexdigest()[:16]
+        return key
+
+    @staticmethod
+    def _cutoff() -> datetime:
+        """今天结束的时间点，到期时间早于它的条目今天需要复习"""
+        return day_start(timezone.now().date() + timedelta(days=1))
+
+    # ---- 构建 ----
+
+    @classmethod
+    def rebuild(cls, item_type: Optional[str] = None, user_id=None) -> int:
+        """
+        从源表重建队列
+
+        Args:
+            item_type: 队列类型，为空时重建全部类型
+            user_id: 用户ID，为空时重建全部用户
+
+        Returns:
+            int: 写入的条目数
+        """
+        total = 0
+        for queue_type in ([item_type] if item_type else list(cls._sources)):
+            entries = ReviewQueueEntry.objects.filter(item_type=queue_type)
+            if user_id:
+                entries = entries.filter(user_id=user_id)
+            with transaction.atomic():
+                entries.delete()
+                batch = []
+                for entry in cls._sources[queue_type](user_id):
+                    batch.append(entry)
+                    if len(batch) >= cls.BATCH_SIZE:
+                        # 与并发的重建或信号写入重叠时跳过已存在的条目，而不是违反唯一约束
+                        ReviewQueueEntry.objects.bulk_create(batch, ignore_conflicts=True)
+                        total += len(batch)
+                        batch = []
+                ReviewQueueEntry.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+
+            if user_id:
+                cache.set(cls._built_key(user_id, queue_type), time_ns(), None)
+
+        if not user_id:
+            # 全量重建后作废所有到期计数
+            if not cache.add(f'{cls.KEY_PREFIX}:generation', 1, None):
+                cache.incr(f'{cls.KEY_PREFIX}:generation')
+        return total
+
+    @classmethod
+    def ensure_built(cls, user_id, item_type):
+        """用户的队列尚未构建时从源表构建（缓存锁保证同一时间只有一个请求在构建）"""
+        if cache.get(cls._built_key(user_id, item_type)):
+            return
+        lock_key = cls._build_lock_key(user_id, item_type)
+        if not cache.add(lock_key, 1, cls.BUILD_LOCK_TIMEOUT):
+            return
+        try:
+            cls.rebuild(item_type, user_id)
+        finally:
+            cache.delete(lock_key)
+
+    # ---- 增量维护 ----
+
+    @classmethod
+    def sync(cls, item_type: str, user_id, object_id, due_at: datetime, rank: int = 0, deck: str = ''):
+        """新增或更新一个条目（复习后重新排期），并调整当天的到期计数"""
+        entry = ReviewQueueEntry.objects.filter(item_type=item_type, object_id=object_id).first()
+        if entry is None:
+            try:
+                with transaction.atomic():
+                    ReviewQueueEntry.objects.create(
+                        user_id=user_id, item_type=item_type, object_id=object_id,
+                        deck=deck, due_at=due_at, rank=rank
+                    )
+            except IntegrityError:
+                # 并发的构建或同步已插入该条目，改为更新
+                entry = ReviewQueueEntry.objects.get(item_type=item_type, object_id=object_id)
+
+        previous = (entry.user_id, entry.deck, entry.due_at) if entry else None
+        if entry is not None and (entry.user_id, entry.deck, entry.due_at, entry.rank) != (user_id, deck, due_at, rank):
+            ReviewQueueEntry.objects.filter(pk=entry.pk).update(user_id=user_id, deck=deck, due_at=due_at, rank=rank)
+
+        cls._adjust_counts(item_type, previous, (user_id, deck, due_at))
+
+    @classmethod
+    def sync_many(cls, item_type: str, items: Iterable[Tuple]):
+        """
+        批量新增或更新条目（一次查询已有条目，bulk_create/bulk_update写入）
+
+        Args:
+            items: [(user_id, object_id, due_at, rank, deck)]，object_id不重复
+        """
+        items = list(items)
+        existing = {
+            entry.object_id: entry
+            for entry in ReviewQueueEntry.objects.filter(item_type=item_type, object_id__in=[item[1] for item in items])
+        }
+        created, updated = [], []
+        for user_id, object_id, due_at, rank, deck in items:
+            entry = existing.get(object_id)
+            previous = (entry.user_id, entry.deck, entry.due_at) if entry else None
+            if entry is None:
+                created.append(ReviewQueueEntry(
+                    user_id=user_id, item_type=item_type, object_id=object_id, deck=deck, due_at=due_at, rank=rank
+                ))
+            elif (entry.user_id, entry.deck, entry.due_at, entry.rank) != (user_id, deck, due_at, rank):
+                entry.user_id, entry.deck, entry.due_at, entry.rank = user_id, deck, due_at, rank
+                updated.append(entry)
+            cls._adjust_counts(item_type, previous, (user_id, deck, due_at))
+
+        ReviewQueueEntry.objects.bulk_create(created)
+        ReviewQueueEntry.objects.bulk_update(updated, ['user', 'deck', 'due_at', 'rank'])
+
+    @classmethod
+    def remove(cls, item_type: str, object_id):
+        """移除条目（删除或停用）"""
+        entry = ReviewQueueEntry.objects.filter(item_type=item_type, object_id=object_id).first()
+        if entry is None:
+            return
+        entry.delete()
+        cls._adjust_counts(item_type, (entry.user_id, entry.deck, entry.due_at), None)
+
+    @classmethod
+    def _adjust_counts(cls, item_type, previous, current):
+        """条目进入或离开今天的到期集合时，在事务提交后增减计数（计数不存在时跳过，读取时重新统计）"""
+        cutoff = cls._cutoff()
+        before = previous if previous and previous[2] < cutoff else None
+        after = current if current and current[2] < cutoff else None
+        if before == after or (before and after and before[:2] == after[:2]):
+            return
+
+        def apply():
+            for state, delta in ((before, -1), (after, 1)):
+                if state is None:
+                    continue
+                user_id, deck, _ = state
+                for key in (cls._count_key(user_id, item_type), cls._count_key(user_id, item_type, deck)):
+                    try:
+                        cache.incr(key, delta)
+                    except ValueError:
+                        pass
+        transaction.on_commit(apply)
+
+    # ---- 读取 ----
+
+    @classmethod
+    def due_entries(cls, user_id, item_type: str, deck: Optional[str] = None):
+        """今天到期的条目（按出队顺序，走 (user, item_type, due_at/rank) 索引）"""
+        cls.ensure_built(user_id, item_type)
+        entries = ReviewQueueEntry.objects.filter(user_id=user_id, item_type=item_type, due_at__lt=cls._cutoff())
+        if deck:
+            entries = entries.filter(deck=deck)
+        return entries.order_by(*cls.ORDERING[item_type])
+
+    @classmethod
+    def due_ids(cls, user_id, item_type: str, deck: Optional[str] = None, limit: int = 50) -> List:
+        """队首的若干个对象ID"""
+        return list(cls.due_entries(user_id, item_type, deck).values_list('object_id', flat=True)[:limit])
+
+    @classmethod
+    def head(cls, user_id, item_type: str, deck: Optional[str] = None):
+        """下一个待复习的对象ID，队列为空时为None"""
+        ids = cls.due_ids(user_id, item_type, deck, limit=1)
+        return ids[0] if ids else None
+
+    @classmethod
+    def due_count(cls, user_id, item_type: str, deck: Optional[str] = None) -> int:
+        """今天到期的数量（缓存计数，缺失时统计一次）"""
+        cls.ensure_built(user_id, item_type)
+        key = cls._count_key(user_id, item_type, deck or None)
+        count = cache.get(key)
+        if count is None:
+            count = cls.due_entries(user_id, item_type, deck).count()
+            timeout = int((cls._cutoff() - timezone.now()).total_seconds()) + 60
+            if not cache.add(key, count, timeout):
+                count = cache.get(key, count)
+        return count
+
+
+def sync_flashcard(flashcard: Flashcard):
+    """卡片保存后同步队列条目"""
+    if not flashcard.is_active:
+        ReviewQueue.remove(FLASHCARD, flashcard.pk)
+        return
+    ReviewQueue.sync(
+        FLASHCARD, flashcard.user_id, flashcard.pk, day_start(flashcard.next_review_date),
+        rank=flashcard.review_count, deck=flashcard.deck
+    )
+
+
+def sync_flashcards(flashcards: Iterable[Flashcard]):
+    """批量写入卡片后同步队列条目（bulk_update不触发保存信号）"""
+    ReviewQueue.sync_many(FLASHCARD, [
+        (flashcard.user_id, flashcard.pk, day_start(flashcard.next_review_date), flashcard.review_count, flashcard.deck)
+        for flashcard in flashcards
+    ])
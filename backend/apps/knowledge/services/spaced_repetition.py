@@ -1,13 +1,18 @@
 """
 间隔重复算法服务
-实现SM-2算法和卡片调度逻辑
+实现SM-2算法、FSRS调度和卡片调度逻辑
 """
-from datetime import date, timedelta
-from typing import List, Dict, Optional, Tuple
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional, Sequence, Tuple
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
-from django.db import models
-from apps.knowledge.models import Flashcard, FlashcardReview, StudySession
+from apps.knowledge.models import Flashcard, FlashcardReview, SchedulerParameters, StudySession
+from apps.knowledge.services import fsrs
+from apps.knowledge.services.review_queue import FLASHCARD, ReviewQueue, sync_flashcards
+from apps.knowledge.services.statistics import StatisticsCache, flashcard_deck_totals, flashcard_summary
 
 
 class SM2Algorithm:
@@ -25,7 +30,8 @@ class SM2Algorithm:
         current_interval: int,
         current_ease_factor: float,
         review_count: int,
-        quality: int
+        quality: int,
+        review_date: Optional[date] = None
     ) -> Tuple[int, float, date]:
         """
         计算下次复习信息
@@ -35,6 +41,7 @@ class SM2Algorithm:
             current_ease_factor: 当前易度因子
             review_count: 复习次数
             quality: 复习质量评分 (0-5)
+            review_date: 复习日期，默认今天（离线复习为实际复习日期）
 
         Returns:
             (新间隔, 新易度因子, 下次复习日期)
@@ -62,7 +69,7 @@ class SM2Algorithm:
             new_ease_factor = max(cls.MIN_EASE_FACTOR, new_ease_factor)
 
         # 计算下次复习日期
-        next_review_date = timezone.now().date() + timedelta(days=new_interval)
+        next_review_date = (review_date or timezone.now().date()) + timedelta(days=new_interval)
 
         return new_interval, new_ease_factor, next_review_date
 
@@ -80,6 +87,127 @@ class SM2Algorithm:
         return labels.get(quality, '未知')
 
 
+@dataclass
+class ScheduleResult:
+    """一次复习后的排期"""
+    interval: int
+    ease_factor: float
+    next_review_date: Optional[date]
+    memory: fsrs.MemoryState
+
+
+class ReviewScheduler(ABC):
+    """
+    复习调度器接口
+
+    两种调度器都按FSRS模型维护记忆状态（稳定性、难度），切换算法时无需重新积累状态；
+    区别在于下次复习间隔由谁决定。
+    """
+
+    name = ''
+
+    def __init__(self, weights: Sequence[float] = fsrs.DEFAULT_WEIGHTS, desired_retention: float = 0.9):
+        self.weights = weights
+        self.desired_retention = desired_retention
+
+    def update_memory(
+        self,
+        stability: Optional[float],
+        difficulty: Optional[float],
+        grade: int,
+        last_reviewed_at: Optional[datetime],
+        reviewed_at: Optional[datetime] = None
+    ) -> fsrs.MemoryState:
+        """按评分更新记忆状态（没有状态的卡片视为首次复习）"""
+        state = fsrs.MemoryState(stability, difficulty) if stability and difficulty else None
+        reviewed_at = reviewed_at or timezone.now()
+        elapsed = (reviewed_at - last_reviewed_at).total_seconds() / 86400 if last_reviewed_at else 0
+        return fsrs.next_state(state, grade, elapsed, self.weights)
+
+    def fsrs_interval(self, memory: fsrs.MemoryState) -> int:
+        return fsrs.next_interval(
+            memory.stability, self.desired_retention, getattr(settings, 'FSRS_MAXIMUM_INTERVAL', 365)
+        )
+
+    @abstractmethod
+    def schedule_flashcard(
+        self, flashcard: Flashcard, quality: int, reviewed_at: Optional[datetime] = None
+    ) -> ScheduleResult:
+        """卡片复习后的排期（quality为0-5评分，reviewed_at默认为当前时间）"""
+        pass
+
+    def schedule_vocabulary(self, vocabulary, is_correct: bool, difficulty_rating: Optional[int] = None) -> ScheduleResult:
+        """生词复习后的排期，next_review_date为None表示不排期（按优先级复习）"""
+        memory = self.update_memory(
+            vocabulary.stability, vocabulary.memory_difficulty,
+            fsrs.grade_from_vocabulary_review(is_correct, difficulty_rating), vocabulary.last_reviewed_at
+        )
+        return ScheduleResult(0, 0.0, None, memory)
+
+
+class SM2Scheduler(ReviewScheduler):
+    """SM-2调度：间隔由易度因子决定"""
+
+    name = 'sm2'
+
+    def schedule_flashcard(
+        self, flashcard: Flashcard, quality: int, reviewed_at: Optional[datetime] = None
+    ) -> ScheduleResult:
+        interval, ease_factor, next_review_date = SM2Algorithm.calculate_next_review(
+            flashcard.interval,
+            flashcard.ease_factor,
+            flashcard.review_count,
+            quality,
+            reviewed_at.date() if reviewed_at else None
+        )
+        memory = self.update_memory(
+            flashcard.stability, flashcard.memory_difficulty,
+            fsrs.grade_from_quality(quality), flashcard.last_reviewed_at, reviewed_at
+        )
+        return ScheduleResult(interval, ease_factor, next_review_date, memory)
+
+
+class FSRSScheduler(ReviewScheduler):
+    """FSRS调度：间隔取回忆概率降到目标保持率的时间"""
+
+    name = 'fsrs'
+
+    def schedule_flashcard(
+        self, flashcard: Flashcard, quality: int, reviewed_at: Optional[datetime] = None
+    ) -> ScheduleResult:
+        memory = self.update_memory(
+            flashcard.stability, flashcard.memory_difficulty,
+            fsrs.grade_from_quality(quality), flashcard.last_reviewed_at, reviewed_at
+        )
+        interval = self.fsrs_interval(memory)
+        review_date = (reviewed_at or timezone.now()).date()
+        return ScheduleResult(interval, flashcard.ease_factor, review_date + timedelta(days=interval), memory)
+
+    def schedule_vocabulary(self, vocabulary, is_correct: bool, difficulty_rating: Optional[int] = None) -> ScheduleResult:
+        result = super().schedule_vocabulary(vocabulary, is_correct, difficulty_rating)
+        result.interval = self.fsrs_interval(result.memory)
+        result.next_review_date = timezone.now().date() + timedelta(days=result.interval)
+        return result
+
+
+SCHEDULERS = {
+    SM2Scheduler.name: SM2Scheduler,
+    FSRSScheduler.name: FSRSScheduler,
+}
+
+
+def get_scheduler(user) -> ReviewScheduler:
+    """用户的复习调度器：有拟合参数时按其算法和参数，否则按全局配置"""
+    parameters = SchedulerParameters.objects.filter(user=user).first()
+    desired_retention = getattr(settings, 'FSRS_DESIRED_RETENTION', 0.9)
+    if parameters is None:
+        scheduler_class = SCHEDULERS.get(getattr(settings, 'SPACED_REPETITION_SCHEDULER', 'sm2'), SM2Scheduler)
+        return scheduler_class(desired_retention=desired_retention)
+    return SCHEDULERS.get(parameters.algorithm, SM2Scheduler)(
+        parameters.weights or fsrs.DEFAULT_WEIGHTS, parameters.desired_retention
+    )
+
+
 class FlashcardScheduler:
     """卡片调度器"""
 
@@ -87,17 +215,10 @@ class FlashcardScheduler:
         self.user = user
 
     def get_due_cards(self, deck: Optional[str] = None, limit: int = 50) -> List[Flashcard]:
-        """获取到期复习的卡片"""
-        queryset = Flashcard.objects.filter(
-            user=self.user,
-            is_active=True,
-            next_review_date__lte=date.today()
-        )
-
-        if deck:
-            queryset = queryset.filter(deck=deck)
-
-        return queryset.order_by('next_review_date')[:limit]
+        """获取到期复习的卡片（从复习队列按到期顺序取出）"""
+        card_ids = ReviewQueue.due_ids(self.user.pk, FLASHCARD, deck, limit)
+        cards = Flashcard.objects.in_bulk(card_ids)
+        return [cards[card_id] for card_id in card_ids if card_id in cards]
 
     def get_new_cards(self, deck: Optional[str] = None, limit: int = 10) -> List[Flashcard]:
         """获取新卡片（从未复习过的）"""
@@ -142,25 +263,15 @@ class FlashcardScheduler:
         return due_cards, len(due_cards)
 
     def get_statistics(self, deck: Optional[str] = None) -> Dict:
-        """获取复习统计信息"""
-        queryset = Flashcard.objects.filter(user=self.user, is_active=True)
-
-        if deck:
-            queryset = queryset.filter(deck=deck)
-
-        total = queryset.count()
-        due = queryset.filter(next_review_date__lte=date.today()).count()
-        new = queryset.filter(review_count=0).count()
-        learning = queryset.filter(review_count__gt=0).count()
-
-        # 掌握程度统计
-        mastered = queryset.filter(review_count__gte=5).count()
+        """获取复习统计信息（一次条件聚合，按用户缓存）"""
+        summary = flashcard_summary(self.user.pk, deck)
+        total, mastered = summary['total'], summary['mastered']
 
         return {
             'total': total,
-            'due': due,
-            'new': new,
-            'learning': learning,
+            'due': ReviewQueue.due_count(self.user.pk, FLASHCARD, deck),
+            'new': summary['new'],
+            'learning': summary['learning'],
             'mastered': mastered,
             'mastery_rate': (mastered / total * 100) if total > 0 else 0,
         }
@@ -235,14 +346,22 @@ class FlashcardService:
         self.scheduler = FlashcardScheduler(user)
         self.session_manager = StudySessionManager(user)
 
-    @transaction.atomic
-    def review_card(
+    # 批量复习允许的客户端时钟偏差
+    CLOCK_SKEW = timedelta(minutes=5)
+    REVIEW_FIELDS = [
+        'interval', 'ease_factor', 'next_review_date', 'stability', 'memory_difficulty',
+        'review_count', 'last_reviewed_at', 'updated_at',
+    ]
+
+    def _apply_review(
         self,
         flashcard: Flashcard,
         quality: int,
-        review_time: int = None
+        review_time: int,
+        reviewed_at: datetime,
+        scheduler: ReviewScheduler
     ) -> FlashcardReview:
-        """复习卡片"""
+        """在内存中更新卡片的排期，返回未保存的复习记录"""
         if not 0 <= quality <= 5:
             raise ValueError("Quality must be between 0 and 5")
 
@@ -250,36 +369,102 @@ class FlashcardService:
         previous_interval = flashcard.interval
         previous_ease_factor = flashcard.ease_factor
 
-        # 计算新的复习参数
-        new_interval, new_ease_factor, next_review_date = SM2Algorithm.calculate_next_review(
-            flashcard.interval,
-            flashcard.ease_factor,
-            flashcard.review_count,
-            quality
-        )
+        # 按用户的调度器计算新的复习参数
+        result = scheduler.schedule_flashcard(flashcard, quality, reviewed_at)
 
         # 更新卡片
-        flashcard.interval = new_interval
-        flashcard.ease_factor = new_ease_factor
-        flashcard.next_review_date = next_review_date
+        flashcard.interval = result.interval
+        flashcard.ease_factor = result.ease_factor
+        flashcard.next_review_date = result.next_review_date
+        flashcard.stability = result.memory.stability
+        flashcard.memory_difficulty = result.memory.difficulty
         flashcard.review_count += 1
-        flashcard.last_reviewed_at = timezone.now()
-        flashcard.save()
+        flashcard.last_reviewed_at = reviewed_at
 
-        # 创建复习记录
-        review = FlashcardReview.objects.create(
+        return FlashcardReview(
             user=self.user,
             flashcard=flashcard,
             rating=quality,
             review_time=review_time or 0,
             previous_interval=previous_interval,
             previous_ease_factor=previous_ease_factor,
-            new_interval=new_interval,
-            new_ease_factor=new_ease_factor
+            new_interval=result.interval,
+            new_ease_factor=result.ease_factor,
+            created_at=reviewed_at
         )
 
+    @transaction.atomic
+    def review_card(
+        self,
+        flashcard: Flashcard,
+        quality: int,
+        review_time: int = None
+    ) -> FlashcardReview:
+        """复习卡片"""
+        review = self._apply_review(flashcard, quality, review_time, timezone.now(), get_scheduler(self.user))
+        flashcard.save()
+        review.save()
         return review
 
+    @transaction.atomic
+    def review_cards(self, items: List[Dict]) -> List[Dict]:
+        """
+        批量复习（一次学习或离线同步的多次复习）
+
+        按提交顺序在内存中排期，卡片一次 bulk_update、复习记录一次 bulk_create；
+        卡片不存在、复习时间在未来或早于卡片已有的最后复习时间的项记为冲突并跳过。
+
+        Args:
+            items: [{'card_id', 'quality', 'review_time', 'reviewed_at'}]，reviewed_at缺省为当前时间
+
+        Returns:
+            List[Dict]: 每项的结果，status为applied或conflict（附reason）
+        """
+        now = timezone.now()
+        cards = Flashcard.objects.select_for_update().filter(user=self.user, is_active=True).in_bulk(
+            [item['card_id'] for item in items]
+        )
+        scheduler = get_scheduler(self.user)
+        reviews, reviewed_cards, results = [], {}, []
+
+        for item in items:
+            card = cards.get(item['card_id'])
+            reviewed_at = item.get('reviewed_at') or now
+            if card is None:
+                reason = 'not_found'
+            elif reviewed_at > now + self.CLOCK_SKEW:
+                reason = 'future_review'
+            elif card.last_reviewed_at and reviewed_at < card.last_reviewed_at:
+                reason = 'stale_review'  # 已有更晚的复习（如其他设备已同步）
+            else:
+                reason = None
+
+            if reason:
+                results.append({'card_id': item['card_id'], 'status': 'conflict', 'reason': reason})
+                continue
+
+            reviews.append(self._apply_review(
+                card, item['quality'], item.get('review_time', 0), min(reviewed_at, now), scheduler
+            ))
+            card.updated_at = now
+            reviewed_cards[card.pk] = card
+            results.append({
+                'card_id': card.pk,
+                'status': 'applied',
+                'next_review_date': card.next_review_date,
+                'interval': card.interval,
+                'ease_factor': card.ease_factor,
+            })
+
+        if reviewed_cards:
+            # bulk_update不触发保存信号，手动同步复习队列和统计缓存
+            Flashcard.objects.bulk_update(reviewed_cards.values(), fields=self.REVIEW_FIELDS)
+            FlashcardReview.objects.bulk_create(reviews)
+            sync_flashcards(reviewed_cards.values())
+            StatisticsCache.invalidate(self.user.pk)
+
+        return results
+
     def create_flashcard(
         self,
         front: str,
@@ -331,50 +516,21 @@ class FlashcardService:
 
     def get_deck_list(self) -> List[str]:
         """获取所有卡组"""
-        decks = Flashcard.objects.filter(
-            user=self.user,
-            is_active=True
-        ).values_list('deck', flat=True).distinct()
-
-        return list(decks)
+        return list(flashcard_deck_totals(self.user.pk))
 
     def get_due_cards_count(self, deck: str = None) -> int:
         """获取到期卡片数量"""
-        queryset = Flashcard.objects.filter(
-            user=self.user,
-            is_active=True,
-            next_review_date__lte=date.today()
-        )
-
-        if deck:
-            queryset = queryset.filter(deck=deck)
-
-        return queryset.count()
+        return ReviewQueue.due_count(self.user.pk, FLASHCARD, deck)
 
     def get_learning_progress(self, deck: str = None) -> Dict:
-        """获取学习进度"""
-        queryset = Flashcard.objects.filter(user=self.user, is_active=True)
+        """获取学习进度（一次条件聚合，按用户缓存）"""
+        summary = flashcard_summary(self.user.pk, deck)
 
-        if deck:
-            queryset = queryset.filter(deck=deck)
-
-        # 按掌握程度分组
-        mastery_levels = {}
-        for level in range(6):  # 0-5掌握程度
-            count = queryset.filter(review_count=level).count()
-            mastery_levels[f'level_{level}'] = count
-
-        # 计算平均间隔和易度因子
-        avg_interval = queryset.filter(review_count__gt=0).aggregate(
-            models.Avg('interval')
-        )['interval__avg'] or 0
-
-        avg_ease_factor = queryset.filter(review_count__gt=0).aggregate(
-            models.Avg('ease_factor')
-        )['ease_factor__avg'] or 0
+        # 按掌握程度（复习次数0-5）分组
+        mastery_levels = {f'level_{level}': summary[f'level_{level}'] for level in range(6)}
 
         return {
             'mastery_distribution': mastery_levels,
-            'average_interval': round(avg_interval, 1),
-            'average_ease_factor': round(avg_ease_factor, 2),
-        }
\ No newline at end of file
+            'average_interval': round(summary['average_interval'] or 0, 1),
+            'average_ease_factor': round(summary['average_ease_factor'] or 0, 2),
+        }
@@ -0,0 +1,95 @@
+"""
+统计服务
+仪表盘统计用条件聚合（Count(filter=Q(...))、values().annotate()）每个模型一次查询算出，
+结果按用户缓存；相关模型保存或删除时递增用户的统计版本，旧缓存随之失效
+"""
+import hashlib
+from typing import Callable, Dict, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+
+from core.cache import CacheService
+from apps.knowledge.models import Concept, Flashcard, Highlight, Note
+
+
+class StatisticsCache:
+    """按用户版本号缓存的统计结果"""
+
+    KEY_PREFIX = 'stats'
+
+    @classmethod
+    def _version_key(cls, user_id) -> str:
+        return f'{cls.KEY_PREFIX}:{user_id}:version'
+
+    @classmethod
+    def get_or_compute(cls, user_id, name: str, compute: Callable[[], Dict]) -> Dict:
+        """读取缓存的统计，缺失时计算并写入"""
+        key = f'{cls.KEY_PREFIX}:{user_id}:{cache.get(cls._version_key(user_id), 0)}:{name}'
+        return CacheService.get_or_set(key, compute, CacheService.MEDIUM)
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """事务提交后作废用户的全部统计缓存"""
+        def bump():
+            key = cls._version_key(user_id)
+            if not cache.add(key, 1, None):
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.set(key, 1, None)
+        transaction.on_commit(bump)
+
+
+def _deck_suffix(deck: Optional[str]) -> str:
+    return ':' + hashlib.md5(deck.encode('utf-8')).hexdigest()[:16] if deck else ''
+
+
+def flashcard_summary(user_id, deck: Optional[str] = None) -> Dict:
+    """活跃卡片的数量、各复习次数的分布和平均间隔/易度因子（一次查询）"""
+    def compute():
+        queryset = Flashcard.objects.filter(user_id=user_id, is_active=True)
+        if deck:
+            queryset = queryset.filter(deck=deck)
+        reviewed = Q(review_count__gt=0)
+        return queryset.aggregate(
+            total=Count('id'),
+            new=Count('id', filter=Q(review_count=0)),
+            learning=Count('id', filter=reviewed),
+            mastered=Count('id', filter=Q(review_count__gte=5)),
+            average_interval=Avg('interval', filter=reviewed),
+            average_ease_factor=Avg('ease_factor', filter=reviewed),
+            **{f'level_{level}': Count('id', filter=Q(review_count=level)) for level in range(6)},
+        )
+    return StatisticsCache.get_or_compute(user_id, 'flashcards' + _deck_suffix(deck), compute)
+
+
+def flashcard_deck_totals(user_id) -> Dict[str, int]:
+    """各卡组的活跃卡片数（一次分组查询）"""
+    def compute():
+        rows = Flashcard.objects.filter(user_id=user_id, is_active=True).values('deck').annotate(
+            total=Count('id')
+        ).order_by('deck')
+        return {row['deck']: row['total'] for row in rows}
+    return StatisticsCache.get_or_compute(user_id, 'flashcard_decks', compute)
+
+
+def knowledge_overview(user_id) -> Dict:
+    """知识库总览：概念、笔记、卡片和高亮各一次聚合查询"""
+    def compute():
+        return {
+            'concepts': Concept.objects.filter(user_id=user_id).aggregate(
+                total=Count('id'),
+                mastered=Count('id', filter=Q(is_mastered=True)),
+                verified=Count('id', filter=Q(is_verified=True)),
+            ),
+            'notes': Note.objects.filter(user_id=user_id).aggregate(
+                total=Count('id'),
+                bookmarked=Count('id', filter=Q(is_bookmarked=True)),
+                public=Count('id', filter=Q(is_public=True)),
+            ),
+            'flashcards': {'total': flashcard_summary(user_id)['total']},
+            'highlights': Highlight.objects.filter(user_id=user_id).aggregate(total=Count('id')),
+        }
+    return StatisticsCache.get_or_compute(user_id, 'overview', compute)
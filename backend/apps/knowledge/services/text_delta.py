@@ -0,0 +1,72 @@
+"""
+文本增量
+按行生成统一差异格式（unified diff，无上下文行）并用zlib压缩，用于笔记历史只保存相邻版本之间的变化；
+差异可正向应用（旧版本 -> 新版本）也可反向应用（新版本 -> 旧版本）
+"""
+import difflib
+import hashlib
+import re
+import zlib
+from typing import List, Tuple
+
+_HUNK = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+
+def content_hash(text: str) -> str:
+    """内容摘要，用于确认增量的基准版本"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def make_delta(old: str, new: str) -> bytes:
+    """压缩的差异（按'\\n'切分行，切分和拼接可逆，因此差异文本中每行恰好对应一行内容）"""
+    diff = difflib.unified_diff(old.split('\n'), new.split('\n'), lineterm='', n=0)
+    return zlib.compress('\n'.join(diff).encode('utf-8'))
+
+
+def _parse(delta: bytes) -> List[Tuple[int, int, List[str], int, int, List[str]]]:
+    """解析为 [(旧起始, 旧行数, 删除的行, 新起始, 新行数, 新增的行)]"""
+    hunks = []
+    for line in zlib.decompress(delta).decode('utf-8').split('\n'):
+        match = _HUNK.match(line)
+        if match:
+            old_start, old_len, new_start, new_len = match.groups()
+            hunks.append((
+                int(old_start), 1 if old_len is None else int(old_len), [],
+                int(new_start), 1 if new_len is None else int(new_len), [],
+            ))
+        elif hunks and line[:1] == '-':
+            # 文件头（---/+++）只出现在第一个块之前
+            hunks[-1][2].append(line[1:])
+        elif hunks and line[:1] == '+':
+            hunks[-1][5].append(line[1:])
+    return hunks
+
+
+def apply_delta(text: str, delta: bytes, reverse: bool = False) -> str:
+    """
+    应用差异
+
+    Args:
+        text: 基准文本（正向为旧版本，反向为新版本）
+        delta: make_delta生成的差异
+        reverse: 反向应用
+
+    Raises:
+        ValueError: 基准文本与差异不匹配
+    """
+    lines = text.split('\n')
+    output, position = [], 0
+    for old_start, old_len, removed, new_start, new_len, added in _parse(delta):
+        if reverse:
+            old_start, old_len, removed, new_start, new_len, added = new_start, new_len, added, old_start, old_len, removed
+        if (len(removed), len(added)) != (old_len, new_len):
+            raise ValueError('差异格式错误')
+        # 行数为0时起始行号指插入位置之前的一行
+        index = old_start - 1 if old_len else old_start
+        if index < position or lines[index:index + old_len] != removed:
+            raise ValueError('基准文本与差异不匹配')
+        output.extend(lines[position:index])
+        output.extend(added)
+        position = index + old_len
+    output.extend(lines[position:])
+    return '\n'.join(output)
@@ -1,12 +1,19 @@
 """
 知识库信号处理器
-自动同步学习会话数据到用户的学习时间统计
+自动同步学习会话数据到用户的学习时间统计，把概念和关系的变化增量应用到概念图快照，
+按卡片的保存和删除维护复习队列，并在统计相关的数据变化时作废用户的统计缓存
 """
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.db.models import Sum
-from apps.knowledge.models import StudySession
+from apps.knowledge.models import Concept, ConceptRelation, Flashcard, Highlight, Note, StudySession
+from apps.knowledge.services.graph_store import (
+    GRAPH_FIELDS, REMOVE_EDGE, REMOVE_NODE, ConceptGraphStore, concept_delta, relation_delta
+)
+from apps.knowledge.services.review_queue import FLASHCARD, ReviewQueue, sync_flashcard
+from apps.knowledge.services.statistics import StatisticsCache
 
 
 @receiver(post_save, sender=StudySession)
@@ -21,4 +28,64 @@ def sync_study_time_to_profile(sender, instance, created, **kwargs):
         # 更新用户档案中的学习时间
         profile = instance.user.profile
         profile.study_time_hours = float(profile.study_time_hours) + session_hours
-        profile.save(update_fields=['study_time_hours'])
\ No newline at end of file
+        profile.save(update_fields=['study_time_hours'])
+
+
+def _apply_graph_delta(user_ids, delta):
+    """事务提交后为相关范围（用户自己的图和全部概念的图）记录增量"""
+    def apply():
+        for user_id in {*user_ids, None}:
+            ConceptGraphStore.apply(user_id, delta)
+    transaction.on_commit(apply)
+
+
+def _relation_user_id(relation):
+    """关系所属用户（源概念的用户）"""
+    return Concept.objects.filter(pk=relation.source_concept_id).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=Concept)
+def update_graph_on_concept_save(sender, instance, created, update_fields=None, **kwargs):
+    """概念新增或图相关字段变化时更新节点"""
+    if not created and update_fields is not None and not GRAPH_FIELDS & set(update_fields):
+        return
+    _apply_graph_delta([instance.user_id], concept_delta(instance))
+
+
+@receiver(post_delete, sender=Concept)
+def update_graph_on_concept_delete(sender, instance, **kwargs):
+    """删除概念节点及其关联边"""
+    _apply_graph_delta([instance.user_id], (REMOVE_NODE, str(instance.pk)))
+
+
+@receiver(post_save, sender=ConceptRelation)
+def update_graph_on_relation_save(sender, instance, **kwargs):
+    """新增或更新关系边"""
+    _apply_graph_delta([_relation_user_id(instance)], relation_delta(instance))
+
+
+@receiver(post_delete, sender=ConceptRelation)
+def update_graph_on_relation_delete(sender, instance, **kwargs):
+    """删除关系边"""
+    _apply_graph_delta([_relation_user_id(instance)], (REMOVE_EDGE, str(instance.pk)))
+
+
+@receiver(post_save, sender=Flashcard)
+def update_review_queue_on_flashcard_save(sender, instance, **kwargs):
+    """卡片新增、复习或停用后更新复习队列"""
+    sync_flashcard(instance)
+
+
+@receiver(post_delete, sender=Flashcard)
+def update_review_queue_on_flashcard_delete(sender, instance, **kwargs):
+    """删除卡片的队列条目"""
+    ReviewQueue.remove(FLASHCARD, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Concept)
+@receiver([post_save, post_delete], sender=Note)
+@receiver([post_save, post_delete], sender=Flashcard)
+@receiver([post_save, post_delete], sender=Highlight)
+def invalidate_statistics(sender, instance, **kwargs):
+    """统计相关的数据变化时作废用户的统计缓存"""
+    StatisticsCache.invalidate(instance.user_id)
@@ -0,0 +1,40 @@
+import logging
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from apps.knowledge.services.fsrs_optimizer import SchedulerParameterJob
+from apps.knowledge.services.graph_analytics import CentralityService
+from apps.knowledge.services.review_queue import ReviewQueue
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+@shared_task
+def compute_concept_centrality(user_id=None):
+    """计算用户概念图（user_id为空时为全部概念的图）当前版本的中心性"""
+    try:
+        user = User.objects.filter(pk=user_id).first() if user_id else None
+        if user_id and user is None:
+            return 0
+        return CentralityService.refresh(user)
+    except Exception as e:
+        logger.error(f"计算概念图中心性失败: {e}")
+        raise
+    finally:
+        CentralityService.release(user_id)
+
+
+@shared_task
+def rebuild_review_queues():
+    """每晚从卡片和生词表全量重建复习队列"""
+    count = ReviewQueue.rebuild()
+    logger.info(f"复习队列已重建: {count} 个条目")
+    return count
+
+
+@shared_task
+def fit_scheduler_parameters(user_ids=None):
+    """按批拟合用户的FSRS参数，复习数足够的用户改用FSRS调度"""
+    result = SchedulerParameterJob.run(user_ids)
+    logger.info(f"FSRS参数拟合完成: {result}")
+    return result
@@ -125,4 +125,431 @@ class FlashcardServiceTest(BaseAPITestCase):
 
         self.due_card.refresh_from_db()
         self.assertEqual(self.due_card.review_count, 1)
-        self.assertIsNotNone(self.due_card.next_review_date)
\ No newline at end of file
+        self.assertIsNotNone(self.due_card.next_review_date)
+
+
+class ReviewQueueTest(BaseAPITestCase):
+    """物化复习队列测试"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        from apps.knowledge.models import Flashcard
+
+        cache.clear()
+        self.cards = [
+            Flashcard.objects.create(user=self.user, front=f'问题{days}', back='答案', deck='数学',
+                                     next_review_date=date.today() + timedelta(days=days))
+            for days in (-2, 0, 3)
+        ]
+
+    def test_review_updates_queue_and_due_count(self):
+        """复习后条目重新排期，到期计数增量更新"""
+        from apps.knowledge.services.review_queue import FLASHCARD, ReviewQueue
+
+        self.assertEqual(ReviewQueue.due_count(self.user.pk, FLASHCARD), 2)
+        self.assertEqual(ReviewQueue.due_count(self.user.pk, FLASHCARD, '数学'), 2)
+        self.assertEqual(ReviewQueue.head(self.user.pk, FLASHCARD), self.cards[0].id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FlashcardService(self.user).review_card(self.cards[0], quality=5)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ReviewQueue.due_count(self.user.pk, FLASHCARD), 1)
+            self.assertEqual(ReviewQueue.due_count(self.user.pk, FLASHCARD, '数学'), 1)
+        response = self.client.get('/api/knowledge/flashcards/due/')
+        self.assertEqual([card['id'] for card in response.data['results']], [str(self.cards[1].id)])
+
+    def test_next_review_word_pops_lowest_priority(self):
+        """下一个生词为复习次数最少、掌握程度最低的生词"""
+        from apps.study.models import Vocabulary
+
+        reviewed = Vocabulary.objects.create(user=self.user, word='theorem', review_count=2)
+        fresh = Vocabulary.objects.create(user=self.user, word='lemma', mastery_level=3)
+        weakest = Vocabulary.objects.create(user=self.user, word='proof', mastery_level=1)
+
+        url = '/api/study/vocabulary/review/next/'
+        self.assertEqual(self.client.get(url).data['word'], weakest.word)
+
+        weakest.review_count, weakest.mastery_level = 1, 2
+        weakest.save()
+        self.assertEqual(self.client.get(url).data['word'], fresh.word)
+        self.assertNotEqual(self.client.get(url).data['word'], reviewed.word)
+
+
+class FlashcardBatchReviewTest(BaseAPITestCase):
+    """批量复习测试"""
+
+    def test_batch_review_applies_in_order_and_reports_conflicts(self):
+        """按顺序排期、批量写入，缺失和过期的复习记为冲突"""
+        import uuid
+        from django.core.cache import cache
+        from django.utils import timezone
+        from apps.knowledge.models import FlashcardReview
+        from apps.knowledge.services.review_queue import FLASHCARD, ReviewQueue
+
+        cache.clear()
+        service = FlashcardService(self.user)
+        first, second = [service.create_flashcard(front=f'问题{i}', back='答案') for i in range(2)]
+        earlier = timezone.now() - timedelta(days=3)
+        self.assertEqual(ReviewQueue.due_count(self.user.pk, FLASHCARD), 2)
+
+        payload = {'reviews': [
+            {'card_id': str(first.id), 'quality': 5, 'reviewed_at': earlier.isoformat()},
+            {'card_id': str(first.id), 'quality': 4},
+            {'card_id': str(second.id), 'quality': 1, 'review_time': 12},
+            {'card_id': str(second.id), 'quality': 5, 'reviewed_at': earlier.isoformat()},
+            {'card_id': str(uuid.uuid4()), 'quality': 3},
+        ]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/knowledge/flashcards/batch_review/', payload, format='json')
+
+        self.assertEqual((response.data['applied'], response.data['conflicts']), (3, 2))
+        self.assertEqual(
+            [result.get('reason') for result in response.data['results']],
+            [None, None, None, 'stale_review', 'not_found']
+        )
+        first.refresh_from_db()
+        self.assertEqual(
+            (first.review_count, first.interval), (2, response.data['results'][1]['interval'])
+        )
+        reviews = FlashcardReview.objects.filter(flashcard=first).order_by('created_at')
+        self.assertEqual(reviews[0].created_at, earlier)
+        self.assertEqual(ReviewQueue.due_count(self.user.pk, FLASHCARD), 0)
+
+
+class FSRSSchedulerTest(BaseAPITestCase):
+    """FSRS调度和参数拟合测试"""
+
+    def test_fsrs_user_scheduled_by_stability(self):
+        """FSRS用户的间隔由稳定性决定，易度因子不变"""
+        from apps.knowledge.models import SchedulerParameters
+        from apps.knowledge.services import fsrs
+
+        SchedulerParameters.objects.create(user=self.user, algorithm='fsrs')
+        service = FlashcardService(self.user)
+        card = service.create_flashcard(front='问题', back='答案')
+
+        review = service.review_card(card, quality=4)
+        card.refresh_from_db()
+        self.assertAlmostEqual(card.stability, fsrs.DEFAULT_WEIGHTS[fsrs.GOOD - 1])
+        self.assertEqual(review.new_interval, fsrs.next_interval(card.stability))
+        self.assertEqual(card.ease_factor, 2.5)
+
+        # 按期复习且记得，稳定性和间隔增长
+        card.last_reviewed_at -= timedelta(days=card.interval)
+        review = service.review_card(card, quality=4)
+        self.assertGreater(review.new_interval, review.previous_interval)
+        self.assertEqual(card.next_review_date, date.today() + timedelta(days=review.new_interval))
+
+    def test_fit_reduces_loss_and_switches_to_fsrs(self):
+        """拟合降低模拟数据的损失，复习数足够的用户改用FSRS"""
+        from django.test import override_settings
+        from django.utils import timezone
+        from apps.knowledge.models import Flashcard, FlashcardReview, SchedulerParameters
+        from apps.knowledge.services.fsrs_optimizer import (
+            ReviewHistory, SchedulerParameterJob, fit_weights, synthetic_sequences
+        )
+        from apps.knowledge.services.spaced_repetition import FSRSScheduler, get_scheduler
+
+        _, before, after = fit_weights(ReviewHistory.build(synthetic_sequences(4, cards=30, reviews=6)), 15)
+        self.assertLess(after.mean(), before.mean())
+
+        start = timezone.now() - timedelta(days=60)
+        for index in range(6):
+            card = Flashcard.objects.create(user=self.user, front=f'问题{index}', back='答案',
+                                            next_review_date=date.today())
+            for step, rating in enumerate((4, 4, 2, 5)):
+                review = FlashcardReview.objects.create(
+                    user=self.user, flashcard=card, rating=rating, review_time=5, previous_interval=1,
+                    previous_ease_factor=2.5, new_interval=1, new_ease_factor=2.5
+                )
+                FlashcardReview.objects.filter(pk=review.pk).update(created_at=start + timedelta(days=step * 4))
+
+        with override_settings(FSRS_MIN_REVIEWS=10):
+            self.assertEqual(SchedulerParameterJob.fit_batch([self.user.pk], iterations=5), 1)
+
+        parameters = SchedulerParameters.objects.get(user=self.user)
+        self.assertEqual((parameters.algorithm, parameters.review_count, len(parameters.weights)), ('fsrs', 18, 17))
+        self.assertIsInstance(get_scheduler(self.user), FSRSScheduler)
+
+
+class StatisticsTest(BaseAPITestCase):
+    """仪表盘统计测试"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_dashboards_cached_and_invalidated_on_write(self):
+        """统计按用户缓存，数据变化后重新聚合"""
+        from apps.knowledge.models import Note
+        from apps.study.models import Vocabulary
+
+        service = FlashcardService(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            service.create_flashcard(front='问题', back='答案', deck='数学')
+            Note.objects.create(user=self.user, title='笔记', content='内容', is_bookmarked=True)
+            Vocabulary.objects.create(user=self.user, word='lemma', category='academic', mastery_level=2)
+            Vocabulary.objects.create(user=self.user, word='proof', category='academic', mastery_level=4)
+
+        response = self.client.get('/api/knowledge/statistics/overview/')
+        self.assertEqual(response.data['notes'], {'total': 1, 'bookmarked': 1, 'public': 0})
+        self.assertEqual(response.data['flashcards'], {'total': 1, 'due': 1})
+        with self.assertNumQueries(0):
+            self.client.get('/api/knowledge/statistics/overview/')
+            progress = service.get_learning_progress()
+        self.assertEqual(progress['mastery_distribution']['level_0'], 1)
+
+        url = '/api/study/vocabulary/stats/'
+        stats = self.client.get(url).data
+        self.assertEqual(stats['words_by_category'], {'academic': 2})
+        self.assertEqual(stats['words_by_mastery_level'], {'1': 0, '2': 1, '3': 0, '4': 1, '5': 0})
+        self.assertEqual((stats['words_due_for_review'], stats['new_words_this_week']), (1, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Note.objects.create(user=self.user, title='笔记2', content='内容', is_public=True)
+            Vocabulary.objects.create(user=self.user, word='axiom', category='general')
+        response = self.client.get('/api/knowledge/statistics/overview/')
+        self.assertEqual(response.data['notes'], {'total': 2, 'bookmarked': 1, 'public': 1})
+        self.assertEqual(self.client.get(url).data['total_words'], 3)
+
+
+class NoteHistoryTest(BaseAPITestCase):
+    """笔记历史增量存储测试"""
+
+    def setUp(self):
+        super().setUp()
+        from apps.knowledge.models import Note
+
+        self.lines = [f'第{i}行 ' + 'x' * 40 for i in range(400)]
+        self.note = Note.objects.create(user=self.user, title='长笔记', content='\n'.join(self.lines))
+
+    def _edit(self, index, text):
+        self.lines[index] = text
+        self.note.content = '\n'.join(self.lines)
+        self.note.save()
+        return self.note.content
+
+    def test_edits_stored_as_deltas_and_reconstructed(self):
+        """快照之后只保存差异，历史接口重建每个版本"""
+        from django.db import connection
+        from django.test import override_settings
+        from django.test.utils import CaptureQueriesContext
+        from apps.knowledge.models import NoteHistory
+
+        versions = []
+        with override_settings(NOTE_HISTORY_COALESCE_SECONDS=0, NOTE_HISTORY_SNAPSHOT_INTERVAL=3):
+            for index in range(4):
+                with CaptureQueriesContext(connection) as queries:
+                    versions.append(self._edit(index * 10, f'修改{index}'))
+                # 上一版本取自内存，不重新查询笔记
+                self.assertFalse(any('FROM "knowledge_notes"' in query['sql'] for query in queries))
+
+        entries = list(NoteHistory.objects.filter(note=self.note).order_by('version'))
+        self.assertEqual([entry.is_snapshot for entry in entries], [True, False, False, True])
+        self.assertLess(len(entries[1].content_delta), 200)
+
+        response = self.client.get(f'/api/knowledge/notes/{self.note.id}/history/')
+        results = response.data['results']
+        self.assertEqual([item['content'] for item in results], versions[::-1])
+        self.assertTrue(results[0]['changes']['content_changed'])
+        self.assertFalse(results[0]['changes']['title_changed'])
+
+    def test_autosave_coalesced_into_one_entry(self):
+        """合并窗口内的连续保存并入最近一条记录"""
+        from django.test import override_settings
+        from apps.knowledge.models import NoteHistory
+
+        with override_settings(NOTE_HISTORY_COALESCE_SECONDS=0):
+            self._edit(0, '第一次')
+            self._edit(1, '第二次')
+        self.note.title = '新标题'
+        self.note.save()
+        latest = self._edit(2, '第三次')
+
+        entries = list(NoteHistory.objects.filter(note=self.note).order_by('version'))
+        self.assertEqual([(entry.version, entry.is_snapshot) for entry in entries], [(1, True), (2, False)])
+        self.assertEqual(entries[1].get_content(), latest)
+        self.assertEqual(entries[1].change_summary, '修改了标题, 内容')
+
+    def test_concurrent_saves_get_distinct_versions(self):
+        """两次保存读到同一最新版本时，后写入的一方以下一个版本号重试"""
+        from unittest.mock import patch
+        from django.test import override_settings
+        from apps.knowledge.models import Note, NoteHistory
+
+        other = Note.objects.get(pk=self.note.pk)
+        with override_settings(NOTE_HISTORY_COALESCE_SECONDS=0):
+            self._edit(0, '第一次')
+            stale = [NoteHistory.objects.get(note=self.note, version=1)]
+            self._edit(1, '第二次')
+
+            # other读取最新记录时仍是版本1（另一次保存的版本2尚未提交时读到的状态）
+            latest = NoteHistory._latest
+            other.content = other.content.replace('第5行', '并发修改')
+            with patch.object(NoteHistory, '_latest', side_effect=lambda note: stale.pop() if stale else latest(note)):
+                other.save()
+
+        entries = list(NoteHistory.objects.filter(note=self.note).order_by('version'))
+        self.assertEqual([entry.version for entry in entries], [1, 2, 3])
+        self.assertEqual(entries[2].get_content(), other.content)
+
+
+class ConceptGraphStoreTest(BaseAPITestCase):
+    """概念图快照缓存测试"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        from apps.knowledge.models import Concept
+        from apps.knowledge.services.graph_store import ConceptGraphStore
+
+        cache.clear()
+        ConceptGraphStore.clear_local()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a, self.b, self.c = [
+                Concept.objects.create(user=self.user, name=name, concept_type='definition', description=name)
+                for name in ('极限', '导数', '积分')
+            ]
+
+    def relate(self, source, target, relation_type='prerequisite'):
+        from apps.knowledge.models import ConceptRelation
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return ConceptRelation.objects.create(
+                source_concept=source, target_concept=target, relation_type=relation_type
+            )
+
+    def test_deltas_update_cached_snapshot(self):
+        """关系和概念的变化增量应用到快照，读取时不查询数据库"""
+        from apps.knowledge.services.graph import ConceptGraph
+        from apps.knowledge.services.graph_store import ConceptGraphStore
+
+        ConceptGraph(self.user)  # 构建并缓存快照
+        self.relate(self.a, self.b)
+        self.relate(self.b, self.c)
+
+        with self.assertNumQueries(0):
+            graph = ConceptGraph(self.user)
+            self.assertEqual(graph.get_concept_dependencies(str(self.b.id)), [str(self.a.id)])
+            self.assertEqual(graph.get_learning_sequence(str(self.c.id)), [str(self.a.id), str(self.b.id), str(self.c.id)])
+            self.assertEqual(graph.calculate_graph_statistics()['number_of_components'], 1)
+
+        # 增量应用在副本上，已取得的快照不被修改
+        before = ConceptGraphStore.get(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.b.delete()
+        self.assertEqual((before.node_count, before.edge_count), (3, 2))
+
+        with self.assertNumQueries(0):
+            stats = ConceptGraph(self.user).calculate_graph_statistics()
+        self.assertEqual((stats['total_concepts'], stats['total_relations']), (2, 0))
+
+    def test_writes_log_deltas_without_rewriting_snapshot(self):
+        """写入只记录增量，缓存中的完整快照不随每次写入重写；其他进程读取时补齐增量"""
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from apps.knowledge.services.graph_store import ConceptGraphStore
+
+        before = ConceptGraphStore.get(self.user)
+        with patch.object(ConceptGraphStore, '_store') as store:
+            self.relate(self.a, self.b)
+            self.relate(self.b, self.c)
+            store.assert_not_called()
+        self.assertEqual(cache.get(ConceptGraphStore._snapshot_key(str(self.user.pk))).version, before.version)
+
+        ConceptGraphStore.clear_local()  # 模拟其他进程
+        with self.assertNumQueries(0):
+            snapshot = ConceptGraphStore.get(self.user)
+        self.assertEqual(snapshot.version, before.version + 2)
+        self.assertEqual((snapshot.node_count, snapshot.edge_count), (3, 2))
+
+    def test_centrality_served_from_side_table(self):
+        """中心性按图版本计算一次，与networkx一致，之后单概念查询只读侧表"""
+        import networkx as nx
+        from apps.knowledge.services.graph import ConceptGraph
+
+        self.relate(self.a, self.b)
+        self.relate(self.b, self.c)
+        self.relate(self.c, self.a, 'related')
+
+        graph = ConceptGraph(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            measures = graph.get_centrality_measures(str(self.b.id))
+        self.assertTrue(measures['stale'])
+
+        with self.assertNumQueries(1):
+            measures = graph.get_centrality_measures(str(self.b.id))
+        self.assertFalse(measures['stale'])
+        self.assertAlmostEqual(measures['betweenness'], nx.betweenness_centrality(graph.graph)[str(self.b.id)])
+        self.assertAlmostEqual(measures['closeness'], nx.closeness_centrality(graph.graph)[str(self.b.id)])
+        self.assertEqual(measures['total_degree'], 2)
+
+    def test_recommendations_use_snapshot_mastery(self):
+        """推荐和学习缺口只读取快照中的掌握状态"""
+        from apps.knowledge.services.graph import RecommendationEngine
+
+        self.relate(self.a, self.c)
+        self.relate(self.b, self.c)
+        self.relate(self.c, self.b, 'extends')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.is_mastered = True
+            self.a.save()
+            self.c.importance = 4.0
+            self.c.save()
+
+        RecommendationEngine(self.user)  # 构建并缓存快照
+        with self.assertNumQueries(0):
+            result = RecommendationEngine(self.user).recommend(str(self.c.id))
+
+        self.assertEqual(result['next_concepts'], [str(self.b.id)])
+        self.assertEqual(result['learning_gaps'], {str(self.c.id): [str(self.b.id)]})
+        self.assertEqual(result['concept_clusters'], [])
+
+    def test_subgraph_endpoint_limits_and_streams(self):
+        """子图接口按节点数和关系类型限制，支持字段投影和NDJSON流式输出"""
+        import json
+
+        self.relate(self.a, self.b)
+        self.relate(self.b, self.c, 'related')
+        url = '/api/knowledge/graph/concept_graph/'
+
+        data = self.client.get(url, {'concept_id': str(self.a.id), 'max_nodes': 2}).data
+        self.assertEqual([node['id'] for node in data['nodes']], [str(self.a.id), str(self.b.id)])
+        self.assertEqual(len(data['links']), 1)
+        self.assertTrue(data['truncated'])
+        # 默认返回完整字段，前端图谱展示描述
+        self.assertIn('description', data['nodes'][0])
+
+        data = self.client.get(url, {'concept_id': str(self.b.id), 'relation_types': 'prerequisite', 'fields': 'ids'}).data
+        self.assertEqual(data['nodes'], [{'id': str(self.b.id)}, {'id': str(self.a.id)}])
+        self.assertFalse(data['truncated'])
+
+        response = self.client.get(url, {'stream': 'true', 'fields': 'basic'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(lines[0], {'type': 'meta', 'concept_id': None, 'truncated': False, 'node_count': 3, 'edge_count': 2})
+        self.assertEqual(sorted(line['name'] for line in lines if line['type'] == 'node'), ['导数', '极限', '积分'])
+        self.assertEqual(sum(line['type'] == 'link' for line in lines), 2)
+        self.assertNotIn('description', lines[1])
+
+    def test_retriever_related_concepts_queries_per_level(self):
+        """概念关系图按层查询，边按反向等价去重"""
+        from apps.knowledge.services.retriever import HybridRetriever
+
+        self.relate(self.a, self.b)
+        self.relate(self.b, self.c, 'related')
+        self.relate(self.c, self.a, 'extends')
+        retriever = HybridRetriever(user_id=self.user.id)
+
+        with self.assertNumQueries(4):
+            graph = retriever.get_related_concepts(str(self.a.id), depth=1)
+
+        self.assertEqual(graph.nodes[0].id, str(self.a.id))
+        self.assertEqual({node.id: node.level for node in graph.nodes}, {
+            str(self.a.id): 0, str(self.b.id): 1, str(self.c.id): 1
+        })
+        self.assertEqual(graph.total_edges, 3)
+        self.assertEqual(retriever.get_related_concepts(str(self.a.id), depth=2).total_edges, 3)
@@ -1,10 +1,13 @@
+import json
+from itertools import chain
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.db.models import Prefetch, Q, Count
-from django.utils import timezone
 from core.pagination import StandardPagination
 from core.cache import CacheService
 
@@ -13,8 +16,11 @@ from apps.knowledge.models import (
     FlashcardReview, StudySession
 )
 from apps.knowledge.services.retriever import HybridRetriever
+from apps.knowledge.services.review_queue import FLASHCARD, ReviewQueue
 from apps.knowledge.services.spaced_repetition import FlashcardService, StudySessionManager
+from apps.knowledge.services.statistics import flashcard_deck_totals, knowledge_overview
 from apps.knowledge.services.graph import ConceptGraph, RecommendationEngine
+from apps.knowledge.services.graph_store import RELATION_CODES
 from .serializers import (
     ConceptSerializer,
     ConceptRelationSerializer,
@@ -25,6 +31,7 @@ from .serializers import (
     FlashcardReviewSerializer,
     StudySessionSerializer,
     FlashcardReviewActionSerializer,
+    FlashcardBatchReviewSerializer,
     GraphDataSerializer,
     RecommendationSerializer,
     ConceptSearchResultSerializer,
@@ -419,13 +426,14 @@ class NoteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        history = NoteHistory.objects.filter(note=note).order_by('-edited_at')
+        # 只取本页记录，内容从快照和差异批量重建
+        history = NoteHistory.objects.filter(note=note).select_related('user').order_by('-version')
         page = self.paginate_queryset(history)
         if page is not None:
-            serializer = NoteHistorySerializer(page, many=True)
+            serializer = NoteHistorySerializer(NoteHistory.attach_contents(page), many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = NoteHistorySerializer(history, many=True)
+        serializer = NoteHistorySerializer(NoteHistory.attach_contents(history), many=True)
         return Response(serializer.data)
 
 
@@ -454,22 +462,18 @@ class FlashcardViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def due(self, request):
-        """获取到期复习的卡片"""
-        from django.utils import timezone
+        """获取到期复习的卡片（按复习队列的到期顺序）"""
+        deck = request.query_params.get('deck')
+        card_ids = ReviewQueue.due_entries(request.user.pk, FLASHCARD, deck).values_list('object_id', flat=True)
 
-        today = timezone.now().date()
-        due_cards = Flashcard.objects.filter(
-            user=request.user,
-            is_active=True,
-            next_review_date__lte=today
-        ).order_by('next_review_date')
+        page = self.paginate_queryset(card_ids)
+        card_ids = list(card_ids if page is None else page)
+        cards = Flashcard.objects.select_related('document', 'chunk').in_bulk(card_ids)
+        due_cards = [cards[card_id] for card_id in card_ids if card_id in cards]
 
-        page = self.paginate_queryset(due_cards)
+        serializer = self.get_serializer(due_cards, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(due_cards, many=True)
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
@@ -497,30 +501,31 @@ class FlashcardViewSet(viewsets.ModelViewSet):
             'review_id': review.id
         })
 
+    @action(detail=False, methods=['post'])
+    def batch_review(self, request):
+        """批量提交复习（一次学习或离线同步），逐项返回结果"""
+        serializer = FlashcardBatchReviewSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        flashcard_service = FlashcardService(request.user)
+        results = flashcard_service.review_cards(serializer.validated_data['reviews'])
+        applied = sum(1 for result in results if result['status'] == 'applied')
+
+        return Response({
+            'applied': applied,
+            'conflicts': len(results) - applied,
+            'results': results,
+        })
+
     @action(detail=False, methods=['get'])
     def decks(self, request):
         """获取卡组列表"""
-        flashcard_service = FlashcardService(request.user)
-        decks = flashcard_service.get_deck_list()
-
         deck_stats = {}
-        for deck in decks:
-            cards_count = Flashcard.objects.filter(
-                user=request.user,
-                deck=deck,
-                is_active=True
-            ).count()
-
-            due_count = Flashcard.objects.filter(
-                user=request.user,
-                deck=deck,
-                is_active=True,
-                next_review_date__lte=timezone.now().date()
-            ).count()
-
+        for deck, cards_count in flashcard_deck_totals(request.user.pk).items():
             deck_stats[deck] = {
                 'total_cards': cards_count,
-                'due_cards': due_count
+                'due_cards': ReviewQueue.due_count(request.user.pk, FLASHCARD, deck)
             }
 
         return Response(deck_stats)
@@ -529,14 +534,8 @@ class FlashcardViewSet(viewsets.ModelViewSet):
     def statistics(self, request):
         """获取学习统计"""
         flashcard_service = FlashcardService(request.user)
-        stats = flashcard_service.scheduler.get_statistics()
-
-        deck = request.query_params.get('deck')
-        if deck:
-            deck_stats = flashcard_service.scheduler.get_statistics(deck)
-            return Response(deck_stats)
-
-        return Response(stats)
+        deck = request.query_params.get('deck') or None
+        return Response(flashcard_service.scheduler.get_statistics(deck))
 
     @action(detail=False, methods=['post'])
     def batch_create(self, request):
@@ -715,26 +714,51 @@ class GraphViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def concept_graph(self, request):
-        """获取概念关系图"""
+        """
+        获取概念关系图
+
+        指定concept_id时按深度、节点数和关系类型限制返回子图，否则返回全图；
+        fields控制字段投影，stream=true时以NDJSON逐行返回（首行为元信息）。
+        """
         serializer = GraphDataSerializer(data=request.query_params)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        params = serializer.validated_data
         concept_graph = ConceptGraph(request.user)
-        concept_id = serializer.validated_data.get('concept_id')
-        max_depth = serializer.validated_data.get('max_depth', 2)
+        concept_id = params.get('concept_id')
+        relation_types = params.get('relation_types')
 
+        nodes = edges = None
+        meta = {'concept_id': str(concept_id) if concept_id else None, 'truncated': False}
         if concept_id:
             # 获取特定概念的子图
-            subgraph = concept_graph.get_subgraph(str(concept_id), max_depth)
-            graph_data = {
-                'nodes': [],
-                'links': []
-            }
-        else:
-            # 获取全图
-            graph_data = concept_graph.export_graph_data('d3')
+            nodes, edges, meta['truncated'] = concept_graph.select_subgraph(
+                str(concept_id), params['max_depth'], params['max_nodes'], relation_types
+            )
+        elif relation_types:
+            codes = {RELATION_CODES[relation_type] for relation_type in relation_types}
+            snapshot = concept_graph.snapshot
+            edges = [edge for edge in snapshot.edges() if snapshot.relation[edge] in codes]
+
+        if params['stream']:
+            snapshot = concept_graph.snapshot
+            meta.update(
+                node_count=snapshot.node_count if nodes is None else len(nodes),
+                edge_count=(snapshot.edge_count if edges is None else len(edges)),
+            )
+            lines = chain(
+                [{'type': 'meta', **meta}],
+                ({'type': kind, **data} for kind, data in concept_graph.iter_graph_items(nodes, edges, params['fields']))
+            )
+            return StreamingHttpResponse(
+                (json.dumps(line, ensure_ascii=False) + '\n' for line in lines),
+                content_type='application/x-ndjson'
+            )
 
+        graph_data = concept_graph.export_graph_data('d3', params['fields'], nodes, edges)
+        if concept_id:
+            graph_data['truncated'] = meta['truncated']
         return Response(graph_data)
 
     @action(detail=False, methods=['get'])
@@ -745,6 +769,20 @@ class GraphViewSet(viewsets.ViewSet):
 
         return Response(stats)
 
+    @action(detail=False, methods=['get'])
+    def centrality(self, request):
+        """获取概念的中心性指标"""
+        concept_id = request.query_params.get('concept_id')
+        if not concept_id:
+            return Response({'error': 'concept_id参数必需'}, status=status.HTTP_400_BAD_REQUEST)
+
+        concept_graph = ConceptGraph(request.user)
+        measures = concept_graph.get_centrality_measures(concept_id)
+        if not measures:
+            return Response({'error': '概念不存在'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({'concept_id': concept_id, **measures})
+
     @action(detail=False, methods=['get'])
     def learning_path(self, request):
         """获取学习路径推荐"""
@@ -768,21 +806,11 @@ class GraphViewSet(viewsets.ViewSet):
             return Response({'error': 'current_concept_id参数必需'}, status=status.HTTP_400_BAD_REQUEST)
 
         recommendation_engine = RecommendationEngine(request.user)
-
-        # 获取下一个学习概念
-        next_concepts = recommendation_engine.recommend_next_concepts(current_concept_id)
-
-        # 获取概念簇推荐
-        concept_clusters = recommendation_engine.recommend_concept_clusters()
-
-        # 获取学习缺口分析
-        learning_gaps = recommendation_engine.analyze_learning_gaps()
+        recommendations = recommendation_engine.recommend(current_concept_id)
 
         return Response({
             'current_concept_id': current_concept_id,
-            'next_concepts': next_concepts,
-            'concept_clusters': concept_clusters,
-            'learning_gaps': learning_gaps
+            **recommendations
         })
 
 
@@ -792,43 +820,18 @@ class StatisticsViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def overview(self, request):
-        """获取知识库总览统计"""
+        """获取知识库总览统计（每个模型一次条件聚合，按用户缓存）"""
         user = request.user
-
-        # 概念统计
-        concept_stats = {
-            'total': Concept.objects.filter(user=user).count(),
-            'mastered': Concept.objects.filter(user=user, is_mastered=True).count(),
-            'verified': Concept.objects.filter(user=user, is_verified=True).count(),
-        }
-
-        # 笔记统计
-        note_stats = {
-            'total': Note.objects.filter(user=user).count(),
-            'bookmarked': Note.objects.filter(user=user, is_bookmarked=True).count(),
-            'public': Note.objects.filter(user=user, is_public=True).count(),
-        }
-
-        # 卡片统计
-        flashcard_stats = {
-            'total': Flashcard.objects.filter(user=user, is_active=True).count(),
-            'due': Flashcard.objects.filter(
-                user=user,
-                is_active=True,
-                next_review_date__lte=timezone.now().date()
-            ).count(),
-        }
-
-        # 高亮统计
-        highlight_stats = {
-            'total': Highlight.objects.filter(user=user).count(),
-        }
+        overview = knowledge_overview(user.pk)
 
         return Response({
-            'concepts': concept_stats,
-            'notes': note_stats,
-            'flashcards': flashcard_stats,
-            'highlights': highlight_stats,
+            'concepts': overview['concepts'],
+            'notes': overview['notes'],
+            'flashcards': {
+                'total': overview['flashcards']['total'],
+                'due': ReviewQueue.due_count(user.pk, FLASHCARD),
+            },
+            'highlights': overview['highlights'],
         })
 
     @action(detail=False, methods=['get'])
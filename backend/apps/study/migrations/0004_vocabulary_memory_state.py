@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('study', '0003_vocabulary_primary_language_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vocabulary',
+            name='memory_difficulty',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vocabulary',
+            name='next_review_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vocabulary',
+            name='stability',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -311,6 +311,9 @@ class Vocabulary(models.Model):
     )
     review_count = models.IntegerField(default=0)  # 复习次数
     last_reviewed_at = models.DateTimeField(null=True, blank=True)
+    stability = models.FloatField(null=True, blank=True)  # 记忆稳定性（天，FSRS）
+    memory_difficulty = models.FloatField(null=True, blank=True)  # 记忆难度 1-10（FSRS）
+    next_review_date = models.DateField(null=True, blank=True)  # 下次复习日期（FSRS调度）
     is_favorite = models.BooleanField(default=False)  # 是否收藏
 
     # 分类标签
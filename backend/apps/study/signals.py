@@ -0,0 +1,82 @@
+"""
+学习模块信号处理器
+按生词的保存和删除维护复习队列和统计缓存，并向知识库注册生词的队列和复习历史来源
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from apps.knowledge.models import ReviewQueueEntry
+from apps.knowledge.services.fsrs import grade_from_vocabulary_review
+from apps.knowledge.services.fsrs_optimizer import SchedulerParameterJob
+from apps.knowledge.services.review_queue import VOCABULARY, ReviewQueue, day_start
+from apps.knowledge.services.statistics import StatisticsCache
+from apps.study.models import Vocabulary, VocabularyReview
+
+# 从未复习过的生词排在同优先级的最前面
+NEVER_REVIEWED = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def vocabulary_rank(review_count: int, mastery_level: int) -> int:
+    """生词的出队优先级：复习次数少的优先，其次掌握程度低的优先（掌握程度为1-5）"""
+    return review_count * 10 + mastery_level
+
+
+def vocabulary_due_at(next_review_date, last_reviewed_at) -> datetime:
+    """生词的到期时间：FSRS排期的生词在排期当天到期，其余全部视为到期（按上次复习时间排序）"""
+    if next_review_date:
+        return day_start(next_review_date)
+    return last_reviewed_at or NEVER_REVIEWED
+
+
+def vocabulary_entries(user_id=None):
+    """生词的队列条目，按优先级和到期时间出队"""
+    queryset = Vocabulary.objects.all()
+    if user_id:
+        queryset = queryset.filter(user_id=user_id)
+    rows = queryset.values_list(
+        'id', 'user_id', 'review_count', 'mastery_level', 'last_reviewed_at', 'next_review_date'
+    )
+    for word_id, owner_id, review_count, mastery_level, last_reviewed_at, next_review_date in rows.iterator(
+        chunk_size=2000
+    ):
+        yield ReviewQueueEntry(
+            user_id=owner_id, item_type=VOCABULARY, object_id=word_id,
+            due_at=vocabulary_due_at(next_review_date, last_reviewed_at),
+            rank=vocabulary_rank(review_count, mastery_level)
+        )
+
+
+def vocabulary_history(user_ids):
+    """生词复习历史（用于拟合FSRS参数）"""
+    rows = VocabularyReview.objects.filter(user_id__in=user_ids).order_by(
+        'user_id', 'vocabulary_id', 'created_at'
+    ).values_list('user_id', 'vocabulary_id', 'is_correct', 'difficulty_rating', 'created_at')
+    for user_id, vocabulary_id, is_correct, difficulty_rating, created_at in rows.iterator(chunk_size=5000):
+        yield user_id, (VOCABULARY, vocabulary_id), grade_from_vocabulary_review(is_correct, difficulty_rating), created_at
+
+
+ReviewQueue.register_source(VOCABULARY, vocabulary_entries)
+SchedulerParameterJob.register_source(vocabulary_history)
+
+
+@receiver(post_save, sender=Vocabulary)
+def update_review_queue_on_vocabulary_save(sender, instance, **kwargs):
+    """生词新增或复习后更新复习队列"""
+    ReviewQueue.sync(
+        VOCABULARY, instance.user_id, instance.pk,
+        vocabulary_due_at(instance.next_review_date, instance.last_reviewed_at),
+        rank=vocabulary_rank(instance.review_count, instance.mastery_level)
+    )
+
+
+@receiver(post_delete, sender=Vocabulary)
+def update_review_queue_on_vocabulary_delete(sender, instance, **kwargs):
+    """删除生词的队列条目"""
+    ReviewQueue.remove(VOCABULARY, instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Vocabulary)
+@receiver([post_save, post_delete], sender=VocabularyReview)
+def invalidate_vocabulary_statistics(sender, instance, **kwargs):
+    """生词或复习记录变化时作废用户的统计缓存"""
+    StatisticsCache.invalidate(instance.user_id)
@@ -15,6 +15,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+from apps.knowledge.services.review_queue import VOCABULARY, ReviewQueue
+from apps.knowledge.services.spaced_repetition import get_scheduler
+from apps.knowledge.services.statistics import StatisticsCache
 from .models import Vocabulary, VocabularyReview, VocabularyList, VocabularyListMembership
 from .vocabulary_serializers import (
     VocabularySerializer, VocabularyCreateSerializer,
@@ -635,6 +638,14 @@ def review_vocabulary(request, pk):
     if serializer.is_valid():
         review = serializer.save()
 
+        # 更新记忆状态（FSRS调度时同时排期）
+        result = get_scheduler(request.user).schedule_vocabulary(
+            vocabulary, review.is_correct, review.difficulty_rating
+        )
+        vocabulary.stability = result.memory.stability
+        vocabulary.memory_difficulty = result.memory.difficulty
+        vocabulary.next_review_date = result.next_review_date
+
         # 更新生词信息
         vocabulary.review_count += 1
         vocabulary.last_reviewed_at = timezone.now()
@@ -656,15 +667,9 @@ def review_vocabulary(request, pk):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def next_review_word(request):
-    """获取下一个需要复习的单词"""
-    # 优先选择复习次数少、掌握程度低的单词
-    vocabulary = Vocabulary.objects.filter(
-        user=request.user
-    ).order_by(
-        'review_count',
-        'mastery_level',
-        'last_reviewed_at'
-    ).first()
+    """获取下一个需要复习的单词（复习队列队首：复习次数少、掌握程度低的优先）"""
+    word_id = ReviewQueue.head(request.user.pk, VOCABULARY)
+    vocabulary = Vocabulary.objects.filter(pk=word_id, user=request.user).first() if word_id else None
 
     if vocabulary:
         serializer = VocabularySerializer(vocabulary)
@@ -910,78 +915,59 @@ def remove_word_from_list(request, pk):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def vocabulary_stats(request):
-    """获取生词统计数据"""
-    from datetime import datetime, timedelta
+    """获取生词统计数据（生词和复习记录各一次分组聚合，按用户缓存）"""
+    from datetime import timedelta
     from django.utils import timezone
 
-    # 获取当前用户的生词统计
-    vocabularies = Vocabulary.objects.filter(user=request.user)
-
-    # 基础统计
-    total_words = vocabularies.count()
-
-    # 按类别分组统计
-    words_by_category = {}
-    for vocab in vocabularies:
-        category = vocab.category or '未分类'
-        words_by_category[category] = words_by_category.get(category, 0) + 1
-
-    # 按掌握程度分组统计
-    words_by_mastery_level = {}
-    for level in range(1, 6):
-        words_by_mastery_level[str(level)] = vocabularies.filter(mastery_level=level).count()
-
-    # 今日复习统计
+    user_id = request.user.pk
     today = timezone.now().date()
-    today_reviews = VocabularyReview.objects.filter(
-        vocabulary__user=request.user,
-        created_at__date=today
-    ).count()
-
-    # 待复习单词数（简化逻辑：掌握程度低于3的单词）
-    words_due_for_review = vocabularies.filter(mastery_level__lt=3).count()
 
-    # 本周新增单词数
-    week_ago = timezone.now() - timedelta(days=7)
-    new_words_this_week = vocabularies.filter(created_at__gte=week_ago).count()
-
-    # 学习连续天数（简化计算）
-    # 这里可以根据实际需要实现更复杂的连续学习天数计算
-    learning_streak = 0
+    def compute():
+        # 按类别分组，同时条件统计各掌握程度、待复习和本周新增
+        week_ago = timezone.now() - timedelta(days=7)
+        rows = list(Vocabulary.objects.filter(user_id=user_id).values('category').annotate(
+            total=Count('id'),
+            due=Count('id', filter=Q(mastery_level__lt=3)),  # 简化逻辑：掌握程度低于3的单词
+            new_this_week=Count('id', filter=Q(created_at__gte=week_ago)),
+            **{f'level_{level}': Count('id', filter=Q(mastery_level=level)) for level in range(1, 6)},
+        ).order_by())
+
+        words_by_category = {}
+        for row in rows:
+            category = row['category'] or '未分类'
+            words_by_category[category] = words_by_category.get(category, 0) + row['total']
+
+        # 最近30个有复习的日期及当天复习数
+        review_days = list(
+            VocabularyReview.objects.filter(user_id=user_id).values('created_at__date').annotate(
+                count=Count('id')
+            ).order_by('-created_at__date')[:30]
+        )
 
-    # 尝试计算连续学习天数
-    try:
-        # 获取用户最近的复习记录日期
-        recent_review_dates = VocabularyReview.objects.filter(
-            vocabulary__user=request.user
-        ).values_list('created_at__date', flat=True).distinct().order_by('-created_at__date')[:30]
-
-        if recent_review_dates:
-            current_streak = 0
-            check_date = timezone.now().date()
-
-            for review_date in recent_review_dates:
-                if review_date == check_date:
-                    current_streak += 1
-                    check_date -= timedelta(days=1)
-                elif review_date < check_date:
-                    break
-
-            learning_streak = current_streak
-    except Exception as e:
-        logger.warning(f"计算学习连续天数失败: {e}")
+        # 学习连续天数：从今天起连续有复习的天数
         learning_streak = 0
-
-    stats = {
-        'total_words': total_words,
-        'words_by_category': words_by_category,
-        'words_by_mastery_level': words_by_mastery_level,
-        'reviews_today': today_reviews,
-        'words_due_for_review': words_due_for_review,
-        'new_words_this_week': new_words_this_week,
-        'learning_streak': learning_streak,
-    }
-
+        check_date = today
+        for day in review_days:
+            if day['created_at__date'] != check_date:
+                break
+            learning_streak += 1
+            check_date -= timedelta(days=1)
+
+        return {
+            'total_words': sum(row['total'] for row in rows),
+            'words_by_category': words_by_category,
+            'words_by_mastery_level': {
+                str(level): sum(row[f'level_{level}'] for row in rows) for level in range(1, 6)
+            },
+            'reviews_today': next(
+                (day['count'] for day in review_days if day['created_at__date'] == today), 0
+            ),
+            'words_due_for_review': sum(row['due'] for row in rows),
+            'new_words_this_week': sum(row['new_this_week'] for row in rows),
+            'learning_streak': learning_streak,
+        }
+
+    stats = StatisticsCache.get_or_compute(user_id, f'vocabulary:{today.isoformat()}', compute)
     return Response(stats)
 
 
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 import os
 from pathlib import Path
 import environ
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -235,6 +236,18 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # 每晚重建复习队列
+    'rebuild-review-queues': {
+        'task': 'apps.knowledge.tasks.rebuild_review_queues',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    # 每晚拟合用户的FSRS参数
+    'fit-scheduler-parameters': {
+        'task': 'apps.knowledge.tasks.fit_scheduler_parameters',
+        'schedule': crontab(hour=4, minute=0),
+    },
+}
 
 # Channels Configuration
 CHANNEL_LAYERS = {
@@ -376,6 +389,57 @@ DEEPSEEK_API_KEY = env('DEEPSEEK_API_KEY', default='')
 DEEPSEEK_BASE_URL = env('DEEPSEEK_BASE_URL', default='https://api.deepseek.com')
 DEEPSEEK_DEFAULT_MODEL = env('DEEPSEEK_DEFAULT_MODEL', default='deepseek-chat')
 
+# LLM client connection pool, retries and per-model rate limits
+LLM_MAX_CONNECTIONS = env.int('LLM_MAX_CONNECTIONS', default=20)
+LLM_MAX_KEEPALIVE_CONNECTIONS = env.int('LLM_MAX_KEEPALIVE_CONNECTIONS', default=10)
+LLM_TIMEOUT = env.float('LLM_TIMEOUT', default=120.0)  # 秒
+LLM_MAX_RETRIES = env.int('LLM_MAX_RETRIES', default=3)
+LLM_DEFAULT_RATE_LIMIT = {'rate': 5.0, 'burst': 10}  # 每秒请求数 / 突发容量
+LLM_RATE_LIMITS = {
+    # 'deepseek-reasoner': {'rate': 2.0, 'burst': 4},
+}
+
+# LLM priority lanes: interactive chat preempts background indexing and batch jobs
+LLM_MAX_CONCURRENCY = env.int('LLM_MAX_CONCURRENCY', default=16)
+LLM_LANES = {
+    'interactive': {'weight': 8, 'max_concurrency': 16},
+    'background': {'weight': 2, 'max_concurrency': 6},
+    'batch': {'weight': 1, 'max_concurrency': 2},
+}
+
+# Agent model routing: fast tier for simple turns and background summaries,
+# strong tier for multi-step reasoning; invalid JSON escalates to the next tier
+AGENT_MODEL_TIERS = {
+    'fast': env('AGENT_FAST_MODEL', default=DEEPSEEK_DEFAULT_MODEL),
+    'strong': env('AGENT_STRONG_MODEL', default=DEEPSEEK_DEFAULT_MODEL),
+}
+AGENT_MODEL_ESCALATION = env.bool('AGENT_MODEL_ESCALATION', default=True)
+
+# Agent batch runs: global cap on concurrently executing jobs across workers
+AGENT_BATCH_MAX_CONCURRENCY = env.int('AGENT_BATCH_MAX_CONCURRENCY', default=4)
+AGENT_BATCH_RETRY_DELAY = env.int('AGENT_BATCH_RETRY_DELAY', default=5)  # 秒
+AGENT_BATCH_MAX_JOBS = env.int('AGENT_BATCH_MAX_JOBS', default=500)
+
+# Concept graph analytics: centralities are computed once per graph version; above the
+# exact threshold betweenness is approximated from k sampled pivot nodes
+GRAPH_CENTRALITY_PIVOTS = env.int('GRAPH_CENTRALITY_PIVOTS', default=256)
+GRAPH_CENTRALITY_EXACT_MAX_NODES = env.int('GRAPH_CENTRALITY_EXACT_MAX_NODES', default=2000)
+
+# Spaced repetition scheduling (sm2 / fsrs; users with fitted parameters use their own)
+SPACED_REPETITION_SCHEDULER = env('SPACED_REPETITION_SCHEDULER', default='sm2')
+FSRS_DESIRED_RETENTION = env.float('FSRS_DESIRED_RETENTION', default=0.9)
+FSRS_MAXIMUM_INTERVAL = env.int('FSRS_MAXIMUM_INTERVAL', default=365)  # 天
+FSRS_MIN_REVIEWS = env.int('FSRS_MIN_REVIEWS', default=50)  # 拟合参数所需的最少复习数
+
+# Note history: edits within the window are merged into one entry; every N versions a full
+# snapshot is stored, versions in between keep only a compressed diff
+NOTE_HISTORY_COALESCE_SECONDS = env.int('NOTE_HISTORY_COALESCE_SECONDS', default=60)
+NOTE_HISTORY_SNAPSHOT_INTERVAL = env.int('NOTE_HISTORY_SNAPSHOT_INTERVAL', default=20)
+
+# Token usage accounting (buffered, flushed in batches)
+TOKEN_USAGE_FLUSH_INTERVAL = env.float('TOKEN_USAGE_FLUSH_INTERVAL', default=5.0)  # 秒
+TOKEN_USAGE_MAX_PENDING = env.int('TOKEN_USAGE_MAX_PENDING', default=500)
+
 # Google OAuth Configuration
 GOOGLE_OAUTH2_CLIENT_ID = env('GOOGLE_OAUTH2_CLIENT_ID', default='')
 GOOGLE_OAUTH2_CLIENT_SECRET = env('GOOGLE_OAUTH2_CLIENT_SECRET', default='')
@@ -30,4 +30,14 @@ PASSWORD_HASHERS = [
 ]
 
 # Test LLM key
-DEEPSEEK_API_KEY = 'test-key'
\ No newline at end of file
+DEEPSEEK_API_KEY = 'test-key'
+
+# Token usage buffer is flushed manually in tests
+TOKEN_USAGE_AUTO_FLUSH = False
+
+# Channel layer
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
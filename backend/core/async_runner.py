@@ -0,0 +1,107 @@
+"""
+共享异步运行时：每个进程一个常驻事件循环线程，供同步代码（Celery任务、同步工具）调用协程。
+事件循环不再按调用创建和关闭，全局AsyncOpenAI客户端的httpx连接池因此可以跨任务保持
+keep-alive和TLS会话复用。
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRunner:
+    """
+    后台事件循环线程
+
+    协程通过 run_coroutine_threadsafe 提交到常驻循环，调用方阻塞等待结果。
+    进程fork后（如Celery prefork worker）线程不会被继承，首次使用时按PID重新启动。
+    """
+
+    THREAD_NAME = 'async-runner'
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """启动（或在fork后重启）事件循环线程"""
+        if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return self._loop
+
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                thread = threading.Thread(target=run_loop, name=self.THREAD_NAME, daemon=True)
+                thread.start()
+                ready.wait()
+                self._loop, self._thread, self._pid = loop, thread, os.getpid()
+        return self._loop
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """运行时的事件循环"""
+        return self._ensure_started()
+
+    def in_runner_thread(self) -> bool:
+        """当前是否在运行时线程中"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        在共享事件循环中执行协程并等待结果
+
+        Args:
+            coro: 协程
+            timeout: 超时时间（秒），超时后取消协程并抛出 TimeoutError
+
+        Raises:
+            RuntimeError: 在运行时线程内调用（会死锁）
+        """
+        if self.in_runner_thread():
+            coro.close()
+            raise RuntimeError('AsyncRunner.run() cannot be called from the runner thread')
+
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def shutdown(self, timeout: float = 5.0):
+        """停止事件循环线程"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = self._pid = None
+        if loop is None or not thread.is_alive():
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not loop.is_running():
+            loop.close()
+
+
+_global_runner = AsyncRunner()
+
+
+def get_async_runner() -> AsyncRunner:
+    """获取进程内的共享异步运行时"""
+    return _global_runner
+
+
+def run_async(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """在共享事件循环中执行协程（同步→异步桥接的统一入口）"""
+    return _global_runner.run(coro, timeout)
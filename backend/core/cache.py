@@ -30,6 +30,16 @@ class CacheService:
         """设置缓存"""
         cache.set(key, value, timeout)
 
+    @classmethod
+    async def aget(cls, key: str) -> Any:
+        """异步获取缓存"""
+        return await cache.aget(key)
+
+    @classmethod
+    async def aset(cls, key: str, value: Any, timeout: int = MEDIUM) -> None:
+        """异步设置缓存"""
+        await cache.aset(key, value, timeout)
+
     @classmethod
     def delete(cls, key: str) -> None:
         """删除缓存"""
@@ -2,15 +2,251 @@
 DeepSeek API客户端，支持多个模型（deepseek-chat, deepseek-reasoner）和可配置端点。
 """
 import os
+import json
+import time
+import random
+import asyncio
+import hashlib
 import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any, Union, List
-from openai import OpenAI, AsyncOpenAI
+import httpx
+from openai import (
+    OpenAI, AsyncOpenAI,
+    APIConnectionError, APIStatusError, RateLimitError,
+)
 from openai.types.chat import ChatCompletion
 from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序序列的分位数（最近秩法），空序列返回0"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class TokenBucket:
+    """
+    令牌桶限流器（预约式）。
+
+    每次请求预约一个令牌：令牌不足时计算需要等待的时间并在锁外休眠，
+    等待者按到达顺序依次放行。状态由线程锁保护，可在多个事件循环间共享。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0 or self.rate <= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回实际等待的秒数"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class LLMClientMetrics:
+    """LLM客户端运行指标：排队深度、等待时间、重试和请求合并次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.failures = 0
+            self.retries = 0
+            self.coalesced = 0
+            self.in_flight = 0
+            self.queue_depth = 0
+            self.max_queue_depth = 0
+            self.wait_count = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def incr(self, field: str, delta: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def enter_queue(self):
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def leave_queue(self, waited: float):
+        with self._lock:
+            self.queue_depth -= 1
+            if waited > 0:
+                self.wait_count += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'failures': self.failures,
+                'retries': self.retries,
+                'coalesced': self.coalesced,
+                'in_flight': self.in_flight,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'wait_count': self.wait_count,
+                'total_wait_seconds': round(self.total_wait, 3),
+                'avg_wait_seconds': round(self.total_wait / self.wait_count, 3) if self.wait_count else 0.0,
+                'max_wait_seconds': round(self.max_wait, 3),
+            }
+
+
+class LaneScheduler:
+    """
+    LLM请求优先级调度器（加权公平排队）。
+
+    请求按通道（lane）排队：interactive（交互式对话）、background（文档索引、会话压缩）、
+    batch（批量任务）。全局并发和每个通道的并发都有上限；有空闲名额时，
+    从有等待者且未达上限的通道中选择虚拟时间最小的通道放行，
+    每放行一次该通道虚拟时间增加1/weight，因此权重高的通道获得更多名额，
+    但低权重通道不会被完全饿死。状态由线程锁保护，可跨事件循环使用。
+    """
+
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+    BATCH = "batch"
+
+    DEFAULT_LANES = {
+        INTERACTIVE: {"weight": 8, "max_concurrency": 16},
+        BACKGROUND: {"weight": 2, "max_concurrency": 6},
+        BATCH: {"weight": 1, "max_concurrency": 2},
+    }
+    DEFAULT_MAX_CONCURRENCY = 16
+
+    def __init__(self, lanes: Optional[Dict[str, Dict[str, Any]]] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._lock = threading.Lock()
+        self._active = 0
+        self._vclock = 0.0
+        self._lanes: Dict[str, Dict[str, Any]] = {}
+        for name, config in (lanes or self.DEFAULT_LANES).items():
+            self._lanes[name] = {
+                "weight": float(config.get("weight", 1)),
+                "max_concurrency": max(1, int(config.get("max_concurrency", self.max_concurrency))),
+                "active": 0,
+                "vtime": 0.0,
+                "waiters": deque(),
+                "granted": 0,
+                "recent_waits": deque(maxlen=1000),
+            }
+
+    def _lane(self, name: str) -> Dict[str, Any]:
+        lane = self._lanes.get(name)
+        if lane is None:
+            raise ValueError(f"Unknown LLM lane: {name}")
+        return lane
+
+    @asynccontextmanager
+    async def slot(self, lane_name: str):
+        """占用指定通道的一个并发名额"""
+        lane = self._lane(lane_name)
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        started = time.monotonic()
+
+        with self._lock:
+            if not lane["waiters"]:
+                # 通道从空闲变为积压时对齐到全局虚拟时钟，避免用积攒的"额度"抢占
+                lane["vtime"] = max(lane["vtime"], self._vclock)
+            lane["waiters"].append(waiter)
+            self._dispatch_locked()
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in lane["waiters"]:
+                    lane["waiters"].remove(waiter)
+                    granted = False
+                else:
+                    granted = True
+            if granted:
+                self._release(lane)
+            raise
+
+        with self._lock:
+            lane["recent_waits"].append(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def _release(self, lane: Dict[str, Any]):
+        with self._lock:
+            lane["active"] -= 1
+            self._active -= 1
+            self._dispatch_locked()
+
+    def _dispatch_locked(self):
+        """在持有锁时放行等待者，直到没有空闲名额或没有可放行的通道"""
+        while self._active < self.max_concurrency:
+            candidates = [
+                lane for lane in self._lanes.values()
+                if lane["waiters"] and lane["active"] < lane["max_concurrency"]
+            ]
+            if not candidates:
+                return
+            lane = min(candidates, key=lambda item: item["vtime"])
+            loop, future = lane["waiters"].popleft()
+            lane["active"] += 1
+            lane["granted"] += 1
+            self._active += 1
+            self._vclock = lane["vtime"]
+            lane["vtime"] += 1.0 / lane["weight"]
+            loop.call_soon_threadsafe(self._grant, future)
+
+    @staticmethod
+    def _grant(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各通道的排队数、执行数和等待时间分位数"""
+        with self._lock:
+            result = {}
+            for name, lane in self._lanes.items():
+                waits = sorted(lane["recent_waits"])
+                result[name] = {
+                    "weight": lane["weight"],
+                    "max_concurrency": lane["max_concurrency"],
+                    "queued": len(lane["waiters"]),
+                    "active": lane["active"],
+                    "granted": lane["granted"],
+                    "wait_p50_seconds": round(percentile(waits, 0.5), 3),
+                    "wait_p95_seconds": round(percentile(waits, 0.95), 3),
+                }
+            return result
+
+
 class DeepSeekClient:
     """DeepSeek API客户端，封装OpenAI SDK"""
 
@@ -19,12 +255,29 @@ class DeepSeekClient:
     DEFAULT_MAX_TOKENS = 2000
     DEFAULT_TEMPERATURE = 0.7
 
+    # 连接池与重试默认值
+    DEFAULT_MAX_CONNECTIONS = 20
+    DEFAULT_MAX_KEEPALIVE = 10
+    DEFAULT_TIMEOUT = 120.0
+    DEFAULT_MAX_RETRIES = 3
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 20.0
+    DEFAULT_RATE_LIMIT = {"rate": 5.0, "burst": 10}  # 每个模型每秒请求数/突发容量
+
     def __init__(
         self,
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
         default_model: Optional[str] = None,
         async_client: bool = True,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        rate_limits: Optional[Dict[str, Dict[str, float]]] = None,
+        default_rate_limit: Optional[Dict[str, float]] = None,
+        lanes: Optional[Dict[str, Dict[str, Any]]] = None,
+        max_concurrency: int = LaneScheduler.DEFAULT_MAX_CONCURRENCY,
     ):
         """
         初始化DeepSeek客户端。
@@ -34,6 +287,14 @@ class DeepSeekClient:
             base_url: API基础URL，如果为None则使用默认值
             default_model: 默认模型名称
             async_client: 是否使用异步客户端（默认True）
+            max_connections: httpx连接池最大连接数
+            max_keepalive_connections: 保持活跃的最大空闲连接数
+            timeout: 单次请求超时（秒）
+            max_retries: 429/5xx/连接错误的最大重试次数
+            rate_limits: 按模型配置的限流参数，如{"deepseek-chat": {"rate": 5, "burst": 10}}
+            default_rate_limit: 未单独配置的模型使用的限流参数
+            lanes: 优先级通道配置，如{"interactive": {"weight": 8, "max_concurrency": 16}}
+            max_concurrency: 所有通道合计的最大并发请求数
         """
         self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY")
         if not self.api_key:
@@ -42,17 +303,36 @@ class DeepSeekClient:
         self.base_url = base_url or self.DEFAULT_BASE_URL
         self.default_model = default_model or self.DEFAULT_MODEL
         self.async_client = async_client
-
-        # 初始化客户端
+        self.max_retries = max_retries
+
+        self.rate_limits = rate_limits or {}
+        self.default_rate_limit = default_rate_limit or self.DEFAULT_RATE_LIMIT
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.metrics = LLMClientMetrics()
+        self.scheduler = LaneScheduler(lanes, max_concurrency)
+
+        # 初始化客户端（重试由本类负责，SDK内置重试关闭）
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
         if async_client:
             self.client = AsyncOpenAI(
                 api_key=self.api_key,
                 base_url=self.base_url,
+                max_retries=0,
+                timeout=timeout,
+                http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
             )
         else:
             self.client = OpenAI(
                 api_key=self.api_key,
                 base_url=self.base_url,
+                max_retries=0,
+                timeout=timeout,
+                http_client=httpx.Client(limits=limits, timeout=timeout),
             )
 
     def is_configured(self) -> bool:
@@ -68,6 +348,140 @@ class DeepSeekClient:
             'async_client': self.async_client
         }
 
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取运行指标（排队深度、等待时间、重试、合并、各通道状态，进程内统计）"""
+        metrics = self.metrics.snapshot()
+        metrics['lanes'] = self.scheduler.snapshot()
+        return metrics
+
+    def _get_bucket(self, model: str) -> TokenBucket:
+        """获取模型对应的限流器"""
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            with self._buckets_lock:
+                bucket = self._buckets.get(model)
+                if bucket is None:
+                    config = self.rate_limits.get(model, self.default_rate_limit)
+                    bucket = TokenBucket(config.get("rate", 5.0), config.get("burst", 10))
+                    self._buckets[model] = bucket
+        return bucket
+
+    async def _throttle(self, model: str) -> float:
+        """按模型限流，记录排队深度和等待时间"""
+        self.metrics.enter_queue()
+        waited = 0.0
+        try:
+            waited = await self._get_bucket(model).acquire()
+        finally:
+            self.metrics.leave_queue(waited)
+        return waited
+
+    @staticmethod
+    def _request_fingerprint(params: Dict[str, Any]) -> str:
+        """请求指纹（规范化JSON的SHA-256），用于合并相同的并发请求"""
+        data = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """429、5xx和连接/超时错误可以重试"""
+        if isinstance(error, (RateLimitError, APIConnectionError)):
+            return True
+        if isinstance(error, APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """带抖动的指数退避；服务端返回Retry-After时至少等待该时长"""
+        delay = random.uniform(0, min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * (2 ** attempt)))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(self.RETRY_MAX_DELAY, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    async def _create_completion(self, params: Dict[str, Any], lane: str) -> ChatCompletion:
+        """按优先级通道排队、限流并发送请求，遇到可重试错误时按退避策略重试（退避期间释放名额）"""
+        attempt = 0
+        while True:
+            async with self.scheduler.slot(lane):
+                await self._throttle(params["model"])
+                self.metrics.incr("in_flight")
+                try:
+                    if self.async_client:
+                        return await self.client.chat.completions.create(**params)
+                    return self.client.chat.completions.create(**params)
+                except Exception as e:
+                    if attempt >= self.max_retries or not self._is_retryable(e):
+                        raise
+                    error = e
+                finally:
+                    self.metrics.incr("in_flight", -1)
+
+            delay = self._retry_delay(attempt, error)
+            attempt += 1
+            self.metrics.incr("retries")
+            logger.warning(f"LLM请求失败，{delay:.2f}s后进行第{attempt}次重试: {error}")
+            await asyncio.sleep(delay)
+
+    async def _dispatch(self, params: Dict[str, Any], coalesce: bool = True,
+                        lane: str = LaneScheduler.INTERACTIVE) -> Dict[str, Any]:
+        """
+        执行请求；相同的并发请求合并为一次调用，共享同一个Future。
+
+        合并得到的结果不带usage（token只记到发起请求的调用方），并标记coalesced=True。
+        """
+        loop = asyncio.get_running_loop()
+        key = self._request_fingerprint(params) if coalesce else None
+
+        leader = self._inflight.get(key) if key else None
+        if leader is not None and leader.get_loop() is loop:
+            self.metrics.incr("coalesced")
+            try:
+                shared = dict(await asyncio.shield(leader))
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise
+                # 发起方被取消，自己重新请求
+            else:
+                shared.pop("usage", None)
+                shared["coalesced"] = True
+                return shared
+
+        future = loop.create_future()
+        if key:
+            self._inflight[key] = future
+        self.metrics.incr("requests")
+        try:
+            response = await self._create_completion(params, lane)
+            choice = response.choices[0]
+            result = {
+                "content": choice.message.content or "",
+                "model": response.model,
+                "usage": {
+                    "prompt_tokens": response.usage.prompt_tokens,
+                    "completion_tokens": response.usage.completion_tokens,
+                    "total_tokens": response.usage.total_tokens,
+                },
+                "finish_reason": choice.finish_reason,
+            }
+            future.set_result(dict(result))
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.metrics.incr("failures")
+            future.set_exception(e)
+            future.exception()  # 标记异常已读取，避免无人等待时告警
+            raise
+        finally:
+            if key and self._inflight.get(key) is future:
+                del self._inflight[key]
+
     async def generate(
         self,
         prompt: str,
@@ -77,6 +491,10 @@ class DeepSeekClient:
         max_tokens: int = DEFAULT_MAX_TOKENS,
         response_format: str = "text",
         use_cache: bool = True,
+        cacheable: Optional[bool] = None,
+        cache_namespace: str = "",
+        coalesce: bool = True,
+        lane: str = LaneScheduler.INTERACTIVE,
         **kwargs,
     ) -> Dict[str, Any]:
         """
@@ -89,6 +507,11 @@ class DeepSeekClient:
             temperature: 温度（0-2）
             max_tokens: 最大生成token数
             response_format: 期望的响应格式，"text"或"json_object"
+            use_cache: 是否启用缓存（总开关）
+            cacheable: 显式声明调用是否可缓存；为None时仅缓存确定性温度的调用
+            cache_namespace: 缓存命名空间，通常由提示模板哈希生成
+            coalesce: 是否与相同的并发请求合并
+            lane: 优先级通道（interactive/background/batch）
             **kwargs: 其他传递给OpenAI API的参数
 
         Returns:
@@ -105,19 +528,20 @@ class DeepSeekClient:
         """
         model = model or self.default_model
 
-        # 检查缓存
+        # 检查缓存（只缓存确定性或显式声明可缓存的调用）
+        from .llm_cache import LLMCache
+        use_cache = use_cache and LLMCache.is_cacheable(temperature, cacheable)
+        cache_params = {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_format": response_format,
+            "system_prompt": system_prompt,
+            **kwargs
+        }
         if use_cache:
-            from .llm_cache import LLMCache
-            cache_params = {
-                "model": model,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "response_format": response_format,
-                "system_prompt": system_prompt,
-                **kwargs
-            }
-            cached_response = LLMCache.get(prompt, cache_params)
-            if cached_response:
+            cached_response = LLMCache.get(prompt, cache_params, namespace=cache_namespace)
+            if cached_response is not None:
                 return {"content": cached_response, "cached": True}
 
         messages = []
@@ -138,37 +562,13 @@ class DeepSeekClient:
             params["response_format"] = {"type": "json_object"}
 
         try:
-            if self.async_client:
-                response: ChatCompletion = await self.client.chat.completions.create(**params)
-            else:
-                response: ChatCompletion = self.client.chat.completions.create(**params)
-
-            choice = response.choices[0]
-            result = {
-                "content": choice.message.content or "",
-                "model": response.model,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens,
-                },
-                "finish_reason": choice.finish_reason,
-            }
+            result = await self._dispatch(params, coalesce=coalesce, lane=lane)
 
-            # 缓存响应
-            if use_cache and result.get("content"):
-                from .llm_cache import LLMCache
-                cache_params = {
-                    "model": model,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                    "response_format": response_format,
-                    "system_prompt": system_prompt,
-                    **kwargs
-                }
-                LLMCache.set(prompt, result["content"], cache_params)
+            # 缓存响应（被截断的输出不缓存）
+            if use_cache and result.get("content") and result["finish_reason"] != "length":
+                LLMCache.set(prompt, result["content"], cache_params, namespace=cache_namespace)
 
-            logger.debug(f"LLM调用成功，模型={model}，token使用={result['usage']}")
+            logger.debug(f"LLM调用成功，模型={model}，token使用={result.get('usage')}")
             return result
 
         except Exception as e:
@@ -191,7 +591,7 @@ class DeepSeekClient:
             同generate，但response_format固定为"json_object"
 
         Returns:
-            解析后的JSON字典
+            解析后的JSON字典；非缓存响应会附带"usage"字段（token使用情况）
 
         Raises:
             ValueError: 如果响应不是有效的JSON
@@ -207,10 +607,13 @@ class DeepSeekClient:
         )
         import json
         try:
-            return json.loads(result["content"])
+            data = json.loads(result["content"])
         except json.JSONDecodeError as e:
             logger.error(f"无法解析LLM返回的JSON: {result['content']}")
             raise ValueError(f"Invalid JSON response: {e}")
+        if isinstance(data, dict) and "usage" in result:
+            data.setdefault("usage", result["usage"])
+        return data
 
     async def generate_stream(self, prompt: str, **kwargs):
         """
@@ -224,6 +627,7 @@ class DeepSeekClient:
             每个chunk的内容
         """
         model = kwargs.pop("model", self.default_model)
+        lane = kwargs.pop("lane", LaneScheduler.INTERACTIVE)
         messages = [{"role": "user", "content": prompt}]
         if "system_prompt" in kwargs:
             messages.insert(0, {"role": "system", "content": kwargs.pop("system_prompt")})
@@ -235,16 +639,18 @@ class DeepSeekClient:
             **kwargs,
         }
 
-        if self.async_client:
-            stream = await self.client.chat.completions.create(**params)
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-        else:
-            stream = self.client.chat.completions.create(**params)
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+        async with self.scheduler.slot(lane):
+            await self._throttle(model)
+            if self.async_client:
+                stream = await self.client.chat.completions.create(**params)
+                async for chunk in stream:
+                    if chunk.choices[0].delta.content is not None:
+                        yield chunk.choices[0].delta.content
+            else:
+                stream = self.client.chat.completions.create(**params)
+                for chunk in stream:
+                    if chunk.choices[0].delta.content is not None:
+                        yield chunk.choices[0].delta.content
 
 
 # 全局单例客户端实例（懒加载）
@@ -266,6 +672,14 @@ def get_llm_client() -> DeepSeekClient:
             base_url=base_url,
             default_model=default_model,
             async_client=True,
+            max_connections=getattr(settings, "LLM_MAX_CONNECTIONS", DeepSeekClient.DEFAULT_MAX_CONNECTIONS),
+            max_keepalive_connections=getattr(settings, "LLM_MAX_KEEPALIVE_CONNECTIONS", DeepSeekClient.DEFAULT_MAX_KEEPALIVE),
+            timeout=getattr(settings, "LLM_TIMEOUT", DeepSeekClient.DEFAULT_TIMEOUT),
+            max_retries=getattr(settings, "LLM_MAX_RETRIES", DeepSeekClient.DEFAULT_MAX_RETRIES),
+            rate_limits=getattr(settings, "LLM_RATE_LIMITS", None),
+            default_rate_limit=getattr(settings, "LLM_DEFAULT_RATE_LIMIT", None),
+            lanes=getattr(settings, "LLM_LANES", None),
+            max_concurrency=getattr(settings, "LLM_MAX_CONCURRENCY", LaneScheduler.DEFAULT_MAX_CONCURRENCY),
         )
     return _global_client
 
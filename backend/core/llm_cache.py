@@ -1,27 +1,147 @@
+"""
+LLM响应缓存：规范化缓存键、可缓存策略、压缩存储和命中统计。
+"""
 import hashlib
+import json
+import logging
+import zlib
+from typing import Any, Dict, Optional
+
+from django.core.cache import cache
+
 from core.cache import CacheService
 
+logger = logging.getLogger(__name__)
+
 
 class LLMCache:
     """LLM响应缓存"""
 
     CACHE_TIMEOUT = 86400  # 24小时
+    KEY_VERSION = 2  # 键格式版本，格式变化时递增使旧缓存失效
+    DETERMINISTIC_TEMPERATURE = 0.0  # 温度不高于该值视为确定性调用
+    COMPRESS_MIN_BYTES = 256  # 小于该大小的响应不压缩
+
+    STATS_PREFIX = 'llm_cache:stats'
+    STATS_FIELDS = ('hits', 'misses', 'sets', 'bytes_saved')
+
+    # 存储格式标记
+    _RAW = b'r'
+    _ZLIB = b'z'
+
+    @classmethod
+    def _make_key(cls, prompt: str, params: dict, namespace: str = '') -> str:
+        """
+        生成缓存键。
+
+        使用规范化JSON（键排序、紧凑分隔符）序列化参数，保证参数顺序不影响键；
+        使用完整的SHA-256摘要避免截断带来的碰撞。
+        """
+        data = json.dumps(
+            {'prompt': prompt, 'params': params},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(',', ':'),
+            default=str,
+        )
+        hash_val = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        return f'llm:v{cls.KEY_VERSION}:{namespace or "default"}:{hash_val}'
+
+    @staticmethod
+    def template_namespace(*templates: str) -> str:
+        """
+        根据提示模板内容生成命名空间。
+
+        模板一旦修改，命名空间随之变化，旧模板产生的缓存自然失效。
+        """
+        digest = hashlib.sha256('\x00'.join(templates).encode('utf-8')).hexdigest()
+        return f'tpl-{digest[:12]}'
+
+    @classmethod
+    def is_cacheable(cls, temperature: float, cacheable: Optional[bool] = None) -> bool:
+        """
+        判断一次调用是否允许缓存。
+
+        Args:
+            temperature: 调用温度
+            cacheable: 调用方显式声明（True/False）；为None时按温度判断
+
+        Returns:
+            只有显式声明可缓存，或温度为确定性温度时返回True
+        """
+        if cacheable is not None:
+            return cacheable
+        try:
+            return float(temperature) <= cls.DETERMINISTIC_TEMPERATURE
+        except (TypeError, ValueError):
+            return False
 
     @classmethod
-    def _make_key(cls, prompt: str, params: dict) -> str:
-        """生成缓存键"""
-        data = f'{prompt}:{params}'
-        hash_val = hashlib.sha256(data.encode()).hexdigest()[:16]
-        return f'llm:{hash_val}'
+    def _encode(cls, response: str) -> bytes:
+        """编码响应，超过阈值时使用zlib压缩"""
+        raw = response.encode('utf-8')
+        if len(raw) >= cls.COMPRESS_MIN_BYTES:
+            compressed = zlib.compress(raw, 6)
+            if len(compressed) < len(raw):
+                return cls._ZLIB + compressed
+        return cls._RAW + raw
 
     @classmethod
-    def get(cls, prompt: str, params: dict = None) -> str:
+    def _decode(cls, payload: Any) -> Optional[str]:
+        """解码缓存内容，无法识别时返回None"""
+        if not isinstance(payload, (bytes, bytearray)) or not payload:
+            return None
+        marker, body = bytes(payload[:1]), bytes(payload[1:])
+        try:
+            if marker == cls._ZLIB:
+                return zlib.decompress(body).decode('utf-8')
+            if marker == cls._RAW:
+                return body.decode('utf-8')
+        except (zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"LLM缓存内容损坏: {e}")
+        return None
+
+    @classmethod
+    def get(cls, prompt: str, params: dict = None, namespace: str = '') -> Optional[str]:
         """获取缓存的响应"""
-        key = cls._make_key(prompt, params or {})
-        return CacheService.get(key)
+        key = cls._make_key(prompt, params or {}, namespace)
+        response = cls._decode(CacheService.get(key))
+        cls._incr('hits' if response is not None else 'misses')
+        return response
 
     @classmethod
-    def set(cls, prompt: str, response: str, params: dict = None) -> None:
+    def set(cls, prompt: str, response: str, params: dict = None,
+            namespace: str = '', timeout: int = None) -> None:
         """缓存响应"""
-        key = cls._make_key(prompt, params or {})
-        CacheService.set(key, response, cls.CACHE_TIMEOUT)
\ No newline at end of file
+        key = cls._make_key(prompt, params or {}, namespace)
+        payload = cls._encode(response)
+        CacheService.set(key, payload, timeout or cls.CACHE_TIMEOUT)
+        cls._incr('sets')
+        saved = len(response.encode('utf-8')) + 1 - len(payload)
+        if saved > 0:
+            cls._incr('bytes_saved', saved)
+
+    @classmethod
+    def _incr(cls, field: str, delta: int = 1) -> None:
+        """累加统计计数（跨进程共享，失败时忽略）"""
+        key = f'{cls.STATS_PREFIX}:{field}'
+        try:
+            if not cache.add(key, delta, None):
+                cache.incr(key, delta)
+        except Exception as e:
+            logger.debug(f"更新LLM缓存统计失败: {e}")
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """获取命中、未命中、写入次数和压缩节省的字节数"""
+        keys = {f'{cls.STATS_PREFIX}:{field}': field for field in cls.STATS_FIELDS}
+        values = cache.get_many(list(keys))
+        stats = {field: int(values.get(key, 0)) for key, field in keys.items()}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        """重置统计计数"""
+        cache.delete_many([f'{cls.STATS_PREFIX}:{field}' for field in cls.STATS_FIELDS])
@@ -1,4 +1,13 @@
-from rest_framework.pagination import CursorPagination, PageNumberPagination
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardPagination(PageNumberPagination):
@@ -18,4 +27,102 @@ class CursorPaginationByCreated(CursorPagination):
 class CursorPaginationByUpdated(CursorPagination):
     """基于更新时间的游标分页"""
     page_size = 20
-    ordering = '-updated_at'
\ No newline at end of file
+    ordering = '-updated_at'
+
+
+class KeysetPagination(BasePagination):
+    """
+    基于 (created_at, id) 的键集分页
+
+    游标编码最后一条记录的排序键，翻页只需一次范围查询，不随页数变慢，
+    也不会因新记录插入而重复或遗漏。默认从新到旧；since参数用于增量获取更新的记录。
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+
+    def __init__(self):
+        self.next_cursor = None
+        self.has_more = False
+        self.request = None
+
+    @staticmethod
+    def encode_cursor(instance) -> str:
+        """记录的排序键编码为不透明游标"""
+        data = json.dumps([instance.created_at.isoformat(), str(instance.pk)])
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """解码游标，返回 (created_at, pk)"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            value = parse_datetime(created_at)
+            if value is None:
+                raise ValueError(created_at)
+            return value, pk
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound('Invalid cursor.')
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def is_incremental(self, request) -> bool:
+        """是否为增量获取（since）"""
+        return self.since_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        cursor：返回比游标更旧的一页（新到旧）
+        since：返回比游标更新的记录（旧到新），客户端用最后一条的游标继续增量获取
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        if self.is_incremental(request):
+            since = request.query_params.get(self.since_query_param)
+            if since:
+                created_at, pk = self.decode_cursor(since)
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                )
+            queryset = queryset.order_by('created_at', 'pk')
+        else:
+            cursor = request.query_params.get(self.cursor_query_param)
+            if cursor:
+                created_at, pk = self.decode_cursor(cursor)
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                )
+            queryset = queryset.order_by('-created_at', '-pk')
+
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+
+        if self.is_incremental(request):
+            # 增量获取总是返回续取游标（没有新记录时沿用原游标）
+            self.next_cursor = self.encode_cursor(page[-1]) if page else request.query_params.get(self.since_query_param)
+        else:
+            self.next_cursor = self.encode_cursor(page[-1]) if has_more else None
+        self.has_more = has_more
+        return page
+
+    def get_paginated_response(self, data):
+        param = self.since_query_param if self.is_incremental(self.request) else self.cursor_query_param
+        next_url = None
+        if self.next_cursor:
+            next_url = replace_query_param(self.request.build_absolute_uri(), param, self.next_cursor)
+        return Response({
+            'next': next_url,
+            'cursor': self.next_cursor,
+            'has_more': self.has_more,
+            'results': data,
+        })
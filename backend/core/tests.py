@@ -0,0 +1,207 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import httpx
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from openai import RateLimitError
+
+from core.async_runner import AsyncRunner
+from core.llm import DeepSeekClient, LaneScheduler, TokenBucket
+from core.llm_cache import LLMCache
+
+
+class LLMCacheTest(SimpleTestCase):
+    """LLM响应缓存测试"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_key_ignores_param_order(self):
+        """参数顺序不影响缓存键"""
+        key1 = LLMCache._make_key('hi', {'model': 'a', 'temperature': 0})
+        key2 = LLMCache._make_key('hi', {'temperature': 0, 'model': 'a'})
+
+        self.assertEqual(key1, key2)
+        self.assertEqual(len(key1.rsplit(':', 1)[1]), 64)
+
+    def test_namespace_changes_key(self):
+        """模板命名空间不同则缓存键不同"""
+        ns1 = LLMCache.template_namespace('模板 {content}')
+        ns2 = LLMCache.template_namespace('新模板 {content}')
+
+        self.assertNotEqual(ns1, ns2)
+        self.assertNotEqual(
+            LLMCache._make_key('hi', {}, ns1),
+            LLMCache._make_key('hi', {}, ns2),
+        )
+
+    def test_cacheability_policy(self):
+        """只缓存确定性温度或显式声明的调用"""
+        self.assertTrue(LLMCache.is_cacheable(0))
+        self.assertFalse(LLMCache.is_cacheable(0.7))
+        self.assertTrue(LLMCache.is_cacheable(0.7, cacheable=True))
+        self.assertFalse(LLMCache.is_cacheable(0, cacheable=False))
+
+    def test_compressed_roundtrip_and_stats(self):
+        """压缩存储可还原，并统计命中与节省字节"""
+        response = '{"summary": "导数"}' * 100
+
+        self.assertIsNone(LLMCache.get('p', {'t': 0}))
+        LLMCache.set('p', response, {'t': 0})
+        self.assertEqual(LLMCache.get('p', {'t': 0}), response)
+
+        stats = LLMCache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['sets'], 1)
+        self.assertGreater(stats['bytes_saved'], 0)
+
+
+def fake_completion(content='ok'):
+    """构造最小的ChatCompletion响应"""
+    return SimpleNamespace(
+        model='deepseek-chat',
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason='stop')],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+    )
+
+
+class DeepSeekClientTest(SimpleTestCase):
+    """LLM客户端限流、重试与请求合并测试"""
+
+    def make_client(self, create):
+        client = DeepSeekClient(api_key='test-key', default_rate_limit={'rate': 1000, 'burst': 100})
+        client.RETRY_BASE_DELAY = 0
+        client.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        return client
+
+    def test_token_bucket_waits_when_empty(self):
+        """令牌用尽后需要等待"""
+        bucket = TokenBucket(rate=10, burst=2)
+
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertGreater(bucket.reserve(), 0)
+
+    def test_identical_requests_are_coalesced(self):
+        """相同的并发请求只调用一次API"""
+        async def slow_create(**params):
+            await asyncio.sleep(0.01)
+            return fake_completion()
+
+        create = AsyncMock(side_effect=slow_create)
+        client = self.make_client(create)
+
+        async def run():
+            return await asyncio.gather(
+                client.generate('同一个问题', use_cache=False),
+                client.generate('同一个问题', use_cache=False),
+            )
+
+        first, second = asyncio.run(run())
+
+        self.assertEqual(create.await_count, 1)
+        self.assertEqual(first['content'], second['content'])
+        self.assertIn('usage', first)
+        self.assertNotIn('usage', second)
+        self.assertTrue(second['coalesced'])
+        self.assertEqual(client.get_metrics()['coalesced'], 1)
+
+    def test_retries_on_rate_limit(self):
+        """429错误后重试"""
+        request = httpx.Request('POST', 'https://api.deepseek.com/chat/completions')
+        rate_limited = RateLimitError(
+            'rate limited', response=httpx.Response(429, request=request), body=None
+        )
+        create = AsyncMock(side_effect=[rate_limited, fake_completion('retried')])
+        client = self.make_client(create)
+
+        result = asyncio.run(client.generate('hi', use_cache=False))
+
+        self.assertEqual(result['content'], 'retried')
+        self.assertEqual(create.await_count, 2)
+        self.assertEqual(client.get_metrics()['retries'], 1)
+
+
+class LaneSchedulerTest(SimpleTestCase):
+    """优先级通道调度测试"""
+
+    def test_interactive_preempts_background_backlog(self):
+        """名额释放后交互式请求先于积压的后台请求执行"""
+        scheduler = LaneScheduler(max_concurrency=1)
+        order = []
+
+        async def job(lane, name, hold=0.0):
+            async with scheduler.slot(lane):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        async def run():
+            first = asyncio.create_task(job(LaneScheduler.BACKGROUND, 'bg-0', hold=0.02))
+            await asyncio.sleep(0)
+            rest = [asyncio.create_task(job(LaneScheduler.BACKGROUND, f'bg-{i}')) for i in (1, 2)]
+            await asyncio.sleep(0)
+            rest.append(asyncio.create_task(job(LaneScheduler.INTERACTIVE, 'chat')))
+            await asyncio.gather(first, *rest)
+
+        asyncio.run(run())
+
+        self.assertEqual(order[:2], ['bg-0', 'chat'])
+        self.assertEqual(scheduler.snapshot()['background']['granted'], 3)
+
+    def test_lane_concurrency_cap(self):
+        """通道并发不超过上限"""
+        scheduler = LaneScheduler(
+            lanes={'batch': {'weight': 1, 'max_concurrency': 2}}, max_concurrency=8
+        )
+        running = []
+        peak = []
+
+        async def job():
+            async with scheduler.slot('batch'):
+                running.append(1)
+                peak.append(len(running))
+                await asyncio.sleep(0.005)
+                running.pop()
+
+        async def run():
+            await asyncio.gather(*(job() for _ in range(6)))
+
+        asyncio.run(run())
+
+        self.assertEqual(max(peak), 2)
+
+
+class AsyncRunnerTest(SimpleTestCase):
+    """共享异步运行时测试"""
+
+    def setUp(self):
+        self.runner = AsyncRunner()
+        self.addCleanup(self.runner.shutdown)
+
+    def test_reuses_one_loop_across_calls(self):
+        """多次调用在同一个常驻事件循环中执行"""
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = self.runner.run(current_loop())
+        second = self.runner.run(current_loop())
+        self.assertIs(first, second)
+        self.assertTrue(first.is_running())
+
+    def test_timeout_cancels_coroutine(self):
+        """超时后取消协程并抛出TimeoutError"""
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(TimeoutError):
+            self.runner.run(slow(), timeout=0.05)
+        self.runner.run(asyncio.wait_for(cancelled.wait(), 1))
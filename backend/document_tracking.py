@@ -10,6 +10,8 @@ from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
 import logging
 
+from core.async_runner import run_async
+
 logger = logging.getLogger(__name__)
 
 
@@ -322,10 +324,8 @@ def track_processing_step(step_id: str, status_callback=None):
                 raise
 
         def sync_wrapper(*args, **kwargs):
-            # 同步函数的包装器
-            import asyncio
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(async_wrapper(*args, **kwargs))
+            # 同步函数的包装器（在共享事件循环中执行）
+            return run_async(async_wrapper(*args, **kwargs))
 
         if asyncio.iscoroutinefunction(func):
             return async_wrapper
@@ -4,6 +4,7 @@ from datetime import timezone
 from celery import shared_task
 from django.conf import settings
 from django.core.files.storage import default_storage
+from core.async_runner import run_async
 from .models import Document, DocumentChunk, Formula
 from .document_tracking import get_tracker, ProcessingStatus, ProcessingStepContext
 from .parsers import MarkdownParser, LaTeXParser
@@ -23,19 +24,13 @@ def process_document_with_tracking(self, document_id: int):
         # 获取文档对象
         document = Document.objects.get(id=document_id)
 
-        # 异步执行处理（需要在事件循环中）
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(_process_document_async(document, tracker))
-        finally:
-            loop.close()
+        # 异步执行处理（在共享事件循环中）
+        run_async(_process_document_async(document, tracker))
 
     except Exception as e:
         logger.error(f"Error processing document {document_id}: {str(e)}")
         # 更新错误状态
-        asyncio.run(tracker.update_step("parse", ProcessingStatus.ERROR, details=str(e)))
+        run_async(tracker.update_step("parse", ProcessingStatus.ERROR, details=str(e)))
         document.status = 'error'
         document.save()
         raise
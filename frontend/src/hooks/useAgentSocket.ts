@@ -23,6 +23,10 @@ export function useAgentSocket(conversationId: string): UseAgentSocketReturn {
   // WebSocket引用 / WebSocket reference
   const wsRef = useRef<WebSocket | null>(null);
 
+  // 最后收到的运行事件，用于断线续传 / Last run event received, used to resume after reconnect
+  const lastEventRef = useRef<{ runId: string; seq: number } | null>(null);
+  const reconnectTimerRef = useRef<ReturnType<typeof setTimeout> | null>(null);
+
   // 订阅者列表 / Subscribers list
   const subscribersRef = useRef<Set<(event: WSEvent) => void>>(new Set());
 
@@ -49,7 +53,11 @@ export function useAgentSocket(conversationId: string): UseAgentSocketReturn {
 
     try {
       // 构建WebSocket URL / Build WebSocket URL
-      const wsUrl = `${import.meta.env.VITE_WS_URL || 'ws://localhost:8000'}/ws/agent/${conversationId}/?token=${tokens.access}`;
+      let wsUrl = `${import.meta.env.VITE_WS_URL || 'ws://localhost:8000'}/ws/agent/${conversationId}/?token=${tokens.access}`;
+      if (lastEventRef.current) {
+        // 从上次收到的序号继续 / Continue from the last received sequence
+        wsUrl += `&run_id=${lastEventRef.current.runId}&last_seq=${lastEventRef.current.seq}`;
+      }
 
       // 创建WebSocket连接 / Create WebSocket connection
       const ws = new WebSocket(wsUrl);
@@ -67,6 +75,11 @@ export function useAgentSocket(conversationId: string): UseAgentSocketReturn {
         try {
           const message: WSEvent = JSON.parse(event.data);
 
+          // 记录运行事件序号 / Track run event sequence
+          if (message.run_id && message.seq) {
+            lastEventRef.current = { runId: message.run_id, seq: message.seq };
+          }
+
           // 处理特殊事件 / Handle special events
           switch (message.type) {
             case 'connected':
@@ -106,6 +119,8 @@ export function useAgentSocket(conversationId: string): UseAgentSocketReturn {
 
         if (!event.wasClean) {
           setError(`连接意外关闭: ${event.code}`);
+          // 运行在服务端继续，重连后续传 / The run continues server-side; reconnect and resume
+          reconnectTimerRef.current = setTimeout(() => connect(), 1000);
         }
 
         console.log('WebSocket disconnected:', event.code, event.reason);
@@ -125,6 +140,10 @@ export function useAgentSocket(conversationId: string): UseAgentSocketReturn {
 
   // 断开连接 / Disconnect
   const disconnect = useCallback(() => {
+    if (reconnectTimerRef.current) {
+      clearTimeout(reconnectTimerRef.current);
+      reconnectTimerRef.current = null;
+    }
     if (wsRef.current) {
       wsRef.current.close(1000, 'Client disconnect');
       wsRef.current = null;
@@ -202,6 +221,11 @@ export function useAgentSocket(conversationId: string): UseAgentSocketReturn {
     };
   }, [disconnect]);
 
+  // 切换对话时清除续传位置 / Clear the resume position when switching conversations
+  useEffect(() => {
+    lastEventRef.current = null;
+  }, [conversationId]);
+
   // conversationId变化时重新连接 / Reconnect when conversationId changes
   useEffect(() => {
     if (conversationId && tokens?.access) {
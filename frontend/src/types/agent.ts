@@ -6,12 +6,14 @@
 export type WSMessageType =
   | 'query'      // 用户查询 / User query
   | 'cancel'     // 取消任务 / Cancel task
+  | 'resume'     // 续传运行事件 / Resume run events
   | 'set_document' // 设置文档 / Set document
   | 'ping';      // 心跳 / Ping
 
 // Agent响应事件类型 / Agent response event types
 export type AgentEventType =
   | 'connected'    // 连接建立 / Connection established
+  | 'run_started'  // 运行已启动 / Run started
   | 'state'        // 状态更新 / State update
   | 'plan'         // 执行计划 / Execution plan
   | 'thought'      // 思考过程 / Thinking process
@@ -44,11 +46,15 @@ export interface WSMessage {
   content?: string;
   context?: QueryContext;
   document_id?: string;
+  run_id?: string;
+  last_seq?: number;
 }
 
 export interface WSEvent {
   type: AgentEventType;
   data?: any;
+  run_id?: string;   // 所属运行 / Owning run
+  seq?: number;      // 运行内序号 / Sequence within the run
   message?: string;
   code?: string;
   timestamp?: string;